@@ -1,10 +1,25 @@
-from typing import Dict
 import json
+import os
 import re
+import threading
 from datetime import datetime
+from typing import Optional
 import telebot
 from telebot import types
-from config import DB_PATH, DEFAULT_MODELS
+from config import DB_PATH, DEFAULT_MODELS, PLANS, PROFILE_MAX_SECONDS
+from state_store import StateStore, create_state_store
+from bulk_grants import apply_grants, format_report, iter_document_lines
+from scheduler import format_jobs
+from messaging import edit_or_send
+from outbound import bulk as outbound_bulk
+
+ADMIN_STEPS = "admin_steps"
+
+BULK_GRANTS_PROMPT = (
+    "Send a CSV/TXT document (or paste text) with one grant per line:\n"
+    "user_id,credits,days\n\n"
+    "Empty credits/days mean 0. Credits are added, days set validity from now."
+)
 
 
 # -----------------------
@@ -27,7 +42,7 @@ def pretty_date(iso: str) -> str:
         return iso
 
 
-def _get_models_from_db(db):
+def get_models_from_db(db, default=DEFAULT_MODELS):
     raw = db.get_setting("models_json", "")
     if raw:
         try:
@@ -41,13 +56,99 @@ def _get_models_from_db(db):
                     return out
         except Exception:
             pass
-    return DEFAULT_MODELS
+    return default
 
 
-def _set_models_to_db(db, models):
+def set_models_to_db(db, models):
     db.set_setting("models_json", json.dumps(models, ensure_ascii=False))
 
 
+# -----------------------
+# shared by the threaded and the asyncio runtime (async_admin_panel.py)
+# -----------------------
+def format_users(users) -> str:
+    return "\n".join(
+        [f"{u['id']} @{u.get('username') or 'unknown'} | credits={u.get('credits') or 0}" for u in users]
+    ) or "No users"
+
+
+def format_premium_users(users) -> str:
+    lines = []
+    for u in users:
+        lines.append(
+            f"👤 User: {u['id']}\n"
+            f"💳 Credits: {u.get('credits') or 0}\n"
+            f"✅ Start: {pretty_date(u.get('validity_start_at'))}\n"
+            f"⏳ End: {pretty_date(u.get('validity_expire_at'))}\n"
+            f"----------------------"
+        )
+    return "\n".join(lines) or "No premium users"
+
+
+def valid_voice_id(voice_id: str) -> bool:
+    return len(voice_id or "") >= 10
+
+
+def parse_new_voice(raw: str):
+    """`<voice_id> | <voice_name>` -> (id, name); ValueError with the reply to send otherwise."""
+    raw = (raw or "").strip()
+    if "|" not in raw:
+        raise ValueError("❌ Use: <voice_id> | <voice_name>")
+    vid, vname = [x.strip() for x in raw.split("|", 1)]
+    if not valid_voice_id(vid):
+        raise ValueError("❌ Invalid voice id")
+    return vid, vname or vid
+
+
+def _rate(part: int, whole: int) -> str:
+    return f"{100.0 * part / whole:.1f}%" if whole else "n/a"
+
+
+def _mean_seconds(ms: int, count: int) -> str:
+    return f"{ms / count / 1000:.2f}s" if count else "n/a"
+
+
+def format_stats(stats: dict) -> str:
+    t, h = stats["totals"], stats["last_24h"]
+    today = next((d for d in stats["daily"] if d["bucket"] == stats["today"]), {})
+    lines = [
+        "📊 Stats",
+        f"👥 Users: {t.get('new_users') or 0} (+{today.get('new_users') or 0} today)",
+        f"⭐ Premium users: {t.get('premium_users') or 0}",
+        f"🎙 Voices: {t.get('voices') or 0} (today {today.get('voices') or 0}, 24h {h['voices']})",
+        f"💳 Credits sold: {t.get('credits_sold') or 0} (24h {h['credits_sold']})",
+        f"🔻 Credits consumed: {t.get('credits_consumed') or 0} (24h {h['credits_consumed']}), "
+        f"removed by admins: {t.get('credits_removed') or 0}",
+        f"❌ TTS error rate: {_rate(t.get('tts_errors') or 0, (t.get('tts_ok') or 0) + (t.get('tts_errors') or 0))} "
+        f"(24h {_rate(h['tts_errors'], h['tts_ok'] + h['tts_errors'])})",
+        f"⏱ Mean synthesis: {_mean_seconds(t.get('tts_ms') or 0, t.get('tts_ok') or 0)} "
+        f"(24h {_mean_seconds(h['tts_ms'], h['tts_ok'])})",
+    ]
+    if stats["daily"]:
+        lines += ["", "Voices per day (UTC):"]
+        lines += [f"{d['bucket']}: {d['voices']}" for d in stats["daily"]]
+    return "\n".join(lines)
+
+
+def _run_profile(bot, chat_id: int, seconds: int):
+    import io
+    import profiler  # only loaded when a run is requested
+
+    try:
+        summary, collapsed = profiler.run(seconds)
+    except Exception as e:
+        bot.send_message(chat_id, f"❌ Profiler: {e}")
+        return
+    bot.send_message(chat_id, f"<pre>{_escape(summary[:3900])}</pre>")
+    doc = io.BytesIO(collapsed)
+    doc.name = f"profile_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.collapsed.txt"
+    bot.send_document(chat_id, doc, caption="Collapsed stacks (flamegraph.pl / speedscope)")
+
+
+def _escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
 # -----------------------
 # KEYBOARDS
 # -----------------------
@@ -55,16 +156,33 @@ def build_admin_menu():
     kb = types.InlineKeyboardMarkup()
     kb.add(types.InlineKeyboardButton("Manage Credits", callback_data="admin:credits"))
     kb.add(types.InlineKeyboardButton("Manage Validity", callback_data="admin:validity"))
+    kb.add(types.InlineKeyboardButton("Bulk Grants (CSV)", callback_data="admin:bulk"))
     kb.add(types.InlineKeyboardButton("List Users", callback_data="admin:list_users"))
     kb.add(types.InlineKeyboardButton("List Premium Users", callback_data="admin:list_premium"))
+    kb.add(types.InlineKeyboardButton("Stats", callback_data="admin:stats"))
     kb.add(types.InlineKeyboardButton("Broadcast", callback_data="admin:broadcast"))
     kb.add(types.InlineKeyboardButton("Set Default Voice ID", callback_data="admin:default_voice"))
     kb.add(types.InlineKeyboardButton("Manage Voices", callback_data="admin:voices"))
     kb.add(types.InlineKeyboardButton("Download Data", callback_data="admin:download"))
+    kb.add(types.InlineKeyboardButton("Scheduled Jobs", callback_data="admin:jobs"))
+    kb.add(types.InlineKeyboardButton("Profile CPU", callback_data="admin:profile"))
     kb.add(types.InlineKeyboardButton("Manage Admins", callback_data="admin:admins"))
     return kb
 
 
+def build_back_keyboard():
+    kb = types.InlineKeyboardMarkup()
+    kb.add(types.InlineKeyboardButton("⬅ Back", callback_data="admin:menu"))
+    return kb
+
+
+def build_stats_keyboard():
+    kb = types.InlineKeyboardMarkup()
+    kb.add(types.InlineKeyboardButton("🔄 Refresh", callback_data="admin:stats"))
+    kb.add(types.InlineKeyboardButton("⬅ Back", callback_data="admin:menu"))
+    return kb
+
+
 def build_credit_action_keyboard(user_id: int):
     kb = types.InlineKeyboardMarkup()
     kb.add(types.InlineKeyboardButton("➕ Add Credits", callback_data=f"admin:credits:add:{user_id}"))
@@ -73,10 +191,15 @@ def build_credit_action_keyboard(user_id: int):
     return kb
 
 
-def build_validity_action_keyboard(user_id: int):
+def build_validity_action_keyboard(user_id: int, plans=None):
     kb = types.InlineKeyboardMarkup()
     kb.add(types.InlineKeyboardButton("✅ Set Validity", callback_data=f"admin:validity:set:{user_id}"))
     kb.add(types.InlineKeyboardButton("❌ Remove Validity", callback_data=f"admin:validity:remove:{user_id}"))
+    # plan only selects the encoding profile; credits/validity are granted separately
+    for idx, p in enumerate(plans or []):
+        kb.add(types.InlineKeyboardButton(f"📦 Plan: {p['name']}", callback_data=f"admin:validity:plan:{user_id}:{idx}"))
+    if plans:
+        kb.add(types.InlineKeyboardButton("📦 No Plan", callback_data=f"admin:validity:plan:{user_id}:-"))
     kb.add(types.InlineKeyboardButton("⬅ Back", callback_data="admin:menu"))
     return kb
 
@@ -93,285 +216,397 @@ def build_voices_keyboard(models):
 
 
 # -----------------------
-# MAIN REGISTER
+# DISPATCH
+# runtime-agnostic: plain Database and state-store calls, no bot. The
+# threaded panel calls these directly, the async panel on its DB thread.
 # -----------------------
-def register_admin_handlers(bot: telebot.TeleBot, db):
-    admin_steps: Dict[int, Dict] = {}
+class AdminSettings:
+    """One bot's admin panel settings; without a tenant, the single-bot config."""
+
+    def __init__(self, states: StateStore, tenant=None, scheduler=None):
+        self.states = states
+        # shared state stores are namespaced per hosted bot
+        self.steps_ns = tenant.scoped(ADMIN_STEPS) if tenant else ADMIN_STEPS
+        self.default_models = tenant.models if tenant else DEFAULT_MODELS
+        self.plans = tenant.plans if tenant else PLANS
+        self.db_path = tenant.db_path if tenant else DB_PATH
+        self.scheduler = scheduler
+
+    def set_step(self, uid: int, step: dict):
+        self.states.set(self.steps_ns, uid, step)
+
+    def has_step(self, uid: int) -> bool:
+        return self.states.has(self.steps_ns, uid)
+
+    def awaiting_bulk(self, uid: int) -> bool:
+        step = self.states.get(self.steps_ns, uid)
+        return bool(step and step.get("action") == "bulk_grants")
+
+
+class AdminReply:
+    """
+    What an admin action answers: `text` with `markup` (callback screens
+    default to a Back button), then an optional follow-up the runtime
+    carries out with its own bot: ("preview", voice_id, name),
+    ("profile", seconds), ("broadcast", text) or ("download", path).
+    """
+
+    __slots__ = ("text", "markup", "follow_up")
 
-    def ensure_admin(uid: int):
-        return db.is_admin(uid)
+    def __init__(self, text: str, markup=None, follow_up: Optional[tuple] = None):
+        self.text = text
+        self.markup = markup
+        self.follow_up = follow_up
+
+
+def admin_callback(db, cfg: AdminSettings, uid: int, data: str) -> Optional[AdminReply]:
+    """The screen for an `admin:` callback; None for non-admins and unknown buttons."""
+    if not db.is_admin(uid):
+        return None
+    parts = data.split(":")
+    section = parts[1]
+    show = AdminReply
 
     # -----------------------
-    # /admin command
+    # MENU
     # -----------------------
-    @bot.message_handler(commands=["admin"])
-    def admin_cmd(message):
-        if not ensure_admin(message.from_user.id):
-            return
-        bot.send_message(message.chat.id, "⚙️ Admin Panel", reply_markup=build_admin_menu())
+    if section == "menu":
+        cfg.states.pop(cfg.steps_ns, uid)
+        return show("⚙️ Admin Panel", build_admin_menu())
 
     # -----------------------
-    # CALLBACK HANDLER
+    # CREDITS: start -> ask user id
     # -----------------------
-    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("admin:"))
-    def cb(callback):
-        uid = callback.from_user.id
-        if not ensure_admin(uid):
-            return bot.answer_callback_query(callback.id)
+    if section == "credits" and len(parts) == 2:
+        cfg.set_step(uid, {"action": "credits_pick_user"})
+        return show("Send User ID for credits:")
+
+    # credits: add/remove clicked
+    if section == "credits" and len(parts) >= 4 and parts[2] in ("add", "remove"):
+        action = parts[2]  # add/remove
+        user_id = int(parts[3])
+        db.ensure_user(user_id, None)
+        cfg.set_step(uid, {"action": f"credits_{action}_amount", "target": user_id})
+        return show(f"Send amount to {action.upper()} for {user_id}:")
 
-        bot.answer_callback_query(callback.id)
+    # -----------------------
+    # VALIDITY: start -> ask user id
+    # -----------------------
+    if section == "validity" and len(parts) == 2:
+        cfg.set_step(uid, {"action": "validity_pick_user"})
+        return show("Send User ID for validity:")
+
+    # validity: set/remove clicked
+    if section == "validity" and len(parts) >= 4 and parts[2] in ("set", "remove"):
+        user_id = int(parts[3])
+        db.ensure_user(user_id, None)
+
+        if parts[2] == "remove":
+            db.remove_validity(user_id)
+            return show(f"✅ Validity removed for {user_id}")
+
+        # set
+        cfg.set_step(uid, {"action": "validity_days", "target": user_id})
+        return show(f"Send validity days for {user_id}:")
+
+    # validity: plan clicked (sets the user's encoding tier)
+    if section == "validity" and len(parts) >= 5 and parts[2] == "plan":
+        user_id = int(parts[3])
+        plan = None if parts[4] == "-" else cfg.plans[int(parts[4])]["name"]
+        db.ensure_user(user_id, None)
+        db.update_user_fields(user_id, {"plan": plan})
+        return show(f"✅ Plan for {user_id}: {plan or 'none'}")
 
-        parts = callback.data.split(":")
-        section = parts[1]
+    # -----------------------
+    # BULK GRANTS: ask for CSV document / text
+    # -----------------------
+    if section == "bulk":
+        cfg.set_step(uid, {"action": "bulk_grants"})
+        return show(BULK_GRANTS_PROMPT)
 
-        # -----------------------
-        # MENU
-        # -----------------------
-        if section == "menu":
-            return bot.send_message(callback.message.chat.id, "⚙️ Admin Panel", reply_markup=build_admin_menu())
+    # -----------------------
+    # LIST USERS / PREMIUM
+    # -----------------------
+    if section == "list_users":
+        return show(format_users(db.list_users()))
+
+    if section == "list_premium":
+        return show(format_premium_users(db.list_premium_users()))
+
+    # -----------------------
+    # STATS (aggregate tables only, no scans)
+    # -----------------------
+    if section == "stats":
+        return show(format_stats(db.get_stats()), build_stats_keyboard())
+
+    # -----------------------
+    # BROADCAST
+    # -----------------------
+    if section == "broadcast":
+        cfg.set_step(uid, {"action": "broadcast"})
+        return show("Send broadcast message:")
+
+    # -----------------------
+    # DEFAULT VOICE ID
+    # -----------------------
+    if section == "default_voice":
+        cfg.set_step(uid, {"action": "set_default_voice"})
+        return show("Send new Default Voice ID:")
 
+    # -----------------------
+    # VOICES
+    # -----------------------
+    if section == "voices" and len(parts) == 2:
+        models = get_models_from_db(db, cfg.default_models)
+        return show("🎛 Manage Voices\nSelect a voice to change ID:", build_voices_keyboard(models))
+
+    if section == "voices" and len(parts) >= 4 and parts[2] == "edit":
+        idx = int(parts[3])
+        models = get_models_from_db(db, cfg.default_models)
+        if idx < 0 or idx >= len(models):
+            return show("❌ Invalid voice")
+
+        v = models[idx]
+        cfg.set_step(uid, {"action": "voice_edit_apply", "index": idx})
+        return show(f"🎙 Voice: {v.get('name')}\nCurrent ID:\n{v.get('id')}\n\nSend NEW Voice ID:")
+
+    if section == "voices" and len(parts) >= 3 and parts[2] == "add":
+        cfg.set_step(uid, {"action": "voice_add"})
+        return show("Send: <voice_id> | <voice_name>")
+
+    if section == "voices" and len(parts) >= 3 and parts[2] == "reset":
+        set_models_to_db(db, cfg.default_models)
+        db.set_setting("default_voice_id", cfg.default_models[0]["id"])
+        return show("✅ Voices reset done!")
+
+    # -----------------------
+    # SCHEDULED JOBS
+    # -----------------------
+    if section == "jobs":
+        if cfg.scheduler is None:
+            return show("Scheduler not running")
+        return show(format_jobs(cfg.scheduler.snapshot()))
+
+    # -----------------------
+    # PROFILER: ask for duration
+    # -----------------------
+    if section == "profile":
+        cfg.set_step(uid, {"action": "profile_seconds"})
+        return show(f"Send profiling duration in seconds (1-{PROFILE_MAX_SECONDS}):")
+
+    # -----------------------
+    # DOWNLOAD DB
+    # -----------------------
+    if section == "download":
+        if not os.path.exists(cfg.db_path):
+            return show("DB not found!")
+        db.checkpoint()  # recent commits may still be in the WAL
+        return show("📦 Sending the database…", follow_up=("download", cfg.db_path))
+    return None
+
+
+def admin_step(db, cfg: AdminSettings, uid: int, text: Optional[str]) -> Optional[AdminReply]:
+    """Consume the admin's pending step with their message `text`; None if there was none."""
+    step = cfg.states.pop(cfg.steps_ns, uid)
+    if not step:
+        return None
+    action = step.get("action")
+    reply = AdminReply
+
+    try:
         # -----------------------
-        # CREDITS: start -> ask user id
+        # Credits: pick user id -> show buttons
         # -----------------------
-        if section == "credits" and len(parts) == 2:
-            admin_steps[uid] = {"action": "credits_pick_user"}
-            return bot.send_message(callback.message.chat.id, "Send User ID for credits:")
-
-        # credits: add/remove clicked
-        if section == "credits" and len(parts) >= 4 and parts[2] in ("add", "remove"):
-            action = parts[2]  # add/remove
-            user_id = int(parts[3])
+        if action == "credits_pick_user":
+            user_id = parse_int(text)
             db.ensure_user(user_id, None)
-            admin_steps[uid] = {"action": f"credits_{action}_amount", "target": user_id}
-            return bot.send_message(callback.message.chat.id, f"Send amount to {action.upper()} for {user_id}:")
+            return reply(f"User {user_id}\nChoose credits action:", build_credit_action_keyboard(user_id))
+
+        # credits add amount
+        if action == "credits_add_amount":
+            amount = parse_int(text)
+            target = int(step.get("target"))
+            db.ensure_user(target, None)
+            db.add_credits(target, amount)
+            return reply(f"✅ Added {amount} credits to {target}")
+
+        # credits remove amount
+        if action == "credits_remove_amount":
+            amount = parse_int(text)
+            target = int(step.get("target"))
+            db.ensure_user(target, None)
+            db.remove_credits(target, amount, consumed=False)  # clamps at zero
+            return reply(f"✅ Removed {amount} credits from {target}")
 
         # -----------------------
-        # VALIDITY: start -> ask user id
+        # Validity: pick user id -> show buttons
         # -----------------------
-        if section == "validity" and len(parts) == 2:
-            admin_steps[uid] = {"action": "validity_pick_user"}
-            return bot.send_message(callback.message.chat.id, "Send User ID for validity:")
-
-        # validity: set/remove clicked
-        if section == "validity" and len(parts) >= 4 and parts[2] in ("set", "remove"):
-            user_id = int(parts[3])
+        if action == "validity_pick_user":
+            user_id = parse_int(text)
             db.ensure_user(user_id, None)
+            return reply(f"User {user_id}\nChoose validity action:", build_validity_action_keyboard(user_id, cfg.plans))
 
-            if parts[2] == "remove":
-                db.remove_validity(user_id)
-                return bot.send_message(callback.message.chat.id, f"✅ Validity removed for {user_id}")
-
-            # set
-            admin_steps[uid] = {"action": "validity_days", "target": user_id}
-            return bot.send_message(callback.message.chat.id, f"Send validity days for {user_id}:")
+        # validity set days
+        if action == "validity_days":
+            days = parse_int(text)
+            target = int(step.get("target"))
+            db.ensure_user(target, None)
+            db.set_validity(target, days)
+            return reply(f"✅ Validity set: {days} days for {target}")
 
         # -----------------------
-        # LIST USERS
+        # Bulk grants pasted as text
         # -----------------------
-        if section == "list_users":
-            users = db.list_users()
-            text = "\n".join(
-                [f"{u['id']} @{u.get('username') or 'unknown'} | credits={u.get('credits') or 0}" for u in users]
-            )
-            return bot.send_message(callback.message.chat.id, text or "No users")
+        if action == "bulk_grants":
+            return reply(format_report(apply_grants(db, (text or "").splitlines())))
 
         # -----------------------
-        # LIST PREMIUM
+        # Profiler run
         # -----------------------
-        if section == "list_premium":
-            users = db.list_premium_users()
-            lines = []
-            for u in users:
-                lines.append(
-                    f"👤 User: {u['id']}\n"
-                    f"💳 Credits: {u.get('credits') or 0}\n"
-                    f"✅ Start: {pretty_date(u.get('validity_start_at'))}\n"
-                    f"⏳ End: {pretty_date(u.get('validity_expire_at'))}\n"
-                    f"----------------------"
-                )
-            return bot.send_message(callback.message.chat.id, "\n".join(lines) or "No premium users")
+        if action == "profile_seconds":
+            seconds = max(1, min(parse_int(text), PROFILE_MAX_SECONDS))
+            return reply(f"🔥 Profiling all threads for {seconds}s…", follow_up=("profile", seconds))
 
         # -----------------------
-        # BROADCAST
+        # Default voice id
         # -----------------------
-        if section == "broadcast":
-            admin_steps[uid] = {"action": "broadcast"}
-            return bot.send_message(callback.message.chat.id, "Send broadcast message:")
+        if action == "set_default_voice":
+            voice_id = (text or "").strip()
+            if not valid_voice_id(voice_id):
+                return reply("❌ Invalid Voice ID")
+            db.set_setting("default_voice_id", voice_id)
+            return reply(f"✅ Default voice updated:\n{voice_id}")
 
         # -----------------------
-        # DEFAULT VOICE ID
+        # Voice edit apply
         # -----------------------
-        if section == "default_voice":
-            admin_steps[uid] = {"action": "set_default_voice"}
-            return bot.send_message(callback.message.chat.id, "Send new Default Voice ID:")
+        if action == "voice_edit_apply":
+            new_id = (text or "").strip()
+            if not valid_voice_id(new_id):
+                return reply("❌ Invalid Voice ID")
 
-        # -----------------------
-        # VOICES
-        # -----------------------
-        if section == "voices" and len(parts) == 2:
-            models = _get_models_from_db(db)
-            return bot.send_message(
-                callback.message.chat.id,
-                "🎛 Manage Voices\nSelect a voice to change ID:",
-                reply_markup=build_voices_keyboard(models),
-            )
-
-        if section == "voices" and len(parts) >= 4 and parts[2] == "edit":
-            idx = int(parts[3])
-            models = _get_models_from_db(db)
+            idx = int(step.get("index"))
+            models = get_models_from_db(db, cfg.default_models)
             if idx < 0 or idx >= len(models):
-                return bot.send_message(callback.message.chat.id, "❌ Invalid voice")
+                return reply("❌ Invalid voice index")
 
-            v = models[idx]
-            admin_steps[uid] = {"action": "voice_edit_apply", "index": idx}
-            return bot.send_message(
-                callback.message.chat.id,
-                f"🎙 Voice: {v.get('name')}\nCurrent ID:\n{v.get('id')}\n\nSend NEW Voice ID:"
-            )
+            models[idx]["id"] = new_id
+            set_models_to_db(db, models)
+            name = models[idx].get("name")
+            return reply(f"✅ Voice updated:\n{name}\n{new_id}", follow_up=("preview", new_id, name))
 
-        if section == "voices" and len(parts) >= 3 and parts[2] == "add":
-            admin_steps[uid] = {"action": "voice_add"}
-            return bot.send_message(callback.message.chat.id, "Send: <voice_id> | <voice_name>")
+        # -----------------------
+        # Voice add
+        # -----------------------
+        if action == "voice_add":
+            try:
+                vid, vname = parse_new_voice(text)
+            except ValueError as e:
+                return reply(str(e))
 
-        if section == "voices" and len(parts) >= 3 and parts[2] == "reset":
-            _set_models_to_db(db, DEFAULT_MODELS)
-            db.set_setting("default_voice_id", DEFAULT_MODELS[0]["id"])
-            return bot.send_message(callback.message.chat.id, "✅ Voices reset done!")
+            models = get_models_from_db(db, cfg.default_models)
+            models.append({"id": vid, "name": vname})
+            set_models_to_db(db, models)
+            return reply("✅ Voice added successfully!", follow_up=("preview", vid, vname))
 
         # -----------------------
-        # DOWNLOAD DB
+        # Broadcast
         # -----------------------
-        if section == "download":
-            try:
-                with open(DB_PATH, "rb") as f:
-                    return bot.send_document(callback.message.chat.id, f)
-            except Exception:
-                return bot.send_message(callback.message.chat.id, "DB not found!")
+        if action == "broadcast":
+            return reply("📣 Broadcasting…", follow_up=("broadcast", text))
 
-    # -----------------------
-    # STEP HANDLER
-    # -----------------------
-    @bot.message_handler(func=lambda m: m.from_user.id in admin_steps)
-    def step_handler(msg):
-        uid = msg.from_user.id
-        step = admin_steps.pop(uid, None)
-        if not step:
-            return
+    except Exception as e:
+        return reply(f"❌ Error: {e}")
+    return None
 
-        action = step.get("action")
 
-        try:
-            # -----------------------
-            # Credits: pick user id -> show buttons
-            # -----------------------
-            if action == "credits_pick_user":
-                user_id = parse_int(msg.text)
-                db.ensure_user(user_id, None)
-                return bot.send_message(
-                    msg.chat.id,
-                    f"User {user_id}\nChoose credits action:",
-                    reply_markup=build_credit_action_keyboard(user_id),
-                )
-
-            # credits add amount
-            if action == "credits_add_amount":
-                amount = parse_int(msg.text)
-                target = int(step.get("target"))
-                db.ensure_user(target, None)
-                db.add_credits(target, amount)
-                return bot.send_message(msg.chat.id, f"✅ Added {amount} credits to {target}")
-
-            # credits remove amount
-            if action == "credits_remove_amount":
-                amount = parse_int(msg.text)
-                target = int(step.get("target"))
-                db.ensure_user(target, None)
-                db.remove_credits(target, amount)
-                return bot.send_message(msg.chat.id, f"✅ Removed {amount} credits from {target}")
-
-            # -----------------------
-            # Validity: pick user id -> show buttons
-            # -----------------------
-            if action == "validity_pick_user":
-                user_id = parse_int(msg.text)
-                db.ensure_user(user_id, None)
-                return bot.send_message(
-                    msg.chat.id,
-                    f"User {user_id}\nChoose validity action:",
-                    reply_markup=build_validity_action_keyboard(user_id),
-                )
-
-            # validity set days
-            if action == "validity_days":
-                days = parse_int(msg.text)
-                target = int(step.get("target"))
-                db.ensure_user(target, None)
-                db.set_validity(target, days)
-                return bot.send_message(msg.chat.id, f"✅ Validity set: {days} days for {target}")
-
-            # -----------------------
-            # Default voice id
-            # -----------------------
-            if action == "set_default_voice":
-                voice_id = (msg.text or "").strip()
-                if len(voice_id) < 10:
-                    return bot.send_message(msg.chat.id, "❌ Invalid Voice ID")
-                db.set_setting("default_voice_id", voice_id)
-                return bot.send_message(msg.chat.id, f"✅ Default voice updated:\n{voice_id}")
-
-            # -----------------------
-            # Voice edit apply
-            # -----------------------
-            if action == "voice_edit_apply":
-                new_id = (msg.text or "").strip()
-                if len(new_id) < 10:
-                    return bot.send_message(msg.chat.id, "❌ Invalid Voice ID")
-
-                idx = int(step.get("index"))
-                models = _get_models_from_db(db)
-                if idx < 0 or idx >= len(models):
-                    return bot.send_message(msg.chat.id, "❌ Invalid voice index")
-
-                models[idx]["id"] = new_id
-                _set_models_to_db(db, models)
-                return bot.send_message(msg.chat.id, f"✅ Voice updated:\n{models[idx].get('name')}\n{new_id}")
-
-            # -----------------------
-            # Voice add
-            # -----------------------
-            if action == "voice_add":
-                raw = (msg.text or "").strip()
-                if "|" not in raw:
-                    return bot.send_message(msg.chat.id, "❌ Use: <voice_id> | <voice_name>")
-                vid, vname = [x.strip() for x in raw.split("|", 1)]
-                if len(vid) < 10:
-                    return bot.send_message(msg.chat.id, "❌ Invalid voice id")
-
-                models = _get_models_from_db(db)
-                models.append({"id": vid, "name": vname or vid})
-                _set_models_to_db(db, models)
-                return bot.send_message(msg.chat.id, "✅ Voice added successfully!")
-
-            # -----------------------
-            # Broadcast
-            # -----------------------
-            if action == "broadcast":
-                import time
-                users = db.list_users(limit=100000)
-                sent = 0
-                failed = 0
-                for u in users:
-                    uid2 = u.get("id")
-                    if not uid2:
-                        continue
+def bulk_document_grants(db, cfg: AdminSettings, uid: int, data: bytes) -> AdminReply:
+    """The CSV/TXT document the bulk-grants step was waiting for."""
+    cfg.states.pop(cfg.steps_ns, uid)
+    try:
+        return AdminReply(format_report(apply_grants(db, iter_document_lines(data))))
+    except Exception as e:
+        return AdminReply(f"❌ Error: {e}")
+
+
+def broadcast_report(sent: int, failed: int) -> str:
+    return f"📣 Broadcast finished.\n✅ Sent: {sent}\n❌ Failed: {failed}"
+
+
+# -----------------------
+# MAIN REGISTER
+# -----------------------
+def register_admin_handlers(
+    bot: telebot.TeleBot, db, states: StateStore = None, scheduler=None, tenant=None, previews=None
+):
+    cfg = AdminSettings(states or create_state_store(), tenant, scheduler)
+
+    def follow_up(chat_id: int, action: tuple):
+        kind = action[0]
+        if kind == "preview":
+            # a new or changed voice id gets its picker preview now, and the admin hears it
+            if previews is None:
+                return
+            _, voice_id, name = action
+            try:
+                previews.send(bot, chat_id, voice_id, caption=f"🔊 Preview: {name}")
+            except Exception as e:
+                bot.send_message(chat_id, f"⚠️ Preview not rendered: {e}")
+        elif kind == "profile":
+            # own thread: don't hold a handler worker for the whole run
+            threading.Thread(target=_run_profile, args=(bot, chat_id, action[1]), name="profiler", daemon=True).start()
+        elif kind == "broadcast":
+            sent = failed = 0
+            # paced by the outbound limiter, behind interactive replies
+            with outbound_bulk():
+                for u in db.iter_users(("id",)):
                     try:
-                        bot.send_message(uid2, msg.text)
+                        bot.send_message(u.id, action[1])
                         sent += 1
-                        time.sleep(0.05)
                     except Exception:
                         failed += 1
-                        time.sleep(0.2)
-                return bot.send_message(msg.chat.id, f"📣 Broadcast finished.\n✅ Sent: {sent}\n❌ Failed: {failed}")
+            bot.send_message(chat_id, broadcast_report(sent, failed))
+        elif kind == "download":
+            try:
+                with open(action[1], "rb") as f:
+                    bot.send_document(chat_id, f)
+            except OSError:
+                bot.send_message(chat_id, "DB not found!")
 
+    @bot.message_handler(commands=["admin"])
+    def admin_cmd(message):
+        if not db.is_admin(message.from_user.id):
+            return
+        bot.send_message(message.chat.id, "⚙️ Admin Panel", reply_markup=build_admin_menu())
+
+    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("admin:"))
+    def cb(callback):
+        bot.answer_callback_query(callback.id)
+        reply = admin_callback(db, cfg, callback.from_user.id, callback.data)
+        if reply is None:
+            return
+        # menus are edited in place; every screen gets a way back
+        edit_or_send(bot, callback.message, reply.text, reply_markup=reply.markup or build_back_keyboard())
+        if reply.follow_up:
+            follow_up(callback.message.chat.id, reply.follow_up)
+
+    @bot.message_handler(content_types=["document"], func=lambda m: cfg.awaiting_bulk(m.from_user.id))
+    def bulk_document(msg):
+        try:
+            file_info = bot.get_file(msg.document.file_id)
+            data = bot.download_file(file_info.file_path)
         except Exception as e:
-            bot.send_message(msg.chat.id, f"❌ Error: {e}")
+            return bot.send_message(msg.chat.id, f"❌ Error: {e}")
+        bot.send_message(msg.chat.id, bulk_document_grants(db, cfg, msg.from_user.id, data).text)
+
+    @bot.message_handler(func=lambda m: cfg.has_step(m.from_user.id))
+    def step_handler(msg):
+        reply = admin_step(db, cfg, msg.from_user.id, msg.text)
+        if reply is None:
+            return
+        bot.send_message(msg.chat.id, reply.text, reply_markup=reply.markup)
+        if reply.follow_up:
+            try:
+                follow_up(msg.chat.id, reply.follow_up)
+            except Exception as e:
+                bot.send_message(msg.chat.id, f"❌ Error: {e}")
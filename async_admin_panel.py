@@ -0,0 +1,130 @@
+import asyncio
+import os
+import aiofiles
+from telebot.async_telebot import AsyncTeleBot
+from admin_panel import (
+    AdminSettings,
+    _escape,
+    admin_callback,
+    admin_step,
+    broadcast_report,
+    build_admin_menu,
+    build_back_keyboard,
+    bulk_document_grants,
+)
+from state_store import StateStore, create_state_store
+from messaging import async_edit_or_send
+from outbound import BULK, exception_retry_after
+
+
+def register_async_admin_handlers(
+    bot: AsyncTeleBot, adb, states: StateStore = None, scheduler=None, previews=None, tenant=None, limiter=None
+):
+    """
+    AsyncTeleBot adapter over admin_panel's dispatch. `adb` is an AsyncDatabase:
+    the dispatch (DB and state-store calls) runs on its DB thread, never on
+    the event loop. Broadcasts are paced by `limiter` (a TelegramLimiter).
+    """
+    cfg = AdminSettings(states or create_state_store(), tenant, scheduler)
+
+    async def follow_up(chat_id: int, action: tuple):
+        kind = action[0]
+        if kind == "preview":
+            if previews is None:
+                return
+            _, voice_id, name = action
+            try:
+                await previews.async_send(bot, adb, chat_id, voice_id, caption=f"🔊 Preview: {name}")
+            except Exception as e:
+                await bot.send_message(chat_id, f"⚠️ Preview not rendered: {e}")
+        elif kind == "profile":
+            asyncio.create_task(run_profile(chat_id, action[1]))
+        elif kind == "broadcast":
+            sent, failed = await broadcast(action[1])
+            await bot.send_message(chat_id, broadcast_report(sent, failed))
+        elif kind == "download":
+            async with aiofiles.open(action[1], "rb") as f:
+                data = await f.read()
+            await bot.send_document(chat_id, data, visible_file_name=os.path.basename(action[1]))
+
+    async def broadcast(text: str):
+        sent = failed = 0
+        after_id = 0
+        while True:
+            page = await adb.users_page(("id",), after_id, 500)
+            if not page:
+                return sent, failed
+            after_id = page[-1].id
+            for u in page:
+                if limiter is not None:
+                    # same buckets as the threaded runtime, behind interactive replies
+                    await limiter.acquire_async(bot.token, u.id, BULK)
+                try:
+                    await bot.send_message(u.id, text)
+                    sent += 1
+                except Exception as e:
+                    failed += 1
+                    retry_after = exception_retry_after(e)
+                    if limiter is not None and retry_after:
+                        limiter.penalize(bot.token, u.id, retry_after)
+
+    async def run_profile(chat_id: int, seconds: int):
+        import io
+        import profiler  # only loaded when a run is requested
+
+        try:
+            summary, collapsed = await asyncio.to_thread(profiler.run, seconds)
+        except Exception as e:
+            return await bot.send_message(chat_id, f"❌ Profiler: {e}")
+        await bot.send_message(chat_id, f"<pre>{_escape(summary[:3900])}</pre>")
+        await bot.send_document(
+            chat_id,
+            io.BytesIO(collapsed),
+            visible_file_name="profile.collapsed.txt",
+            caption="Collapsed stacks (flamegraph.pl / speedscope)",
+        )
+
+    @bot.message_handler(commands=["admin"])
+    async def admin_cmd(message):
+        if not await adb.is_admin(message.from_user.id):
+            return
+        await bot.send_message(message.chat.id, "⚙️ Admin Panel", reply_markup=build_admin_menu())
+
+    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("admin:"))
+    async def cb(callback):
+        await bot.answer_callback_query(callback.id)
+        reply = await adb.run(admin_callback, cfg, callback.from_user.id, callback.data)
+        if reply is None:
+            return
+        # menus are edited in place; every screen gets a way back
+        await async_edit_or_send(bot, callback.message, reply.text, reply_markup=reply.markup or build_back_keyboard())
+        if reply.follow_up:
+            await follow_up(callback.message.chat.id, reply.follow_up)
+
+    async def awaiting_bulk(m) -> bool:
+        return await asyncio.to_thread(cfg.awaiting_bulk, m.from_user.id)
+
+    @bot.message_handler(content_types=["document"], func=awaiting_bulk)
+    async def bulk_document(msg):
+        try:
+            file_info = await bot.get_file(msg.document.file_id)
+            data = await bot.download_file(file_info.file_path)
+        except Exception as e:
+            return await bot.send_message(msg.chat.id, f"❌ Error: {e}")
+        reply = await adb.run(bulk_document_grants, cfg, msg.from_user.id, data)
+        await bot.send_message(msg.chat.id, reply.text)
+
+    async def has_step(m) -> bool:
+        return await asyncio.to_thread(cfg.has_step, m.from_user.id)
+
+    @bot.message_handler(func=has_step)
+    async def step_handler(msg):
+        reply = await adb.run(admin_step, cfg, msg.from_user.id, msg.text)
+        if reply is None:
+            return
+        await bot.send_message(msg.chat.id, reply.text, reply_markup=reply.markup)
+        if reply.follow_up:
+            try:
+                await follow_up(msg.chat.id, reply.follow_up)
+            except Exception as e:
+                await bot.send_message(msg.chat.id, f"❌ Error: {e}")
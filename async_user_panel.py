@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+from config import (
+    ADMIN_CONTACT,
+    WEBSITE_URL,
+    COST_PER_VOICE,
+    VOICES_DIR,
+    DEFAULT_MODELS,
+    INLINE_RESULTS_LIMIT,
+    PLANS,
+)
+from encoding import allowed_profiles, get_profile, profile_for_user
+from fish_audio import AsyncFishAudioClient
+from messaging import async_chat_action, async_edit_or_send
+from previews import VoicePreviews
+from voice_store import VoiceStore
+from user_panel import (
+    MENU_BUTTONS,
+    build_user_keyboard,
+    build_models_keyboard,
+    build_quality_keyboard,
+    build_speed_keyboard,
+    build_inline_voice_results,
+    build_tts_payload,
+    format_plans,
+    format_usage,
+    get_model_name,
+    speed_to_value,
+    speed_to_label,
+    tts_cache_key,
+    tts_rejection,
+    voice_caption,
+)
+
+log = logging.getLogger("bot.tts")
+
+
+def register_async_user_handlers(
+    bot: AsyncTeleBot,
+    adb,
+    client: AsyncFishAudioClient = None,
+    store: VoiceStore = None,
+    previews: VoicePreviews = None,
+    cache=None,
+):
+    """
+    asyncio port of user_panel.register_user_handlers; `adb` is an AsyncDatabase.
+    Validation, captions, payloads and cache keys come from user_panel, so both
+    runtimes behave alike. Single bot only, and no drain/resume of in-flight
+    voices (see the README).
+    """
+    client = client or AsyncFishAudioClient()
+    store = store or VoiceStore(adb.db, os.path.join(VOICES_DIR, "objects"))
+
+    @bot.message_handler(commands=["start"])
+    async def cmd_start(message: types.Message):
+        await adb.ensure_user(message.from_user.id, message.from_user.username)
+        await bot.send_message(message.chat.id, "Welcome! Use the buttons below.", reply_markup=build_user_keyboard())
+
+    @bot.message_handler(func=lambda m: m.text == "Contact Admin")
+    async def contact_admin(message: types.Message):
+        await bot.send_message(message.chat.id, f"Contact admin: {ADMIN_CONTACT}")
+
+    @bot.message_handler(func=lambda m: m.text == "Our Website")
+    async def website(message: types.Message):
+        await bot.send_message(message.chat.id, f"Website: {WEBSITE_URL}")
+
+    @bot.message_handler(func=lambda m: m.text == "Plans")
+    async def plans(message: types.Message):
+        await bot.send_message(message.chat.id, format_plans(PLANS))
+
+    @bot.message_handler(func=lambda m: m.text == "Voice Speed")
+    async def voice_speed_menu(message: types.Message):
+        await bot.send_message(message.chat.id, "Choose voice speed:", reply_markup=build_speed_keyboard())
+
+    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("speed:"))
+    async def speed_chosen(callback: types.CallbackQuery):
+        mode = callback.data.split(":", 1)[1].strip().lower()
+        await bot.answer_callback_query(callback.id)
+        await adb.update_user_fields(callback.from_user.id, {"tts_speed": mode})
+        await async_edit_or_send(bot, callback.message, f"✅ Speed set to: <b>{speed_to_label(mode)}</b>")
+
+    @bot.message_handler(func=lambda m: m.text == "Audio Quality")
+    async def quality_menu(message: types.Message):
+        user = await adb.get_user(message.from_user.id) or {}
+        current = profile_for_user(user, PLANS).name
+        await bot.send_message(
+            message.chat.id,
+            "Choose audio quality (lower quality = smaller, faster voices):",
+            reply_markup=build_quality_keyboard(allowed_profiles(user, PLANS), current),
+        )
+
+    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("quality:"))
+    async def quality_chosen(callback: types.CallbackQuery):
+        name = callback.data.split(":", 1)[1].strip()
+        user = await adb.get_user(callback.from_user.id) or {}
+        if name not in {p.name for p in allowed_profiles(user, PLANS)}:
+            await bot.answer_callback_query(callback.id, "Not available on your plan.")
+            return
+        await bot.answer_callback_query(callback.id)
+        await adb.update_user_fields(callback.from_user.id, {"encoding_profile": name})
+        await async_edit_or_send(bot, callback.message, f"✅ Audio quality set to: <b>{name.title()}</b>")
+
+    @bot.message_handler(func=lambda m: m.text == "Usage")
+    async def usage(message: types.Message):
+        # one point read: user row + materialized usage counters + default voice
+        user = await adb.get_usage_summary(message.from_user.id)
+        await bot.send_message(message.chat.id, format_usage(user, client.list_models(), DEFAULT_MODELS, PLANS))
+
+    @bot.message_handler(func=lambda m: m.text == "Select Model")
+    async def select_model(message: types.Message):
+        models = client.list_models()
+        await bot.send_message(
+            message.chat.id, "Choose a model:", reply_markup=build_models_keyboard(models, previews is not None)
+        )
+
+    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("model:"))
+    async def model_chosen(callback: types.CallbackQuery):
+        voice_id = callback.data.split(":", 1)[1]
+        await bot.answer_callback_query(callback.id)
+        await adb.update_user_fields(callback.from_user.id, {"selected_model": voice_id})
+        model_name = get_model_name(client.list_models(), voice_id)
+        await async_edit_or_send(
+            bot, callback.message, f"✅ Model selected: <b>{model_name}</b>\nNow send text to generate voice."
+        )
+
+    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("preview:"))
+    async def preview_chosen(callback: types.CallbackQuery):
+        voice_id = callback.data.split(":", 1)[1]
+        models = client.list_models()
+        if previews is None or voice_id not in {m.get("id") for m in models}:
+            await bot.answer_callback_query(callback.id, "No preview available.")
+            return
+        await bot.answer_callback_query(callback.id)
+        try:
+            await previews.async_send(
+                bot, adb, callback.message.chat.id, voice_id, caption=f"🔊 {get_model_name(models, voice_id)}"
+            )
+        except Exception:
+            await bot.send_message(callback.message.chat.id, "❌ Preview unavailable right now, please try again later.")
+
+    @bot.inline_handler(func=lambda q: True)
+    async def inline_search(query: types.InlineQuery):
+        try:
+            voices = await adb.search_voices(query.from_user.id, query.query, limit=INLINE_RESULTS_LIMIT)
+            await bot.answer_inline_query(query.id, build_inline_voice_results(voices), cache_time=5, is_personal=True)
+        except sqlite3.OperationalError:
+            log.exception("inline voice search failed", extra={"user_id": query.from_user.id})
+        except Exception as e:
+            # typically the inline query expired before we answered
+            log.warning("inline answer failed", extra={"user_id": query.from_user.id, "error": str(e)})
+
+    @bot.message_handler(content_types=["text"])
+    async def tts_entry(message: types.Message):
+        txt = (message.text or "").strip()
+        if txt in MENU_BUTTONS:
+            return
+
+        user = await adb.get_user(message.from_user.id) or {}
+        rejection = tts_rejection(txt, user)
+        if rejection:
+            await bot.send_message(message.chat.id, rejection)
+            return
+
+        model = user.get("selected_model")
+        if not model:
+            model = await adb.get_setting("default_voice_id", DEFAULT_MODELS[0]["id"])
+
+        await run_tts_job(build_tts_payload(message, user, txt, model, PLANS))
+
+    async def run_tts_job(p: dict):
+        """user_panel's run_tts_job on the event loop: charge → synthesize → archive → send → bookkeeping."""
+        chat_id, user_id = p["chat_id"], p["user_id"]
+        profile = get_profile(p.get("encoding"))
+
+        # reserve the credit before any upstream work; refunded below if no voice goes out
+        if not await adb.remove_credits(user_id, COST_PER_VOICE):
+            # spent by a concurrent voice since the credit check
+            await bot.send_message(chat_id, "❌ You have no credits.")
+            return
+
+        delivered = False
+        digest = None  # store.put pins the blob until the voice is recorded or has failed
+        try:
+            async with async_chat_action(bot, chat_id, "record_voice"):
+                audio_bytes = await synthesize(p, profile)
+                if audio_bytes is None:
+                    return
+                digest, ogg_path = await asyncio.to_thread(store.put, audio_bytes, profile.extension)
+
+                started = time.monotonic()
+                sent = await bot.send_voice(chat_id, audio_bytes, caption=voice_caption(client.list_models(), p))
+                delivered = True
+            file_id = sent.voice.file_id if sent and sent.voice else None
+            log.info("voice uploaded", extra={"user_id": user_id, "ms": round((time.monotonic() - started) * 1000, 1)})
+
+            # on the DB thread: the store's bookkeeping shares the connection
+            await adb.run(
+                lambda _db: store.record(
+                    user_id,
+                    ogg_path,
+                    digest,
+                    chars=len(p["text"]),
+                    audio_bytes=len(audio_bytes),
+                    text=p.get("source_text") or p["text"],
+                    file_id=file_id,
+                )
+            )
+        finally:
+            if digest:
+                store.unpin(digest)
+            if not delivered:
+                await adb.refund_credits(user_id, COST_PER_VOICE)
+
+    async def synthesize(p: dict, profile):
+        """Audio for the job from the cache or upstream; None after reporting an error."""
+        chat_id, user_id = p["chat_id"], p["user_id"]
+        started = time.monotonic()
+        cache_key = tts_cache_key(p, profile)
+        try:
+            audio_bytes = cache.get(cache_key) if cache else None
+            if audio_bytes is None:
+                audio_bytes = await client.synthesize_text(
+                    p["text"],
+                    p["model"],
+                    language="en",
+                    speed=speed_to_value(p["mode"]),
+                    latency="slow",
+                    profile=profile,
+                )
+                await adb.record_tts(True, (time.monotonic() - started) * 1000)
+                if cache:
+                    cache.put(cache_key, audio_bytes)
+        except Exception as e:
+            await adb.record_tts(False)
+            log.warning("tts failed", exc_info=True, extra={"user_id": user_id, "model": p["model"]})
+            await bot.send_message(chat_id, f"TTS error: {e}")
+            return None
+        log.info(
+            "tts done",
+            extra={"user_id": user_id, "chars": len(p["text"]), "bytes": len(audio_bytes),
+                   "encoding": profile.name, "ms": round((time.monotonic() - started) * 1000, 1)},
+        )
+        return audio_bytes
@@ -0,0 +1,46 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+from config import AUDIO_CACHE_MAX_BYTES
+
+
+class AudioCache:
+    """
+    Byte-bounded LRU of synthesized audio keyed by everything that affects
+    the output (voice, text, speed, format…). Shared by all tenants.
+    """
+
+    def __init__(self, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        self.max_bytes = int(max_bytes)
+        self._data: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: Hashable, data: bytes):
+        if not data or len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._data[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and self._data:
+                _, evicted = self._data.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._data), "bytes": self._size, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,125 @@
+import html
+import io
+import re
+import time
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+MAX_CREDITS_PER_ROW = 1_000_000
+MAX_DAYS_PER_ROW = 3650
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 20
+HEADER = ("user_id", "credits", "days")
+
+_SPLIT_DELIMITED = re.compile(r"\s*[,;]\s*")
+_SPLIT_BLANK = re.compile(r"\s+")
+
+
+class GrantError(ValueError):
+    def __init__(self, line_no: int, message: str):
+        super().__init__(f"line {line_no}: {message}")
+        self.line_no = line_no
+
+
+def _to_int(value: str, what: str, line_no: int) -> int:
+    value = (value or "").strip()
+    if not value:
+        return 0
+    if not re.fullmatch(r"\d+", value):
+        raise GrantError(line_no, f"invalid {what} {value!r}")
+    return int(value)
+
+
+def parse_grants(lines: Iterable[str]) -> Iterator[Tuple[int, int, int, int]]:
+    """
+    Stream `user_id,credits,days` lines into (line_no, user_id, credits, days).
+
+    Commas, semicolons, tabs or spaces separate fields; empty fields count
+    as 0; blank lines, `#` comments and a first row naming the columns
+    (`user_id,credits,days`) are skipped. Invalid lines, including a
+    mistyped first row, are yielded as GrantError instances instead of
+    stopping the parse.
+    """
+    first = True
+    for line_no, raw in enumerate(lines, 1):
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        splitter = _SPLIT_DELIMITED if ("," in line or ";" in line) else _SPLIT_BLANK
+        fields = splitter.split(line)
+        if first:
+            first = False
+            if tuple(f.lower() for f in fields) == HEADER[: len(fields)]:
+                continue
+        try:
+            if len(fields) > 3:
+                raise GrantError(line_no, "expected user_id,credits,days")
+            fields += [""] * (3 - len(fields))
+            user_id = _to_int(fields[0], "user_id", line_no)
+            credits = _to_int(fields[1], "credits", line_no)
+            days = _to_int(fields[2], "days", line_no)
+            if user_id <= 0:
+                raise GrantError(line_no, "missing user_id")
+            if credits == 0 and days == 0:
+                raise GrantError(line_no, "nothing to grant")
+            if credits > MAX_CREDITS_PER_ROW:
+                raise GrantError(line_no, f"credits above {MAX_CREDITS_PER_ROW}")
+            if days > MAX_DAYS_PER_ROW:
+                raise GrantError(line_no, f"days above {MAX_DAYS_PER_ROW}")
+        except GrantError as e:
+            yield e
+            continue
+        yield line_no, user_id, credits, days
+
+
+def iter_document_lines(data: bytes) -> Iterator[str]:
+    return io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", errors="replace", newline=None)
+
+
+def apply_grants(db, lines: Iterable[str], batch_size: int = BATCH_SIZE) -> Dict:
+    """Validate and apply grants in batched transactions; returns a report dict."""
+    started = time.monotonic()
+    report = {"rows": 0, "users": set(), "credits": 0, "days": 0, "errors": [], "error_count": 0}
+    batch: List[Tuple[int, int, int]] = []
+
+    def flush():
+        if batch:
+            db.bulk_grant(batch)
+            batch.clear()
+
+    for item in parse_grants(lines):
+        if isinstance(item, GrantError):
+            report["error_count"] += 1
+            if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                report["errors"].append(str(item))
+            continue
+        _, user_id, credits, days = item
+        batch.append((user_id, credits, days))
+        report["rows"] += 1
+        report["users"].add(user_id)
+        report["credits"] += credits
+        report["days"] += days
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    report["users"] = len(report["users"])
+    report["seconds"] = round(time.monotonic() - started, 2)
+    return report
+
+
+def format_report(report: Dict) -> str:
+    lines = [
+        "📦 Bulk grant finished.",
+        f"✅ Rows applied: {report['rows']} ({report['users']} users)",
+        f"💳 Credits granted: {report['credits']}",
+        f"⏳ Validity days granted: {report['days']}",
+        f"❌ Invalid lines: {report['error_count']}",
+        f"⏱ {report['seconds']}s",
+    ]
+    if report["errors"]:
+        lines.append("")
+        # errors quote the uploaded lines; the report is sent as HTML
+        lines.extend(html.escape(e, quote=False) for e in report["errors"])
+        if report["error_count"] > len(report["errors"]):
+            lines.append(f"… and {report['error_count'] - len(report['errors'])} more")
+    return "\n".join(lines)
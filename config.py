@@ -10,10 +10,37 @@ ADMIN_IDS = [1800295558]   # <-- আপনার Telegram numeric ID
 
 TELEGRAM_BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 FISH_AUDIO_API_KEY = os.getenv("VOICE_API_KEY", "")
+# Optional pool of keys (comma-separated); synthesis is spread over all of them
+FISH_AUDIO_API_KEYS = [
+    k.strip() for k in os.getenv("VOICE_API_KEYS", "").split(",") if k.strip()
+] or ([FISH_AUDIO_API_KEY] if FISH_AUDIO_API_KEY else [])
+FISH_AUDIO_KEY_COOLDOWN_SECONDS = float(os.getenv("FISH_AUDIO_KEY_COOLDOWN_SECONDS", "30"))
+FISH_AUDIO_KEY_MAX_CONCURRENCY = int(os.getenv("FISH_AUDIO_KEY_MAX_CONCURRENCY", "0"))  # 0 = unlimited
 FISH_AUDIO_BASE_URL = os.getenv("FISH_AUDIO_BASE_URL", "https://api.fish.audio")
 FISH_AUDIO_BACKEND = os.getenv("FISH_AUDIO_BACKEND", "s1")
 FISH_AUDIO_MP3_BITRATE = int(os.getenv("FISH_AUDIO_MP3_BITRATE", "128"))
 
+# Synthesis resilience: failover order ("rest:s1,sdk:s1,rest:speech-1.6"; empty =
+# REST then SDK for opus, SDK then REST otherwise), retries and circuit breaker
+FISH_AUDIO_FAILOVER = os.getenv("FISH_AUDIO_FAILOVER", "")
+# Try the fastest observed healthy route first instead of keeping the failover order
+FISH_AUDIO_ROUTE_BY_LATENCY = os.getenv("FISH_AUDIO_ROUTE_BY_LATENCY", "false").lower() == "true"
+TTS_DEADLINE_SECONDS = float(os.getenv("TTS_DEADLINE_SECONDS", "45"))
+TTS_MAX_RETRIES = int(os.getenv("TTS_MAX_RETRIES", "2"))
+TTS_BACKOFF_BASE_SECONDS = float(os.getenv("TTS_BACKOFF_BASE_SECONDS", "0.3"))
+TTS_BACKOFF_MAX_SECONDS = float(os.getenv("TTS_BACKOFF_MAX_SECONDS", "3"))
+TTS_BREAKER_FAILURES = int(os.getenv("TTS_BREAKER_FAILURES", "5"))
+TTS_BREAKER_RESET_SECONDS = float(os.getenv("TTS_BREAKER_RESET_SECONDS", "30"))
+# Hedged synthesis on REST routes: when the first audio byte is later than the
+# TTS_HEDGE_PERCENTILE of recent requests, an identical request goes out on
+# another key and the first to finish wins. Extra requests are capped at
+# TTS_HEDGE_MAX_EXTRA of all requests.
+TTS_HEDGE = os.getenv("TTS_HEDGE", "false").lower() == "true"
+TTS_HEDGE_PERCENTILE = float(os.getenv("TTS_HEDGE_PERCENTILE", "0.9"))
+TTS_HEDGE_MAX_EXTRA = float(os.getenv("TTS_HEDGE_MAX_EXTRA", "0.1"))
+TTS_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("TTS_HEDGE_MIN_DELAY_SECONDS", "0.5"))
+TTS_HEDGE_INITIAL_DELAY_SECONDS = float(os.getenv("TTS_HEDGE_INITIAL_DELAY_SECONDS", "3"))
+
 ADMIN_CONTACT = os.getenv("ADMIN_CONTACT", "t.me/sellmodel")
 WEBSITE_URL   = os.getenv("WEBSITE_URL", "modelboxbd.com")
 
@@ -23,9 +50,18 @@ WEBSITE_URL   = os.getenv("WEBSITE_URL", "modelboxbd.com")
 DB_PATH = os.getenv("DB_PATH", "file.db")
 VOICES_DIR = os.getenv("VOICES_DIR", "voices")
 
+# Conversation state (admin steps etc.): "memory" for a single process,
+# "sqlite" to share it between several bot workers.
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", DB_PATH)
+STATE_TTL_SECONDS = int(os.getenv("STATE_TTL_SECONDS", "900"))
+# Only the process holding this lease in the state store runs scheduled jobs
+SCHEDULER_LEASE_SECONDS = float(os.getenv("SCHEDULER_LEASE_SECONDS", "60"))
+
 COST_PER_VOICE = 1
 REQUIRE_VALIDITY_FOR_TTS = False
 MAX_TTS_CHARS = int(os.getenv("MAX_TTS_CHARS", "200"))
+INLINE_RESULTS_LIMIT = int(os.getenv("INLINE_RESULTS_LIMIT", "20"))  # Telegram allows up to 50
 
 DEFAULT_MODELS = [
     {"id": "a5e5bbe15fb6465fb113c1bab4de8b2e", "name": "Marie"},
@@ -43,11 +79,97 @@ DEFAULT_MODELS = [
 USE_CONFIG_MODELS_ONLY = True
 
 PLANS = [
-    {"name": "Starter", "credits": 50, "price": "$5", "validity_days": 30},
-    {"name": "Pro", "credits": 200, "price": "$15", "validity_days": 30},
-    {"name": "Unlimited-Day", "credits": 400, "price": "$30", "validity_days": 30},
+    {"name": "Starter", "credits": 50, "price": "$5", "validity_days": 30, "encoding": "standard"},
+    {"name": "Pro", "credits": 200, "price": "$15", "validity_days": 30, "encoding": "high"},
+    {"name": "Unlimited-Day", "credits": 400, "price": "$30", "validity_days": 30, "encoding": "high"},
 ]
 
+# Named audio encodings (format opus/mp3, bitrate kbps, optional sample rate).
+# A plan picks one via "encoding"; users may opt down to a smaller one.
+# ENCODING_PROFILES_JSON adds or replaces profiles: {"name": {"format", "bitrate", "sample_rate"?}}
+ENCODING_PROFILES = {
+    "economy": {"format": "opus", "bitrate": 24},
+    "standard": {"format": "opus", "bitrate": 32},
+    "high": {"format": "opus", "bitrate": 48},
+}
+ENCODING_PROFILES_JSON = os.getenv("ENCODING_PROFILES_JSON", "")
+# Used for users without a plan; FREE_ENCODING_PROFILE (if set) for users who aren't premium
+DEFAULT_ENCODING_PROFILE = os.getenv("DEFAULT_ENCODING_PROFILE", "high")
+FREE_ENCODING_PROFILE = os.getenv("FREE_ENCODING_PROFILE", "")
+
+# Text clean-up before synthesis (normalizer.py): what follows each kind of
+# pause, how URLs are read ("host", "keep", "drop") and whether emoji are dropped.
+# TEXT_PAUSES_JSON overrides single rules, e.g. {"comma": " "}
+TEXT_PAUSES = {
+    "sentence": "\n",      # . ! ?
+    "ellipsis": " ",       # ... / …
+    "comma": " … ",
+    "clause": " ",         # ; :
+    "paragraph": "\n",     # line breaks in the message
+}
+TEXT_PAUSES_JSON = os.getenv("TEXT_PAUSES_JSON", "")
+TEXT_URL_MODE = os.getenv("TEXT_URL_MODE", "host")
+TEXT_DROP_EMOJI = os.getenv("TEXT_DROP_EMOJI", "true").lower() == "true"
+
+# Run on AsyncTeleBot + asyncio instead of the threaded TeleBot runtime
+USE_ASYNC_RUNTIME = os.getenv("USE_ASYNC_RUNTIME", "false").lower() == "true"
+
+# Seconds in-flight work gets to finish after SIGTERM before it is checkpointed
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("DRAIN_TIMEOUT_SECONDS", "25"))
+
+# Periodic maintenance (cron expressions are UTC)
+EXPIRY_CLEANUP_INTERVAL_SECONDS = int(os.getenv("EXPIRY_CLEANUP_INTERVAL_SECONDS", "3600"))
+EXPIRY_REMINDER_HOURS = int(os.getenv("EXPIRY_REMINDER_HOURS", "24"))
+SCHEDULE_VOICE_GC = os.getenv("SCHEDULE_VOICE_GC", "30 3 * * *")
+SCHEDULE_DB_MAINTENANCE = os.getenv("SCHEDULE_DB_MAINTENANCE", "15 4 * * *")
+METRICS_FLUSH_INTERVAL_SECONDS = int(os.getenv("METRICS_FLUSH_INTERVAL_SECONDS", "300"))
+
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "120"))
+
+# Logging: JSON lines with a correlation id per update; INFO records are kept
+# for LOG_SAMPLE_RATE of updates, warnings/errors always
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_JSON = os.getenv("LOG_JSON", "true").lower() == "true"
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+# Extra bots hosted in this process, as a JSON list of
+# {"name", "token", "db_path"?, "voices_dir"?, "admin_ids"?, "models"?, "plans"?}
+TENANTS_JSON = os.getenv("TENANTS_JSON", "")
+
+# Voice files on disk (content-addressed under <voices dir>/objects): byte quotas
+# per user and for the whole store, and a maximum age; 0 disables each limit.
+# Per-user quota and age are off by default: eviction deletes users' files.
+# Evicted voices stay resendable from Telegram by file_id.
+VOICE_USER_QUOTA_MB = float(os.getenv("VOICE_USER_QUOTA_MB", "0"))
+VOICE_GLOBAL_QUOTA_MB = float(os.getenv("VOICE_GLOBAL_QUOTA_MB", "5120"))
+VOICE_MAX_AGE_DAYS = int(os.getenv("VOICE_MAX_AGE_DAYS", "0"))
+SCHEDULE_VOICE_RETENTION = os.getenv("SCHEDULE_VOICE_RETENTION", "45 3 * * *")
+
+# Model picker previews: one short clip per catalog voice, synthesized once per
+# voice id and re-sent by Telegram file_id; an empty PREVIEW_TEXT disables them
+PREVIEW_TEXT = os.getenv("PREVIEW_TEXT", "Hi! This is how I sound. Send me any text and I will read it for you.")
+PREVIEW_ENCODING_PROFILE = os.getenv("PREVIEW_ENCODING_PROFILE", "standard")
+PREVIEW_REFRESH_INTERVAL_SECONDS = int(os.getenv("PREVIEW_REFRESH_INTERVAL_SECONDS", "21600"))
+
+# In-memory LRU of synthesized audio shared by all tenants
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Outbound Telegram calls: Bot API flood limits (per bot token), share of the
+# global rate kept free for interactive replies, HTTP keep-alive pool size
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_GROUP_RATE_PER_MINUTE = float(os.getenv("TELEGRAM_GROUP_RATE_PER_MINUTE", "20"))
+TELEGRAM_BULK_RESERVE = float(os.getenv("TELEGRAM_BULK_RESERVE", "0.3"))
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "32"))
+# a 429 asking for a longer pause than this is surfaced instead of waited out
+TELEGRAM_MAX_RETRY_AFTER_SECONDS = float(os.getenv("TELEGRAM_MAX_RETRY_AFTER_SECONDS", "60"))
+
 USE_WEBHOOK = os.getenv("USE_WEBHOOK", "false").lower() == "true"
 WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+# Checked against X-Telegram-Bot-Api-Secret-Token; empty = derived from each bot token
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Re-registering a webhook that lacks the secret: at most once per interval, and only
+# for a Telegram-looking update or after this many header-less POSTs in a row
+WEBHOOK_HEAL_INTERVAL_SECONDS = float(os.getenv("WEBHOOK_HEAL_INTERVAL_SECONDS", "600"))
+WEBHOOK_HEAL_AFTER_MISSES = int(os.getenv("WEBHOOK_HEAL_AFTER_MISSES", "5"))
 PORT = int(os.getenv("PORT", "8000"))
@@ -1,14 +1,108 @@
+import asyncio
+import functools
+import logging
+import re
 import sqlite3
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set, Tuple, Iterator, Sequence
+
+USER_COLUMNS = (
+    "id",
+    "username",
+    "is_premium",
+    "credits",
+    "validity_expire_at",
+    "validity_start_at",
+    "selected_model",
+    "tts_speed",
+    "created_at",
+    "updated_at",
+    "expiry_reminded_for",
+    "plan",
+    "encoding_profile",
+)
+
+# Counters kept in stats_totals (bucket 'all'), stats_hourly and stats_daily;
+# bumped in the same transaction as the write they count
+STATS_COUNTERS = (
+    "new_users",
+    "voices",
+    "chars",
+    "audio_bytes",
+    "credits_sold",
+    "credits_consumed",
+    "credits_removed",
+    "tts_ok",
+    "tts_errors",
+    "tts_ms",
+)
+STATS_HOURLY_KEEP_DAYS = 14
+
+log = logging.getLogger("db")
+
+_record_types: Dict[Tuple[str, ...], type] = {}
+
+
+def user_record_type(columns: Sequence[str]) -> type:
+    """Tuple-backed (namedtuple, no per-row dict) record class for a column subset."""
+    key = tuple(columns)
+    cls = _record_types.get(key)
+    if cls is None:
+        unknown = [c for c in key if c not in USER_COLUMNS]
+        if unknown or "id" not in key:
+            raise ValueError(f"invalid user columns: {unknown or 'id is required'}")
+        cls = _record_types.setdefault(key, namedtuple("UserRecord", key))
+    return cls
+
+
+def _locked(method):
+    """
+    Run a Database method under the connection lock. The one connection is
+    shared by handler threads, the scheduler and the webhook thread, so a
+    multi-statement write must not interleave with another thread's
+    statements, commit or rollback.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def validity_active(user: Optional[Dict[str, Any]]) -> bool:
+    """Whether a user row has a validity period that hasn't ended yet."""
+    exp = (user or {}).get("validity_expire_at")
+    if not exp:
+        return False
+    try:
+        return datetime.fromisoformat(exp) > datetime.utcnow()
+    except Exception:
+        return False
 
 
 class Database:
     def __init__(self, path: str):
         self.conn = sqlite3.connect(path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()  # see _locked
+        self.has_fts = False
+        self._init_pragmas()
         self._init_schema()
 
+    def _init_pragmas(self):
+        cur = self.conn.cursor()
+        # lets maintenance hand free pages back; only applies to a new, empty
+        # file (an existing one keeps auto_vacuum=NONE until a one-off VACUUM)
+        cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # readers don't block the writer; persistent, so set once per file
+        cur.execute("PRAGMA journal_mode = WAL")
+
+    @_locked
     def _init_schema(self):
         cur = self.conn.cursor()
         cur.execute(
@@ -53,6 +147,77 @@ class Database:
             """
         )
 
+        # Materialized per-user usage (maintained by store_voice)
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_usage (
+                user_id INTEGER PRIMARY KEY,
+                voices_generated INTEGER DEFAULT 0,
+                voices_saved INTEGER DEFAULT 0,
+                chars_synthesized INTEGER DEFAULT 0,
+                audio_bytes INTEGER DEFAULT 0,
+                last_activity_at TEXT
+            )
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_usage_daily (
+                user_id INTEGER,
+                day TEXT,
+                voices INTEGER DEFAULT 0,
+                chars INTEGER DEFAULT 0,
+                audio_bytes INTEGER DEFAULT 0,
+                PRIMARY KEY (user_id, day)
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_voices_user ON voices (user_id, created_at)")
+        # Content-addressed audio files (voice_store.py); voices rows point at them by hash
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS voice_blobs (
+                hash TEXT PRIMARY KEY,
+                path TEXT,
+                size INTEGER DEFAULT 0,
+                created_at TEXT,
+                last_used_at TEXT
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_voice_blobs_lru ON voice_blobs (last_used_at)")
+        # Model picker sample clips (previews.py), one per catalog voice id
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS voice_previews (
+                voice_id TEXT PRIMARY KEY,
+                path TEXT,
+                file_id TEXT,
+                created_at TEXT
+            )
+            """
+        )
+        # Admin dashboard aggregates (see STATS_COUNTERS); premium_users is a gauge kept by triggers
+        counters = ", ".join(f"{c} INTEGER DEFAULT 0" for c in STATS_COUNTERS)
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_totals'")
+        stats_existed = cur.fetchone() is not None
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS stats_totals (bucket TEXT PRIMARY KEY, {counters}, premium_users INTEGER DEFAULT 0)"
+        )
+        cur.execute(f"CREATE TABLE IF NOT EXISTS stats_hourly (bucket TEXT PRIMARY KEY, {counters})")
+        cur.execute(f"CREATE TABLE IF NOT EXISTS stats_daily (bucket TEXT PRIMARY KEY, {counters})")
+        # Work checkpointed by a draining process, resumed by the next one
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pending_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT,
+                payload TEXT,
+                created_at TEXT
+            )
+            """
+        )
+
         # Migration safety
         try:
             cur.execute("ALTER TABLE users ADD COLUMN tts_speed TEXT")
@@ -64,16 +229,155 @@ class Database:
         except Exception:
             pass
 
+        try:
+            cur.execute("ALTER TABLE users ADD COLUMN expiry_reminded_for TEXT")
+        except Exception:
+            pass
+
+        # plan name (picks the encoding profile) and the user's own encoding choice
+        for col in ("plan TEXT", "encoding_profile TEXT"):
+            try:
+                cur.execute(f"ALTER TABLE users ADD COLUMN {col}")
+            except Exception:
+                pass
+
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_users_validity ON users (validity_expire_at)")
+
+        # voice text + Telegram file_id, for inline search / resend without re-upload;
+        # blob_hash/size for voices kept in the content-addressed store
+        for col in ("text TEXT", "file_id TEXT", "blob_hash TEXT", "size INTEGER DEFAULT 0"):
+            try:
+                cur.execute(f"ALTER TABLE voices ADD COLUMN {col}")
+            except Exception:
+                pass
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_voices_blob ON voices (blob_hash)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_voices_path ON voices (file_path)")
+        self._init_voice_search(cur)
+
+        # Backfill counters once for databases created before user_usage existed
+        cur.execute("SELECT 1 FROM user_usage LIMIT 1")
+        if cur.fetchone() is None:
+            cur.execute(
+                """
+                INSERT INTO user_usage (user_id, voices_generated, voices_saved, last_activity_at)
+                SELECT user_id, COUNT(*), COUNT(*), MAX(created_at) FROM voices GROUP BY user_id
+                """
+            )
+        self._init_stats(cur, backfill=not stats_existed)
+
         self.conn.commit()
 
+    def _init_voice_search(self, cur):
+        """FTS5 index over voices.text kept in sync by triggers; LIKE search is used if FTS5 is missing."""
+        try:
+            cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'voices_fts'")
+            existed = cur.fetchone() is not None
+            cur.execute(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS voices_fts USING fts5(
+                    text, user_id UNINDEXED, content='voices', content_rowid='id', tokenize='unicode61'
+                )
+                """
+            )
+            cur.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS voices_fts_ai AFTER INSERT ON voices BEGIN
+                    INSERT INTO voices_fts (rowid, text, user_id) VALUES (new.id, new.text, new.user_id);
+                END
+                """
+            )
+            cur.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS voices_fts_ad AFTER DELETE ON voices BEGIN
+                    INSERT INTO voices_fts (voices_fts, rowid, text, user_id) VALUES ('delete', old.id, old.text, old.user_id);
+                END
+                """
+            )
+            cur.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS voices_fts_au AFTER UPDATE OF text ON voices BEGIN
+                    INSERT INTO voices_fts (voices_fts, rowid, text, user_id) VALUES ('delete', old.id, old.text, old.user_id);
+                    INSERT INTO voices_fts (rowid, text, user_id) VALUES (new.id, new.text, new.user_id);
+                END
+                """
+            )
+            if not existed:
+                cur.execute("INSERT INTO voices_fts (voices_fts) VALUES ('rebuild')")
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            self.has_fts = False
+
+    def _init_stats(self, cur, backfill: bool):
+        """Premium gauge triggers, and a one-time backfill (one scan) for databases that predate the stats."""
+        cur.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS users_stats_premium_ins AFTER INSERT ON users WHEN NEW.is_premium = 1 BEGIN
+                UPDATE stats_totals SET premium_users = premium_users + 1 WHERE bucket = 'all';
+            END
+            """
+        )
+        cur.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS users_stats_premium_upd AFTER UPDATE OF is_premium ON users
+            WHEN COALESCE(OLD.is_premium, 0) != COALESCE(NEW.is_premium, 0) BEGIN
+                UPDATE stats_totals SET premium_users = premium_users + (CASE WHEN NEW.is_premium = 1 THEN 1 ELSE -1 END)
+                WHERE bucket = 'all';
+            END
+            """
+        )
+        if not backfill:
+            return
+        cur.execute(
+            """
+            INSERT OR IGNORE INTO stats_totals (bucket, new_users, premium_users, voices, chars, audio_bytes)
+            SELECT 'all',
+                   (SELECT COUNT(*) FROM users),
+                   (SELECT COUNT(*) FROM users WHERE is_premium = 1),
+                   (SELECT COALESCE(SUM(voices_generated), 0) FROM user_usage),
+                   (SELECT COALESCE(SUM(chars_synthesized), 0) FROM user_usage),
+                   (SELECT COALESCE(SUM(audio_bytes), 0) FROM user_usage)
+            """
+        )
+        cur.execute(
+            """
+            INSERT OR IGNORE INTO stats_daily (bucket, voices, chars, audio_bytes)
+            SELECT day, SUM(voices), SUM(chars), SUM(audio_bytes) FROM user_usage_daily GROUP BY day
+            """
+        )
+
+    def _bump_stats(self, cur, now: datetime, deltas: Dict[str, int]):
+        """
+        Add `deltas` to the totals and to this hour's and day's rollups. The
+        caller holds the lock (it is a @_locked write, like the statements
+        that fire the premium triggers) and commits.
+        """
+        cols = [c for c, v in deltas.items() if v]
+        if not cols:
+            return
+        values = [int(deltas[c]) for c in cols]
+        names = ", ".join(cols)
+        marks = ", ".join("?" for _ in cols)
+        sets = ", ".join(f"{c} = {c} + excluded.{c}" for c in cols)
+        for table, bucket in (
+            ("stats_totals", "all"),
+            ("stats_hourly", now.strftime("%Y-%m-%dT%H")),
+            ("stats_daily", now.strftime("%Y-%m-%d")),
+        ):
+            cur.execute(
+                f"INSERT INTO {table} (bucket, {names}) VALUES (?, {marks}) ON CONFLICT(bucket) DO UPDATE SET {sets}",
+                (bucket, *values),
+            )
+
     # -------------------
     # SETTINGS
     # -------------------
+    @_locked
     def set_setting(self, key: str, value: str):
         cur = self.conn.cursor()
         cur.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
         self.conn.commit()
 
+    @_locked
     def get_setting(self, key: str, default: str = "") -> str:
         cur = self.conn.cursor()
         cur.execute("SELECT value FROM settings WHERE key = ?", (key,))
@@ -83,24 +387,28 @@ class Database:
     # -------------------
     # USERS
     # -------------------
+    @_locked
     def ensure_user(self, user_id: int, username: Optional[str]):
         cur = self.conn.cursor()
         cur.execute("SELECT id FROM users WHERE id = ?", (user_id,))
         row = cur.fetchone()
-        now = datetime.utcnow().isoformat()
+        now = datetime.utcnow()
         if not row:
             cur.execute(
                 "INSERT INTO users (id, username, is_premium, credits, tts_speed, created_at, updated_at) VALUES (?, ?, 0, 0, ?, ?, ?)",
-                (user_id, username, "natural", now, now),
+                (user_id, username, "natural", now.isoformat(), now.isoformat()),
             )
+            self._bump_stats(cur, now, {"new_users": 1})
             self.conn.commit()
 
+    @_locked
     def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
         cur = self.conn.cursor()
         cur.execute("SELECT * FROM users WHERE id = ?", (user_id,))
         row = cur.fetchone()
         return dict(row) if row else None
 
+    @_locked
     def update_user_fields(self, user_id: int, fields: Dict[str, Any]):
         if not fields:
             return
@@ -112,22 +420,73 @@ class Database:
         cur.execute(f"UPDATE users SET {set_clause} WHERE id = ?", (*values, user_id))
         self.conn.commit()
 
+    @_locked
     def add_credits(self, user_id: int, amount: int):
+        now = datetime.utcnow()
         cur = self.conn.cursor()
         cur.execute(
             "UPDATE users SET credits = COALESCE(credits,0) + ?, is_premium = 1, updated_at = ? WHERE id = ?",
-            (amount, datetime.utcnow().isoformat(), user_id),
+            (amount, now.isoformat(), user_id),
         )
+        if cur.rowcount:
+            self._bump_stats(cur, now, {"credits_sold": max(0, amount)})
         self.conn.commit()
 
-    def remove_credits(self, user_id: int, amount: int):
-        user = self.get_user(user_id)
-        if not user:
-            return
-        new_credits = max(0, int(user.get("credits") or 0) - amount)
-        is_premium = 1 if new_credits > 0 and self.is_valid(user_id) else 0
-        self.update_user_fields(user_id, {"credits": new_credits, "is_premium": is_premium})
+    @_locked
+    def remove_credits(self, user_id: int, amount: int, consumed: bool = True) -> bool:
+        """
+        Take `amount` credits in one UPDATE. A voice (`consumed=True`) is only
+        charged when the user has that many: False and nothing taken
+        otherwise. An admin taking credits back (`consumed=False`) clamps the
+        balance at zero instead; False only when there is no such user.
+        """
+        now = datetime.utcnow()
+        now_iso = now.isoformat()
+        cur = self.conn.cursor()
+        if consumed:
+            guard, params = " AND COALESCE(credits, 0) >= ?", (amount,)
+            taken = amount
+        else:
+            row = cur.execute("SELECT COALESCE(credits, 0) FROM users WHERE id = ?", (user_id,)).fetchone()
+            guard, params = "", ()
+            taken = min(max(0, row[0]), amount) if row else 0
+        # the right-hand sides all see the row as it was before the update
+        cur.execute(
+            f"""
+            UPDATE users SET credits = MAX(COALESCE(credits, 0) - ?, 0),
+                is_premium = CASE WHEN COALESCE(credits, 0) - ? > 0 AND validity_expire_at > ? THEN 1 ELSE 0 END,
+                updated_at = ?
+            WHERE id = ?{guard}
+            """,
+            (amount, amount, now_iso, now_iso, user_id, *params),
+        )
+        if not cur.rowcount:
+            self.conn.commit()
+            return False
+        self._bump_stats(cur, now, {"credits_consumed" if consumed else "credits_removed": taken})
+        self.conn.commit()
+        return True
+
+    @_locked
+    def refund_credits(self, user_id: int, amount: int):
+        """Give back credits reserved for a voice that was never sent; undoes the consumption, not a sale."""
+        now = datetime.utcnow()
+        now_iso = now.isoformat()
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            UPDATE users SET credits = COALESCE(credits, 0) + ?,
+                is_premium = CASE WHEN COALESCE(credits, 0) + ? > 0 AND validity_expire_at > ? THEN 1 ELSE 0 END,
+                updated_at = ?
+            WHERE id = ?
+            """,
+            (amount, amount, now_iso, now_iso, user_id),
+        )
+        if cur.rowcount:
+            self._bump_stats(cur, now, {"credits_consumed": -amount})
+        self.conn.commit()
 
+    @_locked
     def set_validity(self, user_id: int, days: int):
         now = datetime.utcnow()
         expire_at = (now + timedelta(days=days)).isoformat()
@@ -142,30 +501,120 @@ class Database:
             },
         )
 
+    @_locked
+    def bulk_grant(self, grants: List[Tuple[int, int, int]]):
+        """
+        Apply (user_id, credits, days) grants in one transaction, with the same
+        effect as ensure_user + add_credits + set_validity per row.
+        """
+        now = datetime.utcnow()
+        now_iso = now.isoformat()
+        cur = self.conn.cursor()
+        try:
+            cur.executemany(
+                "INSERT OR IGNORE INTO users (id, username, is_premium, credits, tts_speed, created_at, updated_at) VALUES (?, NULL, 0, 0, ?, ?, ?)",
+                [(uid, "natural", now_iso, now_iso) for uid, _, _ in grants],
+            )
+            self._bump_stats(
+                cur, now, {"new_users": cur.rowcount, "credits_sold": sum(c for _, c, _ in grants if c > 0)}
+            )
+            cur.executemany(
+                "UPDATE users SET credits = COALESCE(credits,0) + ?, is_premium = 1, updated_at = ? WHERE id = ?",
+                [(credits, now_iso, uid) for uid, credits, _ in grants if credits > 0],
+            )
+            cur.executemany(
+                """
+                UPDATE users SET validity_start_at = ?, validity_expire_at = ?,
+                    is_premium = CASE WHEN COALESCE(credits,0) > 0 THEN 1 ELSE 0 END, updated_at = ?
+                WHERE id = ?
+                """,
+                [(now_iso, (now + timedelta(days=days)).isoformat(), now_iso, uid) for uid, _, days in grants if days > 0],
+            )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @_locked
     def remove_validity(self, user_id: int):
         self.update_user_fields(
             user_id,
             {"validity_start_at": None, "validity_expire_at": None, "is_premium": 0},
         )
 
+    @_locked
     def is_valid(self, user_id: int) -> bool:
-        user = self.get_user(user_id)
-        if not user:
-            return False
-        exp = user.get("validity_expire_at")
-        if not exp:
-            return False
-        try:
-            return datetime.fromisoformat(exp) > datetime.utcnow()
-        except Exception:
-            return False
+        return validity_active(self.get_user(user_id))
 
+    @_locked
     def list_users(self, limit: int = 100) -> List[Dict[str, Any]]:
         cur = self.conn.cursor()
         cur.execute("SELECT * FROM users ORDER BY created_at DESC LIMIT ?", (limit,))
         rows = cur.fetchall()
         return [dict(r) for r in rows]
 
+    @_locked
+    def users_page(
+        self,
+        columns: Sequence[str] = ("id",),
+        after_id: int = 0,
+        limit: int = 1000,
+        where: str = "",
+        params: Sequence[Any] = (),
+    ) -> list:
+        """One keyset page (id > after_id, ordered by id) of compact user records."""
+        record = user_record_type(columns)
+        sql = f"SELECT {', '.join(record._fields)} FROM users WHERE id > ?"
+        if where:
+            sql += f" AND ({where})"
+        sql += " ORDER BY id LIMIT ?"
+        cur = self.conn.cursor()
+        cur.execute(sql, (after_id, *params, limit))
+        return [record._make(r) for r in cur.fetchall()]
+
+    def iter_users(
+        self,
+        columns: Sequence[str] = ("id",),
+        where: str = "",
+        params: Sequence[Any] = (),
+        page_size: int = 1000,
+    ) -> Iterator[Any]:
+        """
+        Stream users in id order, one keyset page at a time, as namedtuples
+        holding only `columns`. Memory stays constant however many users
+        there are, and rows updated while iterating are never revisited.
+        `where` is a trusted SQL fragment from the caller with `?` params.
+        """
+        after_id = 0
+        while True:
+            page = self.users_page(columns, after_id, page_size, where, params)
+            if not page:
+                return
+            yield from page
+            after_id = page[-1].id
+
+    @_locked
+    def list_users_expiring(self, within_hours: int) -> List[Dict[str, Any]]:
+        """Users whose validity ends within the window and who weren't reminded for that date yet."""
+        now = datetime.utcnow()
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            SELECT id, validity_expire_at FROM users
+            WHERE validity_expire_at > ? AND validity_expire_at <= ?
+              AND (expiry_reminded_for IS NULL OR expiry_reminded_for != validity_expire_at)
+            """,
+            (now.isoformat(), (now + timedelta(hours=within_hours)).isoformat()),
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+    @_locked
+    def mark_expiry_reminded(self, user_id: int, expire_at: str):
+        cur = self.conn.cursor()
+        cur.execute("UPDATE users SET expiry_reminded_for = ? WHERE id = ?", (expire_at, user_id))
+        self.conn.commit()
+
+    @_locked
     def list_premium_users(self, limit: int = 100) -> List[Dict[str, Any]]:
         cur = self.conn.cursor()
         cur.execute("SELECT * FROM users WHERE is_premium = 1 ORDER BY updated_at DESC LIMIT ?", (limit,))
@@ -175,45 +624,453 @@ class Database:
     # -------------------
     # VOICES
     # -------------------
-    def store_voice(self, user_id: int, file_path: str):
+    @_locked
+    def store_voice(
+        self,
+        user_id: int,
+        file_path: str,
+        chars: int = 0,
+        audio_bytes: int = 0,
+        text: Optional[str] = None,
+        file_id: Optional[str] = None,
+        blob_hash: Optional[str] = None,
+    ):
+        now = datetime.utcnow()
+        now_iso = now.isoformat()
         cur = self.conn.cursor()
         cur.execute(
-            "INSERT INTO voices (user_id, file_path, created_at) VALUES (?, ?, ?)",
-            (user_id, file_path, datetime.utcnow().isoformat()),
+            "INSERT INTO voices (user_id, file_path, created_at, text, file_id, blob_hash, size) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, file_path, now_iso, text, file_id, blob_hash, audio_bytes if blob_hash else 0),
+        )
+        if blob_hash:
+            # a second voice with identical audio only bumps the blob's LRU stamp
+            cur.execute(
+                """
+                INSERT INTO voice_blobs (hash, path, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(hash) DO UPDATE SET last_used_at = excluded.last_used_at
+                """,
+                (blob_hash, file_path, audio_bytes, now_iso, now_iso),
+            )
+        # counters live in the same transaction as the voice row
+        cur.execute(
+            """
+            INSERT INTO user_usage (user_id, voices_generated, voices_saved, chars_synthesized, audio_bytes, last_activity_at)
+            VALUES (?, 1, 1, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                voices_generated = voices_generated + 1,
+                voices_saved = voices_saved + 1,
+                chars_synthesized = chars_synthesized + excluded.chars_synthesized,
+                audio_bytes = audio_bytes + excluded.audio_bytes,
+                last_activity_at = excluded.last_activity_at
+            """,
+            (user_id, chars, audio_bytes, now_iso),
+        )
+        cur.execute(
+            """
+            INSERT INTO user_usage_daily (user_id, day, voices, chars, audio_bytes) VALUES (?, ?, 1, ?, ?)
+            ON CONFLICT(user_id, day) DO UPDATE SET
+                voices = voices + 1,
+                chars = chars + excluded.chars,
+                audio_bytes = audio_bytes + excluded.audio_bytes
+            """,
+            (user_id, now.strftime("%Y-%m-%d"), chars, audio_bytes),
         )
+        self._bump_stats(cur, now, {"voices": 1, "chars": chars, "audio_bytes": audio_bytes})
         self.conn.commit()
 
+    @_locked
+    def get_usage_summary(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """User row + usage counters + default voice in one indexed point read."""
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            SELECT u.*,
+                   COALESCE(g.voices_generated, 0) AS voices_generated,
+                   COALESCE(g.voices_saved, 0) AS voices_saved,
+                   COALESCE(g.chars_synthesized, 0) AS chars_synthesized,
+                   COALESCE(g.audio_bytes, 0) AS audio_bytes,
+                   g.last_activity_at AS last_activity_at,
+                   (SELECT value FROM settings WHERE key = 'default_voice_id') AS default_voice_id
+            FROM users u
+            LEFT JOIN user_usage g ON g.user_id = u.id
+            WHERE u.id = ?
+            """,
+            (user_id,),
+        )
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+    @_locked
     def list_user_voices(self, user_id: int) -> List[Dict[str, Any]]:
         cur = self.conn.cursor()
         cur.execute("SELECT * FROM voices WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
         rows = cur.fetchall()
         return [dict(r) for r in rows]
 
-    def delete_user_voices(self, user_id: int):
+    @_locked
+    def search_voices(self, user_id: int, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        The user's sent voices whose text matches `query`: word-prefix match
+        through FTS5 first, then substring match; an empty query lists the
+        most recent ones. Only voices with a Telegram file_id are returned.
+        """
+        query = (query or "").strip()
+        cur = self.conn.cursor()
+        if not query:
+            cur.execute(
+                "SELECT id, text, file_id FROM voices WHERE user_id = ? AND file_id IS NOT NULL ORDER BY id DESC LIMIT ?",
+                (user_id, limit),
+            )
+            return [dict(r) for r in cur.fetchall()]
+
+        rows = []
+        terms = re.findall(r"\w+", query)
+        if self.has_fts and terms:
+            # each term is an FTS5 string (quotes doubled) with a prefix star,
+            # so nothing the user types is parsed as query syntax
+            match = " ".join('"%s"*' % t.replace('"', '""') for t in terms)
+            try:
+                cur.execute(
+                    """
+                    SELECT v.id, v.text, v.file_id FROM voices_fts f
+                    JOIN voices v ON v.id = f.rowid
+                    WHERE voices_fts MATCH ? AND f.user_id = ? AND v.file_id IS NOT NULL
+                    ORDER BY f.rank LIMIT ?
+                    """,
+                    (match, user_id, limit),
+                )
+                rows = [dict(r) for r in cur.fetchall()]
+            except sqlite3.OperationalError:
+                log.exception("voice FTS search failed, falling back to LIKE", extra={"match": match})
+        if not rows:
+            escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            cur.execute(
+                """
+                SELECT id, text, file_id FROM voices
+                WHERE user_id = ? AND file_id IS NOT NULL AND text LIKE ? ESCAPE '\\'
+                ORDER BY id DESC LIMIT ?
+                """,
+                (user_id, f"%{escaped}%", limit),
+            )
+            rows = [dict(r) for r in cur.fetchall()]
+        return rows
+
+    @_locked
+    def known_voice_paths(self, paths: Sequence[str], chunk: int = 500) -> Set[str]:
+        """The subset of `paths` some voices row points at; indexed lookups, `chunk` paths each."""
+        paths = list(paths)
+        found = set()
         cur = self.conn.cursor()
+        for i in range(0, len(paths), chunk):
+            part = paths[i : i + chunk]
+            marks = ", ".join("?" for _ in part)
+            cur.execute(f"SELECT file_path FROM voices WHERE file_path IN ({marks})", part)
+            found.update(r[0] for r in cur.fetchall())
+        return found
+
+    @_locked
+    def delete_user_voices(self, user_id: int) -> List[str]:
+        """Delete the user's voice rows; returns the blob hashes they referenced."""
+        cur = self.conn.cursor()
+        cur.execute("SELECT DISTINCT blob_hash FROM voices WHERE user_id = ? AND blob_hash IS NOT NULL", (user_id,))
+        hashes = [r[0] for r in cur.fetchall()]
         cur.execute("DELETE FROM voices WHERE user_id = ?", (user_id,))
+        cur.execute("UPDATE user_usage SET voices_saved = 0 WHERE user_id = ?", (user_id,))
         self.conn.commit()
+        return hashes
+
+    # -------------------
+    # VOICE BLOBS (voice_store.py)
+    # -------------------
+    @_locked
+    def user_stored_bytes(self, user_id: int) -> int:
+        cur = self.conn.cursor()
+        cur.execute("SELECT COALESCE(SUM(size), 0) FROM voices WHERE user_id = ? AND blob_hash IS NOT NULL", (user_id,))
+        return int(cur.fetchone()[0])
+
+    @_locked
+    def total_blob_bytes(self) -> int:
+        cur = self.conn.cursor()
+        cur.execute("SELECT COALESCE(SUM(size), 0) FROM voice_blobs")
+        return int(cur.fetchone()[0])
+
+    @_locked
+    def oldest_stored_voices(self, user_id: int, limit: int = 50) -> List[Tuple[int, str, int]]:
+        """(voice id, blob hash, size) of the user's on-disk voices, oldest first."""
+        cur = self.conn.cursor()
+        cur.execute(
+            "SELECT id, blob_hash, size FROM voices WHERE user_id = ? AND blob_hash IS NOT NULL ORDER BY id LIMIT ?",
+            (user_id, limit),
+        )
+        return [tuple(r) for r in cur.fetchall()]
+
+    @_locked
+    def stored_voices_before(self, cutoff_iso: str, limit: int = 1000) -> List[Tuple[int, str, int]]:
+        cur = self.conn.cursor()
+        cur.execute(
+            "SELECT id, blob_hash, size FROM voices WHERE blob_hash IS NOT NULL AND created_at < ? ORDER BY id LIMIT ?",
+            (cutoff_iso, limit),
+        )
+        return [tuple(r) for r in cur.fetchall()]
+
+    @_locked
+    def lru_blobs(self, limit: int = 200) -> List[Tuple[str, int]]:
+        cur = self.conn.cursor()
+        cur.execute("SELECT hash, size FROM voice_blobs ORDER BY last_used_at LIMIT ?", (limit,))
+        return [tuple(r) for r in cur.fetchall()]
+
+    @_locked
+    def detach_voices(self, voice_ids: List[int]):
+        """
+        Forget the on-disk copy of these voices. The rows (text, file_id) stay,
+        so they can still be resent from Telegram's servers.
+        """
+        cur = self.conn.cursor()
+        cur.executemany(
+            "UPDATE voices SET file_path = NULL, blob_hash = NULL, size = 0 WHERE id = ?",
+            [(int(v),) for v in voice_ids],
+        )
+        self.conn.commit()
+
+    @_locked
+    def detach_blobs(self, hashes: List[str]):
+        cur = self.conn.cursor()
+        cur.executemany(
+            "UPDATE voices SET file_path = NULL, blob_hash = NULL, size = 0 WHERE blob_hash = ?",
+            [(h,) for h in hashes],
+        )
+        self.conn.commit()
+
+    @_locked
+    def drop_unreferenced_blobs(self, hashes: List[str]) -> List[str]:
+        """Delete blob rows among `hashes` no voice points at any more; returns their file paths."""
+        cur = self.conn.cursor()
+        paths = []
+        for h in hashes:
+            cur.execute(
+                "SELECT path FROM voice_blobs WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM voices WHERE blob_hash = ?)",
+                (h, h),
+            )
+            row = cur.fetchone()
+            if row:
+                cur.execute("DELETE FROM voice_blobs WHERE hash = ?", (h,))
+                paths.append(row[0])
+        self.conn.commit()
+        return paths
+
+    @_locked
+    def blob_hashes_between(self, lo: str, hi: str) -> set:
+        """Known blob hashes in [lo, hi): one shard directory's worth, for the orphan sweep."""
+        cur = self.conn.cursor()
+        cur.execute("SELECT hash FROM voice_blobs WHERE hash >= ? AND hash < ?", (lo, hi))
+        return {r[0] for r in cur.fetchall()}
+
+    # -------------------
+    # VOICE PREVIEWS (previews.py)
+    # -------------------
+    @_locked
+    def get_voice_preview(self, voice_id: str) -> Optional[Dict[str, Any]]:
+        cur = self.conn.cursor()
+        cur.execute("SELECT voice_id, path, file_id, created_at FROM voice_previews WHERE voice_id = ?", (voice_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+    @_locked
+    def set_voice_preview(self, voice_id: str, path: str):
+        """A freshly rendered clip; any file_id of an earlier render no longer applies."""
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO voice_previews (voice_id, path, file_id, created_at) VALUES (?, ?, NULL, ?)
+            ON CONFLICT(voice_id) DO UPDATE SET path = excluded.path, file_id = NULL, created_at = excluded.created_at
+            """,
+            (voice_id, path, datetime.utcnow().isoformat()),
+        )
+        self.conn.commit()
+
+    @_locked
+    def set_voice_preview_file_id(self, voice_id: str, file_id: Optional[str]):
+        cur = self.conn.cursor()
+        cur.execute("UPDATE voice_previews SET file_id = ? WHERE voice_id = ?", (file_id, voice_id))
+        self.conn.commit()
+
+    @_locked
+    def voice_preview_ids(self) -> set:
+        cur = self.conn.cursor()
+        cur.execute("SELECT voice_id FROM voice_previews")
+        return {r[0] for r in cur.fetchall()}
+
+    @_locked
+    def delete_voice_previews(self, voice_ids: List[str]) -> List[str]:
+        """Forget the previews of voices that left the catalog; returns their file paths."""
+        cur = self.conn.cursor()
+        paths = []
+        for voice_id in voice_ids:
+            cur.execute("SELECT path FROM voice_previews WHERE voice_id = ?", (voice_id,))
+            row = cur.fetchone()
+            if row:
+                cur.execute("DELETE FROM voice_previews WHERE voice_id = ?", (voice_id,))
+                if row[0]:
+                    paths.append(row[0])
+        self.conn.commit()
+        return paths
+
+    # -------------------
+    # STATS (admin dashboard)
+    # -------------------
+    @_locked
+    def record_tts(self, ok: bool, ms: float = 0.0):
+        """One upstream synthesis (cache hits excluded): outcome and latency."""
+        now = datetime.utcnow()
+        cur = self.conn.cursor()
+        if ok:
+            self._bump_stats(cur, now, {"tts_ok": 1, "tts_ms": round(ms)})
+        else:
+            self._bump_stats(cur, now, {"tts_errors": 1})
+        self.conn.commit()
+
+    @_locked
+    def get_stats(self, days: int = 7) -> Dict[str, Any]:
+        """
+        Dashboard numbers from the aggregate tables only: the totals row, the
+        last 24 hourly rows and the last `days` daily rows, whatever the size
+        of users/voices.
+        """
+        now = datetime.utcnow()
+        cur = self.conn.cursor()
+        cur.execute("SELECT * FROM stats_totals WHERE bucket = 'all'")
+        row = cur.fetchone()
+        totals = dict(row) if row else {}
+        sums = ", ".join(f"COALESCE(SUM({c}), 0) AS {c}" for c in STATS_COUNTERS)
+        cur.execute(
+            f"SELECT {sums} FROM stats_hourly WHERE bucket > ?",
+            ((now - timedelta(hours=24)).strftime("%Y-%m-%dT%H"),),
+        )
+        last_24h = dict(cur.fetchone())
+        cur.execute("SELECT * FROM stats_daily ORDER BY bucket DESC LIMIT ?", (days,))
+        daily = [dict(r) for r in cur.fetchall()]
+        return {"totals": totals, "last_24h": last_24h, "daily": daily, "today": now.strftime("%Y-%m-%d")}
+
+    # -------------------
+    # MAINTENANCE
+    # -------------------
+    @_locked
+    def maintenance(self) -> Dict[str, Any]:
+        """
+        Scheduled: prune old hourly stats and refresh the planner statistics;
+        truncate the WAL and free up to 1000 unused pages only when the file
+        is in WAL / incremental auto_vacuum mode. Returns what was done.
+        """
+        cur = self.conn.cursor()
+        cutoff = (datetime.utcnow() - timedelta(days=STATS_HOURLY_KEEP_DAYS)).strftime("%Y-%m-%dT%H")
+        # hourly rollups only serve the last-24h view; daily rows are kept
+        cur.execute("DELETE FROM stats_hourly WHERE bucket < ?", (cutoff,))
+        done: Dict[str, Any] = {"stats_hourly_pruned": cur.rowcount}
+        self.conn.commit()
+        cur.execute("PRAGMA optimize")
+        if cur.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            cur.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            done["wal_checkpoint"] = True
+        if cur.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:  # INCREMENTAL
+            before = cur.execute("PRAGMA freelist_count").fetchone()[0]
+            # runs one page per step: fetchall() drives it to the end
+            cur.execute("PRAGMA incremental_vacuum(1000)").fetchall()
+            done["pages_freed"] = before - cur.execute("PRAGMA freelist_count").fetchone()[0]
+        self.conn.commit()
+        log.info("sqlite maintenance", extra=done)
+        return done
+
+    @_locked
+    def checkpoint(self):
+        """Copy the WAL into the main file, e.g. before the file itself is sent as a backup."""
+        self.conn.cursor().execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+    # -------------------
+    # PENDING JOBS
+    # -------------------
+    @_locked
+    def save_pending_jobs(self, jobs: List[Tuple[str, str]]):
+        now = datetime.utcnow().isoformat()
+        cur = self.conn.cursor()
+        cur.executemany(
+            "INSERT INTO pending_jobs (kind, payload, created_at) VALUES (?, ?, ?)",
+            [(kind, payload, now) for kind, payload in jobs],
+        )
+        self.conn.commit()
+
+    @_locked
+    def take_pending_jobs(self) -> List[Tuple[str, str]]:
+        cur = self.conn.cursor()
+        cur.execute("SELECT id, kind, payload FROM pending_jobs ORDER BY id")
+        rows = cur.fetchall()
+        if rows:
+            cur.execute("DELETE FROM pending_jobs WHERE id <= ?", (rows[-1]["id"],))
+            self.conn.commit()
+        return [(r["kind"], r["payload"]) for r in rows]
 
     # -------------------
     # ADMINS
     # -------------------
+    @_locked
     def get_admins(self) -> List[int]:
         cur = self.conn.cursor()
         cur.execute("SELECT user_id FROM admins")
         rows = cur.fetchall()
         return [int(r[0]) for r in rows]
 
+    @_locked
     def add_admin(self, user_id: int):
         cur = self.conn.cursor()
         cur.execute("INSERT OR IGNORE INTO admins (user_id) VALUES (?)", (user_id,))
         self.conn.commit()
 
+    @_locked
+    def add_admins(self, user_ids: List[int]):
+        cur = self.conn.cursor()
+        cur.executemany("INSERT OR IGNORE INTO admins (user_id) VALUES (?)", [(int(u),) for u in user_ids])
+        self.conn.commit()
+
+    @_locked
     def remove_admin(self, user_id: int):
         cur = self.conn.cursor()
         cur.execute("DELETE FROM admins WHERE user_id = ?", (user_id,))
         self.conn.commit()
 
+    @_locked
     def is_admin(self, user_id: int) -> bool:
         cur = self.conn.cursor()
         cur.execute("SELECT user_id FROM admins WHERE user_id = ?", (user_id,))
         return cur.fetchone() is not None
+
+
+class AsyncDatabase:
+    """
+    Awaitable facade over Database for the asyncio runtime.
+
+    Every method of the wrapped Database is exposed as a coroutine that runs
+    on a single dedicated thread, so the shared connection is never used
+    concurrently and the event loop never blocks on SQLite.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(attr, *args, **kwargs))
+
+        return call
+
+    async def run(self, fn, *args, **kwargs):
+        """Run `fn(db, *args, **kwargs)` on the DB thread (for module-level helpers taking a Database)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, self.db, *args, **kwargs))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,117 @@
+import json
+from typing import Dict, List, Optional
+from config import (
+    ENCODING_PROFILES,
+    ENCODING_PROFILES_JSON,
+    DEFAULT_ENCODING_PROFILE,
+    FREE_ENCODING_PROFILE,
+    PREVIEW_ENCODING_PROFILE,
+    FISH_AUDIO_MP3_BITRATE,
+)
+
+# Values the Fish Audio /v1/tts endpoint (and the SDK's TTSRequest) accept
+OPUS_BITRATES = (-1000, 24, 32, 48, 64)
+MP3_BITRATES = (64, 128, 192)
+# Telegram only plays these as voice messages
+EXTENSIONS = {"opus": ".ogg", "mp3": ".mp3"}
+
+
+class EncodingProfile:
+    """One named output encoding, applied identically on the REST and SDK paths."""
+
+    __slots__ = ("name", "format", "bitrate", "sample_rate")
+
+    def __init__(self, name: str, format: str, bitrate: Optional[int] = None, sample_rate: Optional[int] = None):
+        self.name = name
+        self.format = format
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def for_format(cls, format_: str, mp3_bitrate: Optional[int] = None) -> "EncodingProfile":
+        """The encoding a bare `format_` has always meant (opus at 48 kbps, mp3 at FISH_AUDIO_MP3_BITRATE)."""
+        if format_ == "opus":
+            return cls("opus", "opus", 48)
+        if format_ == "mp3":
+            bitrate = mp3_bitrate if mp3_bitrate is not None else FISH_AUDIO_MP3_BITRATE
+            return cls("mp3", "mp3", bitrate if bitrate in MP3_BITRATES else None)
+        # other formats (wav/pcm) go upstream untouched
+        return cls(format_, format_)
+
+    @property
+    def extension(self) -> str:
+        return EXTENSIONS.get(self.format, f".{self.format}")
+
+    @property
+    def key(self) -> tuple:
+        """Cache-key component: two profiles with equal keys produce identical audio."""
+        return (self.format, self.bitrate, self.sample_rate)
+
+    def request_fields(self) -> Dict:
+        """Encoding fields for a TTS request body / TTSRequest kwargs."""
+        fields = {"format": self.format}
+        if self.bitrate is not None:
+            fields["opus_bitrate" if self.format == "opus" else "mp3_bitrate"] = self.bitrate
+        if self.sample_rate:
+            fields["sample_rate"] = self.sample_rate
+        return fields
+
+    def __repr__(self):
+        return f"EncodingProfile({self.name!r}, {self.format!r}, {self.bitrate!r}, {self.sample_rate!r})"
+
+
+def load_profiles() -> Dict[str, EncodingProfile]:
+    raw = dict(ENCODING_PROFILES)
+    if ENCODING_PROFILES_JSON:
+        raw.update(json.loads(ENCODING_PROFILES_JSON))
+    profiles = {}
+    for name, spec in raw.items():
+        fmt, bitrate = spec.get("format", "opus"), spec.get("bitrate")
+        if fmt not in EXTENSIONS:
+            raise ValueError(f"Encoding profile {name}: unsupported format {fmt!r}")
+        allowed = OPUS_BITRATES if fmt == "opus" else MP3_BITRATES
+        if bitrate is not None and bitrate not in allowed:
+            raise ValueError(f"Encoding profile {name}: {fmt} bitrate must be one of {allowed}")
+        profiles[name] = EncodingProfile(name, fmt, bitrate, spec.get("sample_rate"))
+    for name in (DEFAULT_ENCODING_PROFILE, FREE_ENCODING_PROFILE, PREVIEW_ENCODING_PROFILE):
+        if name and name not in profiles:
+            raise ValueError(f"Unknown encoding profile: {name}")
+    return profiles
+
+
+PROFILES = load_profiles()
+
+
+def get_profile(name: Optional[str]) -> EncodingProfile:
+    return PROFILES.get(name or "") or PROFILES[DEFAULT_ENCODING_PROFILE]
+
+
+def _cost(profile: EncodingProfile) -> tuple:
+    # opus "auto" (-1000) sits between the fixed rates; mp3 of the same kbps is larger
+    bitrate = 40 if profile.bitrate == -1000 else (profile.bitrate or 0)
+    return (bitrate * (2 if profile.format == "mp3" else 1), profile.sample_rate or 0)
+
+
+def plan_profile(user: Dict, plans: List[Dict]) -> EncodingProfile:
+    """The best encoding the user's plan (or lack of one) entitles them to."""
+    plan_name = user.get("plan")
+    for p in plans:
+        if plan_name and p.get("name") == plan_name and p.get("encoding") in PROFILES:
+            return PROFILES[p["encoding"]]
+    if FREE_ENCODING_PROFILE and not user.get("is_premium"):
+        return PROFILES[FREE_ENCODING_PROFILE]
+    return PROFILES[DEFAULT_ENCODING_PROFILE]
+
+
+def allowed_profiles(user: Dict, plans: List[Dict]) -> List[EncodingProfile]:
+    """Profiles a user may pick for themselves: anything no larger than their plan's."""
+    cap = _cost(plan_profile(user, plans))
+    return sorted((p for p in PROFILES.values() if _cost(p) <= cap), key=_cost)
+
+
+def profile_for_user(user: Dict, plans: List[Dict]) -> EncodingProfile:
+    """The user's own choice if their plan still allows it, else the plan's profile."""
+    chosen = PROFILES.get(user.get("encoding_profile") or "")
+    if chosen is not None and _cost(chosen) <= _cost(plan_profile(user, plans)):
+        return chosen
+    return plan_profile(user, plans)
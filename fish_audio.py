@@ -1,28 +1,130 @@
+import logging
+import queue
+import threading
+import time
 import requests
 from typing import List, Dict, Optional
 from config import (
     FISH_AUDIO_API_KEY,
+    FISH_AUDIO_API_KEYS,
     FISH_AUDIO_BASE_URL,
     DEFAULT_MODELS,
     USE_CONFIG_MODELS_ONLY,
     FISH_AUDIO_BACKEND,
-    FISH_AUDIO_MP3_BITRATE,
+    FISH_AUDIO_FAILOVER,
+    TTS_DEADLINE_SECONDS,
+    TTS_HEDGE,
 )
-from fish_audio_sdk import Session, TTSRequest
+from encoding import EncodingProfile
+from key_pool import ApiKeyPool, parse_retry_after
+from resilience import CircuitOpen, Deadline, DeadlineExceeded, Hedger, RetryPolicy, Route, order_routes, parse_routes
+
+log = logging.getLogger("fish_audio")
+
+NO_FREE_KEY = "TTS failed: every API key is rate limited or busy"
+
+
+class TTSError(RuntimeError):
+    """Synthesis failure; `retryable` says whether another attempt may succeed."""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class RateLimited(TTSError):
+    """Upstream answered 429 for the key that was used."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message, retryable=True)
+        self.retry_after = retry_after
+
+
+def _http_error(status: int, err) -> TTSError:
+    return TTSError(f"HTTP {status}: {err}", retryable=status >= 500)
+
+
+def _is_transient(e: Exception) -> bool:
+    if isinstance(e, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)):
+        return True
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return True
+    status = getattr(e, "status", None)
+    if isinstance(status, int):
+        return status >= 500
+    # the SDK talks httpx; its transport errors are all worth retrying
+    return type(e).__module__.startswith("httpx") and type(e).__name__ != "HTTPStatusError"
 
 
 class FishAudioClient:
-    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
-        self.api_key = api_key or FISH_AUDIO_API_KEY
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        api_keys: Optional[List[str]] = None,
+    ):
+        keys = list(api_keys or ([api_key] if api_key else FISH_AUDIO_API_KEYS) or [FISH_AUDIO_API_KEY])
+        self.pool = ApiKeyPool(keys)
+        self.api_key = self.pool.keys[0]
         self.base_url = (base_url or FISH_AUDIO_BASE_URL).rstrip("/")
-        self.session = Session(self.api_key)
+        self._sessions: Dict[str, object] = {}
+        self.retry = RetryPolicy()
+        self.routes: List[Route] = parse_routes(FISH_AUDIO_FAILOVER, FISH_AUDIO_BACKEND)
+        self.hedger: Optional[Hedger] = Hedger() if TTS_HEDGE else None
+
+    @property
+    def session(self):
+        return self._sdk_session(self.api_key)
+
+    def _sdk_session(self, key: str):
+        # the SDK is only imported once a route actually needs it
+        sess = self._sessions.get(key)
+        if sess is None:
+            from fish_audio_sdk import Session
 
-    def _headers(self):
+            sess = self._sessions.setdefault(key, Session(key))
+        return sess
+
+    def _headers(self, api_key: Optional[str] = None):
+        api_key = api_key if api_key is not None else self.api_key
         headers = {"Accept": "application/json"}
-        if self.api_key:
-            headers["Authorization"] = f"Bearer {self.api_key}"
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        return headers
+
+    def _tts_headers(self, api_key: Optional[str] = None):
+        headers = self._headers(api_key)
+        headers["Content-Type"] = "application/json"
+        headers["Accept"] = "application/octet-stream"
         return headers
 
+    @staticmethod
+    def _tts_payload(
+        text: str,
+        voice_id: str,
+        speed: Optional[float],
+        latency: str,
+        profile: EncodingProfile,
+        backend: str = FISH_AUDIO_BACKEND,
+    ) -> Dict:
+        # ✅ Safety: Fish API only accepts these latency variants
+        if latency not in ("low", "normal", "balanced"):
+            latency = "balanced"
+
+        payload = {
+            "text": text,
+            "reference_id": voice_id,
+            "model": backend,
+            "normalize": True,
+            "latency": latency,      # ✅ fixed
+        }
+        payload.update(profile.request_fields())
+
+        # Optional speed (include only if valid)
+        if isinstance(speed, (int, float)) and 0.5 <= float(speed) <= 1.3:
+            payload["speed"] = float(speed)
+        return payload
+
     def list_models(self) -> List[Dict]:
         if USE_CONFIG_MODELS_ONLY:
             return DEFAULT_MODELS
@@ -39,6 +141,50 @@ class FishAudioClient:
             pass
         return DEFAULT_MODELS
 
+    def routes_for(self, format_: str) -> List[Route]:
+        """
+        Failover order for one request. Without FISH_AUDIO_FAILOVER the
+        historical transport for the format goes first (REST for opus, SDK
+        otherwise); routes with an open circuit are dropped.
+        """
+        routes = self.routes
+        if not FISH_AUDIO_FAILOVER:
+            preferred = "rest" if format_ == "opus" else "sdk"
+            routes = sorted(routes, key=lambda r: r.transport != preferred)
+        return order_routes(routes)
+
+    def _sdk_request(self, text, voice_id, speed, latency, profile):
+        """
+        The SDK TTSRequest matching the REST payload (latency, normalize,
+        speed as prosody), or None when the SDK is missing or can't express
+        it; such a request must not fail over to the SDK and come out different.
+        """
+        try:
+            from fish_audio_sdk import TTSRequest
+        except ImportError:
+            return None
+        payload = self._tts_payload(text, voice_id, speed, latency, profile)
+        fields = getattr(TTSRequest, "model_fields", None) or getattr(TTSRequest, "__fields__", {})
+        kwargs = {"text": text, "reference_id": voice_id, "normalize": payload["normalize"], "latency": payload["latency"]}
+        kwargs.update(profile.request_fields())
+        if "speed" in payload:
+            if "prosody" not in fields:
+                return None
+            from fish_audio_sdk.schemas import Prosody
+
+            kwargs["prosody"] = Prosody(speed=payload["speed"])
+        try:
+            return TTSRequest(**kwargs)
+        except Exception:
+            return None
+
+    def usable_routes(self, text, voice_id, speed, latency, profile) -> List[Route]:
+        """routes_for(), minus SDK routes when the SDK can't render this exact request."""
+        routes = self.routes_for(profile.format)
+        if any(r.transport == "sdk" for r in routes) and self._sdk_request(text, voice_id, speed, latency, profile) is None:
+            routes = [r for r in routes if r.transport != "sdk"]
+        return routes
+
     def synthesize_text(
         self,
         text: str,
@@ -48,78 +194,249 @@ class FishAudioClient:
         mp3_bitrate: int = None,
         speed: Optional[float] = None,      # e.g. 0.88(slow)~1.10(fast)
         latency: str = "balanced",          # ✅ valid: low / normal / balanced
+        deadline: Optional[Deadline] = None,
+        profile: Optional[EncodingProfile] = None,
     ) -> bytes:
         """
         Generate speech audio.
 
-        - When format_ == 'opus', use REST API directly to obtain OGG/Opus bytes.
-        - Otherwise, use legacy Session + TTSRequest with supported formats ('mp3', 'wav', 'pcm').
+        - `profile` (format, bitrate, sample rate) wins over format_/mp3_bitrate;
+          without one, opus means 48 kbps and mp3 FISH_AUDIO_MP3_BITRATE.
+        - When the format is opus, the REST API is tried first to obtain OGG/Opus bytes.
+        - Otherwise, the legacy Session + TTSRequest path goes first.
+
+        Transient failures (connection resets, 5xx, 429) are retried with
+        jittered backoff, then the next route (transport/backend) is tried.
+        Every attempt shares one end-to-end deadline, and a route whose
+        circuit is open is skipped without touching the network.
         """
+        deadline = deadline or Deadline(TTS_DEADLINE_SECONDS)
+        profile = profile or EncodingProfile.for_format(format_, mp3_bitrate)
+        routes = self.usable_routes(text, voice_id, speed, latency, profile)
+        if not routes:
+            raise CircuitOpen("TTS temporarily unavailable, please try again shortly")
 
-        # ✅ Safety: Fish API only accepts these latency variants
-        if latency not in ("low", "normal", "balanced"):
-            latency = "balanced"
+        last_err: Optional[Exception] = None
+        for route in routes:
+            try:
+                return self._call_route(route, deadline, text, voice_id, profile, speed, latency)
+            except CircuitOpen as e:
+                last_err = e
+            except TTSError as e:
+                if not e.retryable:
+                    raise
+                last_err = e
+            if deadline.expired():
+                raise DeadlineExceeded(f"TTS failed: deadline exceeded ({last_err})")
+        raise last_err
 
-        # Direct HTTP path for Opus
-        if format_ == "opus":
+    def _call_route(self, route: Route, deadline: Deadline, text, voice_id, profile, speed, latency):
+        for attempt in range(self.retry.max_retries + 1):
+            key = self.pool.try_acquire()
+            if key is None:
+                # every key is cooling down or at its cap: fail the attempt rather than wait for a slot
+                time.sleep(self._retry_pause(route, attempt, deadline, RateLimited(NO_FREE_KEY)))
+                continue
             try:
-                url = f"{self.base_url}/v1/tts"
-                payload = {
-                    "text": text,
-                    "reference_id": voice_id,
-                    "format": "opus",
-                    "model": FISH_AUDIO_BACKEND,
-                    "normalize": True,
-                    "latency": latency,      # ✅ fixed
-                    "opus_bitrate": 48,      # ✅ better quality
-                }
-
-                # Optional speed (include only if valid)
-                if isinstance(speed, (int, float)) and 0.5 <= float(speed) <= 1.3:
-                    payload["speed"] = float(speed)
-
-                headers = self._headers()
-                headers["Content-Type"] = "application/json"
-                headers["Accept"] = "application/octet-stream"
-
-                r = requests.post(url, headers=headers, json=payload, stream=True, timeout=60)
-                if r.status_code != 200:
-                    try:
-                        err = r.json()
-                    except Exception:
-                        err = r.text
-                    raise RuntimeError(f"HTTP {r.status_code}: {err}")
+                route.breaker.before_call()
+            except CircuitOpen:
+                self.pool.release(key)
+                raise
+            started = time.monotonic()
+            try:
+                try:
+                    if route.transport == "rest" and self.hedger is not None:
+                        audio = self._hedged_rest(key, route.backend, deadline, text, voice_id, profile, speed, latency)
+                    elif route.transport == "rest":
+                        audio = self._rest_tts(key, route.backend, deadline, text, voice_id, profile, speed, latency)
+                    else:
+                        audio = self._sdk_tts(key, route.backend, deadline, text, voice_id, profile, speed, latency)
+                except RateLimited as e:
+                    self.pool.mark_rate_limited(key, e.retry_after)
+                    raise
+                except Exception:
+                    self.pool.mark_error(key)
+                    raise
+                finally:
+                    self.pool.release(key)
+            except DeadlineExceeded:
+                route.breaker.record_failure()
+                raise
+            except TTSError as e:
+                if not e.retryable or isinstance(e, RateLimited):
+                    # upstream answered: a bad request, or a 429 that only cools the key down
+                    route.breaker.record_success()
+                else:
+                    route.breaker.record_failure()
+                if not e.retryable:
+                    raise
+                time.sleep(self._retry_pause(route, attempt, deadline, e))
+                continue
 
-                audio_bytes = bytearray()
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        audio_bytes.extend(chunk)
+            route.breaker.record_success()
+            route.observe_latency(time.monotonic() - started)
+            log.debug("tts route ok", extra={"route": route.name, "ms": round((time.monotonic() - started) * 1000, 1)})
+            return audio
 
-                if not audio_bytes:
-                    raise RuntimeError("TTS failed: empty audio")
-                return bytes(audio_bytes)
+    def _retry_pause(self, route: Route, attempt: int, deadline: Deadline, err: TTSError) -> float:
+        """Backoff before the next attempt on `route`; raises `err` once retries or the deadline run out."""
+        pause = self.retry.backoff(attempt)
+        if attempt >= self.retry.max_retries or pause >= deadline.remaining():
+            log.warning("tts route failed", extra={"route": route.name, "attempt": attempt, "error": str(err)})
+            raise err
+        log.info("tts retry", extra={"route": route.name, "attempt": attempt, "pause": round(pause, 3), "error": str(err)})
+        return pause
 
+    def _hedge_key(self, key: str) -> Optional[str]:
+        """A leased key for a backup of a request on `key`: another free key, else `key` itself if under its cap."""
+        other = self.pool.try_acquire(exclude=(key,))
+        if other is not None:
+            return other
+        # a single key (or every other one busy): the backup still goes out on its own connection
+        return key if self.pool.try_hold(key) else None
+
+    def _mark_key(self, key: str, err: Exception):
+        if isinstance(err, RateLimited):
+            self.pool.mark_rate_limited(key, err.retry_after)
+        else:
+            self.pool.mark_error(key)
+
+    def _hedged_rest(self, key, backend, deadline, text, voice_id, profile, speed, latency) -> bytes:
+        """
+        `_rest_tts` with a backup request. If no audio byte has arrived after
+        the hedger's delay (the recent p90 time-to-first-byte), the same
+        request goes out again on another healthy key with a free slot, or
+        else on `key` itself over a new connection if it is under its
+        concurrency cap (neither: no hedge); the first to finish wins and
+        the other one is closed. The primary `key` is the caller's; a request still running
+        when this returns keeps its key leased until its thread is done.
+        """
+        hedger = self.hedger
+        hedger.on_primary()
+        results: "queue.Queue" = queue.Queue()
+        primary_settled = threading.Event()  # first byte or outcome of the primary
+        cancel = threading.Event()
+        handoff = threading.Lock()
+        primary_running = True
+        primary_outlived = False  # we returned first: the primary thread releases its own hold on `key`
+
+        def run(k: str, hedge: bool):
+            nonlocal primary_running
+            started = time.monotonic()
+
+            def first_byte():
+                hedger.observe_ttfb(time.monotonic() - started)
+                if not hedge:
+                    primary_settled.set()
+
+            err = None
+            try:
+                audio = self._rest_tts(k, backend, deadline, text, voice_id, profile, speed, latency,
+                                       on_first_byte=first_byte, cancel=cancel)
+                results.put((hedge, audio, None))
             except Exception as e:
-                raise RuntimeError(f"TTS failed (HTTP/Opus): {e}")
+                err = e
+                results.put((hedge, None, e))
+            finally:
+                if hedge:
+                    # the hedge key is leased for this thread; being cancelled is not the key's fault
+                    if err is not None and not cancel.is_set():
+                        self._mark_key(k, err)
+                    self.pool.release(k)
+                else:
+                    primary_settled.set()
+                    with handoff:
+                        primary_running = False
+                        if primary_outlived:
+                            self.pool.release(k)
+
+        threading.Thread(target=run, args=(key, False), name="tts-primary", daemon=True).start()
+        pending = 1
+        if not primary_settled.wait(max(0.0, min(hedger.delay(), deadline.remaining()))):
+            hedge_key = self._hedge_key(key)
+            if hedge_key is None:
+                hedger.record_no_key()
+            elif not hedger.try_hedge():
+                self.pool.release(hedge_key)
+            else:
+                threading.Thread(target=run, args=(hedge_key, True), name="tts-hedge", daemon=True).start()
+                pending = 2
+                log.info("tts hedged", extra={"backend": backend})
 
-        # Fallback: legacy SDK formats
+        errors: Dict[bool, Exception] = {}
         try:
-            kwargs = {"text": text, "reference_id": voice_id, "format": format_}
+            while pending:
+                try:
+                    hedge, audio, err = results.get(timeout=max(0.01, deadline.remaining()))
+                except queue.Empty:
+                    raise DeadlineExceeded("TTS failed: deadline exceeded while streaming")
+                pending -= 1
+                if err is None:
+                    hedger.record_win(hedge)
+                    return audio
+                errors[hedge] = err
+            # both failed: the caller retries / fails over on the primary's error
+            raise errors.get(False) or errors[True]
+        finally:
+            cancel.set()
+            with handoff:
+                if primary_running:
+                    # the caller's lease on `key` ends when we return
+                    self.pool.hold(key)
+                    primary_outlived = True
 
-            # Include mp3 bitrate if requested and format is mp3
-            try:
-                bitrate = mp3_bitrate if mp3_bitrate is not None else (
-                    FISH_AUDIO_MP3_BITRATE if format_ == "mp3" else None
+    def _rest_tts(self, key, backend, deadline, text, voice_id, profile, speed, latency,
+                  on_first_byte=None, cancel: Optional[threading.Event] = None) -> bytes:
+        try:
+            url = f"{self.base_url}/v1/tts"
+            payload = self._tts_payload(text, voice_id, speed, latency, profile, backend)
+            headers = self._tts_headers(key)
+
+            r = requests.post(url, headers=headers, json=payload, stream=True, timeout=deadline.timeout(60))
+            if cancel is not None and cancel.is_set():
+                r.close()
+                raise TTSError("TTS cancelled: the other request finished first")
+            if r.status_code == 429:
+                raise RateLimited(
+                    "TTS failed (HTTP): HTTP 429: rate limited",
+                    parse_retry_after(r.headers.get("Retry-After")),
                 )
-            except Exception:
-                bitrate = None
+            if r.status_code != 200:
+                try:
+                    err = r.json()
+                except Exception:
+                    err = r.text
+                raise _http_error(r.status_code, err)
+
+            audio_bytes = bytearray()
+            for chunk in r.iter_content(chunk_size=8192):
+                if chunk:
+                    if on_first_byte is not None and not audio_bytes:
+                        on_first_byte()
+                    audio_bytes.extend(chunk)
+                if cancel is not None and cancel.is_set():
+                    r.close()
+                    raise TTSError("TTS cancelled: the other request finished first")
+                if deadline.expired():
+                    r.close()
+                    raise DeadlineExceeded("TTS failed: deadline exceeded while streaming")
+
+            if not audio_bytes:
+                raise TTSError("TTS failed: empty audio", retryable=True)
+            return bytes(audio_bytes)
 
-            if format_ == "mp3" and isinstance(bitrate, int) and bitrate in (64, 128, 192):
-                kwargs["mp3_bitrate"] = bitrate
+        except (TTSError, DeadlineExceeded):
+            raise
+        except Exception as e:
+            raise TTSError(f"TTS failed (HTTP): {e}", retryable=_is_transient(e))
 
-            req = TTSRequest(**kwargs)
+    def _sdk_tts(self, key, backend, deadline, text, voice_id, profile, speed, latency) -> bytes:
+        try:
+            req = self._sdk_request(text, voice_id, speed, latency, profile)
+            if req is None:
+                raise TTSError("TTS failed: the SDK can't render this request")
             audio_bytes = bytearray()
-            for chunk in self.session.tts(req, backend=FISH_AUDIO_BACKEND):
+            for chunk in self._sdk_session(key).tts(req, backend=backend):
                 if isinstance(chunk, (bytes, bytearray)):
                     audio_bytes.extend(chunk)
                 else:
@@ -127,10 +444,238 @@ class FishAudioClient:
                         audio_bytes.extend(bytes(chunk))
                     except Exception:
                         pass
+                if deadline.expired():
+                    raise DeadlineExceeded("TTS failed: deadline exceeded while streaming")
+
+            if not audio_bytes:
+                raise TTSError("TTS failed: empty audio", retryable=True)
+            return bytes(audio_bytes)
+
+        except (TTSError, DeadlineExceeded):
+            raise
+        except Exception as e:
+            if getattr(e, "status", None) == 429:
+                raise RateLimited(f"TTS failed: {e}")
+            raise TTSError(f"TTS failed: {e}", retryable=_is_transient(e))
+
+
+class AsyncFishAudioClient:
+    """
+    asyncio flavour of FishAudioClient for the AsyncTeleBot runtime.
+
+    REST routes run on a shared aiohttp session so many syntheses can be in
+    flight on one event loop, with the same key pool, breakers, retries and
+    deadline as the sync client; SDK routes are delegated to the sync client
+    in the default executor.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
+        self.sync = FishAudioClient(api_key, base_url)
+        self.base_url = self.sync.base_url
+        self._http = None
+
+    async def _session(self):
+        import aiohttp
+
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession()
+        return self._http
+
+    async def close(self):
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+
+    def list_models(self) -> List[Dict]:
+        return self.sync.list_models()
+
+    async def synthesize_text(
+        self,
+        text: str,
+        voice_id: str,
+        language: str = "en",
+        format_: str = "mp3",
+        mp3_bitrate: int = None,
+        speed: Optional[float] = None,
+        latency: str = "balanced",
+        profile: Optional[EncodingProfile] = None,
+    ) -> bytes:
+        import asyncio
+
+        deadline = Deadline(TTS_DEADLINE_SECONDS)
+        profile = profile or EncodingProfile.for_format(format_, mp3_bitrate)
+        routes = self.sync.usable_routes(text, voice_id, speed, latency, profile)
+        if not routes:
+            raise CircuitOpen("TTS temporarily unavailable, please try again shortly")
+
+        last_err: Optional[Exception] = None
+        for route in routes:
+            try:
+                if route.transport == "rest":
+                    return await self._call_rest_route(
+                        route, deadline, text, voice_id, profile, speed, latency
+                    )
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    None,
+                    lambda: self.sync._call_route(
+                        route, deadline, text, voice_id, profile, speed, latency
+                    ),
+                )
+            except CircuitOpen as e:
+                last_err = e
+            except TTSError as e:
+                if not e.retryable:
+                    raise
+                last_err = e
+            if deadline.expired():
+                raise DeadlineExceeded(f"TTS failed: deadline exceeded ({last_err})")
+        raise last_err
+
+    async def _call_rest_route(self, route, deadline, text, voice_id, profile, speed, latency):
+        import asyncio
+
+        pool = self.sync.pool
+        retry = self.sync.retry
+        for attempt in range(retry.max_retries + 1):
+            key = pool.try_acquire()
+            if key is None:
+                # same policy as the sync client: fail the attempt, never wait for a slot
+                await asyncio.sleep(self.sync._retry_pause(route, attempt, deadline, RateLimited(NO_FREE_KEY)))
+                continue
+            try:
+                route.breaker.before_call()
+            except CircuitOpen:
+                pool.release(key)
+                raise
+            started = time.monotonic()
+            try:
+                if self.sync.hedger is not None:
+                    audio = await self._hedged_rest(key, route.backend, deadline, text, voice_id, profile, speed, latency)
+                else:
+                    audio = await self._rest_tts(key, route.backend, deadline, text, voice_id, profile, speed, latency)
+            except RateLimited as e:
+                pool.mark_rate_limited(key, e.retry_after)
+                err = e
+            except TTSError as e:
+                pool.mark_error(key)
+                err = e
+            except DeadlineExceeded:
+                route.breaker.record_failure()
+                raise
+            else:
+                route.breaker.record_success()
+                route.observe_latency(time.monotonic() - started)
+                return audio
+            finally:
+                pool.release(key)
+
+            if not err.retryable or isinstance(err, RateLimited):
+                # upstream answered: a bad request, or a 429 that only cools the key down
+                route.breaker.record_success()
+            else:
+                route.breaker.record_failure()
+            if not err.retryable:
+                raise err
+            await asyncio.sleep(self.sync._retry_pause(route, attempt, deadline, err))
+
+    async def _hedged_rest(self, key, backend, deadline, text, voice_id, profile, speed, latency) -> bytes:
+        """FishAudioClient._hedged_rest on the event loop; the losing request is cancelled outright."""
+        import asyncio
+
+        hedger = self.sync.hedger
+        hedger.on_primary()
+        primary_first_byte = asyncio.Event()
+
+        def start(k: str, hedge: bool):
+            started = time.monotonic()
+
+            def first_byte():
+                hedger.observe_ttfb(time.monotonic() - started)
+                if not hedge:
+                    primary_first_byte.set()
+
+            return asyncio.ensure_future(
+                self._rest_tts(k, backend, deadline, text, voice_id, profile, speed, latency, on_first_byte=first_byte)
+            )
+
+        primary = start(key, False)
+        pending = {primary}
+        hedge_task = hedge_key = None
+        try:
+            waiter = asyncio.ensure_future(primary_first_byte.wait())
+            await asyncio.wait({primary, waiter}, timeout=max(0.0, min(hedger.delay(), deadline.remaining())),
+                               return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if not primary.done() and not primary_first_byte.is_set():
+                hedge_key = self.sync._hedge_key(key)
+                if hedge_key is None:
+                    hedger.record_no_key()
+                elif not hedger.try_hedge():
+                    self.sync.pool.release(hedge_key)
+                    hedge_key = None
+                else:
+                    hedge_task = start(hedge_key, True)
+                    pending.add(hedge_task)
+                    log.info("tts hedged", extra={"backend": backend})
+
+            errors: Dict[bool, BaseException] = {}
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.01, deadline.remaining()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceeded("TTS failed: deadline exceeded while streaming")
+                for task in done:
+                    if task.exception() is None:
+                        hedger.record_win(task is hedge_task)
+                        return task.result()
+                    errors[task is hedge_task] = task.exception()
+            # both failed: the caller retries / fails over on the primary's error
+            raise errors.get(False) or errors[True]
+        finally:
+            for task in pending:
+                task.cancel()
+            if hedge_key is not None:
+                if hedge_task.done() and not hedge_task.cancelled() and hedge_task.exception() is not None:
+                    self.sync._mark_key(hedge_key, hedge_task.exception())
+                self.sync.pool.release(hedge_key)
+
+    async def _rest_tts(self, key, backend, deadline, text, voice_id, profile, speed, latency, on_first_byte=None) -> bytes:
+        import aiohttp
+
+        try:
+            http = await self._session()
+            payload = self.sync._tts_payload(text, voice_id, speed, latency, profile, backend)
+            async with http.post(
+                f"{self.base_url}/v1/tts",
+                headers=self.sync._tts_headers(key),
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=deadline.timeout(60)),
+            ) as r:
+                if r.status == 429:
+                    raise RateLimited(
+                        "TTS failed (HTTP): HTTP 429: rate limited",
+                        parse_retry_after(r.headers.get("Retry-After")),
+                    )
+                if r.status != 200:
+                    try:
+                        err = await r.json(content_type=None)
+                    except Exception:
+                        err = await r.text()
+                    raise _http_error(r.status, err)
+
+                audio_bytes = bytearray()
+                async for chunk in r.content.iter_chunked(8192):
+                    if chunk:
+                        if on_first_byte is not None and not audio_bytes:
+                            on_first_byte()
+                        audio_bytes.extend(chunk)
 
             if not audio_bytes:
-                raise RuntimeError("TTS failed: empty audio")
+                raise TTSError("TTS failed: empty audio", retryable=True)
             return bytes(audio_bytes)
 
+        except (TTSError, DeadlineExceeded):
+            raise
         except Exception as e:
-            raise RuntimeError(f"TTS failed: {e}")
+            transient = _is_transient(e) or isinstance(e, aiohttp.ClientError) or type(e).__name__ == "TimeoutError"
+            raise TTSError(f"TTS failed (HTTP): {e}", retryable=transient)
@@ -0,0 +1,144 @@
+import threading
+import time
+from typing import Dict, List, Optional
+from config import FISH_AUDIO_KEY_COOLDOWN_SECONDS, FISH_AUDIO_KEY_MAX_CONCURRENCY
+
+
+class KeyState:
+    __slots__ = ("key", "in_flight", "total", "rate_limited", "errors", "cooldown_until")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.in_flight = 0
+        self.total = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.cooldown_until = 0.0
+
+    def healthy(self, now: float) -> bool:
+        return self.cooldown_until <= now
+
+
+class ApiKeyPool:
+    """
+    Routes each upstream call to the least-loaded healthy API key.
+
+    In-flight counts and 429s are tracked per key; a key that gets rate
+    limited is cooled down for `cooldown_seconds` (or the server's
+    Retry-After) and skipped until then. When no key is healthy with a
+    free slot the caller gets None rather than a wait or an over-cap key.
+    """
+
+    def __init__(
+        self,
+        keys: List[str],
+        cooldown_seconds: float = FISH_AUDIO_KEY_COOLDOWN_SECONDS,
+        max_concurrency: int = FISH_AUDIO_KEY_MAX_CONCURRENCY,
+    ):
+        uniq = []
+        for k in keys:
+            k = (k or "").strip()
+            if k and k not in uniq:
+                uniq.append(k)
+        self._keys: List[KeyState] = [KeyState(k) for k in uniq] or [KeyState("")]
+        self.cooldown_seconds = float(cooldown_seconds)
+        self.max_concurrency = int(max_concurrency)
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def keys(self) -> List[str]:
+        return [s.key for s in self._keys]
+
+    def _pick(self, now: float, exclude=()) -> Optional[KeyState]:
+        healthy = [s for s in self._keys if s.key not in exclude and s.healthy(now)]
+        if self.max_concurrency > 0:
+            healthy = [s for s in healthy if s.in_flight < self.max_concurrency]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda s: (s.in_flight, s.total))
+
+    def try_acquire(self, exclude=()) -> Optional[str]:
+        """
+        Reserve a healthy key with a free slot, other than those in `exclude`,
+        or return None at once. Never waits and never falls back to a cooling
+        or full key; callers fail the attempt with RateLimited instead.
+        """
+        with self._cond:
+            state = self._pick(time.time(), exclude)
+            if state is None:
+                return None
+            state.in_flight += 1
+            state.total += 1
+            return state.key
+
+    def try_hold(self, key: str) -> bool:
+        """One more request on `key` if it is healthy and under max_concurrency; release() it when True."""
+        with self._cond:
+            state = self._state(key)
+            if state is None or not state.healthy(time.time()):
+                return False
+            if self.max_concurrency > 0 and state.in_flight >= self.max_concurrency:
+                return False
+            state.in_flight += 1
+            state.total += 1
+            return True
+
+    def hold(self, key: str):
+        """One more lease on a key the caller already holds (e.g. for a request that outlives its caller); release() it."""
+        with self._cond:
+            state = self._state(key)
+            if state:
+                state.in_flight += 1
+
+    def release(self, key: str):
+        with self._cond:
+            state = self._state(key)
+            if state and state.in_flight > 0:
+                state.in_flight -= 1
+            self._cond.notify()
+
+    def mark_rate_limited(self, key: str, retry_after: Optional[float] = None):
+        with self._cond:
+            state = self._state(key)
+            if not state:
+                return
+            state.rate_limited += 1
+            delay = float(retry_after) if retry_after else self.cooldown_seconds
+            state.cooldown_until = max(state.cooldown_until, time.time() + delay)
+
+    def mark_error(self, key: str):
+        with self._cond:
+            state = self._state(key)
+            if state:
+                state.errors += 1
+
+    def _state(self, key: str) -> Optional[KeyState]:
+        for s in self._keys:
+            if s.key == key:
+                return s
+        return None
+
+    def snapshot(self) -> List[Dict]:
+        now = time.time()
+        with self._cond:
+            return [
+                {
+                    "key": (s.key[:4] + "…" + s.key[-4:]) if len(s.key) > 8 else "***",
+                    "in_flight": s.in_flight,
+                    "total": s.total,
+                    "rate_limited": s.rate_limited,
+                    "errors": s.errors,
+                    "cooldown_left": max(0.0, round(s.cooldown_until - now, 1)),
+                }
+                for s in self._keys
+            ]
+
+
+def parse_retry_after(value) -> Optional[float]:
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
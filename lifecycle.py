@@ -0,0 +1,162 @@
+import itertools
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List
+from config import DRAIN_TIMEOUT_SECONDS
+
+
+class Job:
+    """An in-flight unit of work; `payload` is mutated in place as it progresses and must stay JSON-serialisable."""
+
+    __slots__ = ("id", "kind", "payload", "started_at")
+
+    def __init__(self, job_id: int, kind: str, payload: Dict[str, Any]):
+        self.id = job_id
+        self.kind = kind
+        self.payload = payload
+        self.started_at = time.monotonic()
+
+
+class Lifecycle:
+    """
+    Graceful drain for redeploys.
+
+    On SIGTERM/SIGINT: stop accepting updates (webhook answers 503 so Telegram
+    redelivers to the next process, polling is stopped), let in-flight jobs
+    finish within `drain_timeout`, checkpoint the rest into `pending_jobs`
+    and exit. On the next start `resume_pending` replays checkpointed jobs.
+    """
+
+    def __init__(self, db, drain_timeout: float = DRAIN_TIMEOUT_SECONDS):
+        self.db = db
+        self.drain_timeout = float(drain_timeout)
+        self.stopping = threading.Event()
+        self._jobs: Dict[int, Job] = {}
+        self._ids = itertools.count(1)
+        self._idle = threading.Condition()
+        self._on_stop: List[Callable[[], None]] = []
+        self._on_exit: List[Callable[[], None]] = []
+        self._resumers: Dict[str, Callable[[Job], None]] = {}
+        self._shutdown_started = False
+        self._drained = threading.Event()
+
+    def accepting(self) -> bool:
+        return not self.stopping.is_set()
+
+    def in_flight(self) -> int:
+        with self._idle:
+            return len(self._jobs)
+
+    def on_stop(self, fn: Callable[[], None]):
+        self._on_stop.append(fn)
+
+    def on_exit(self, fn: Callable[[], None]):
+        """Runs after the drain, right before the process exits (e.g. flush log queues)."""
+        self._on_exit.append(fn)
+
+    def register_resumer(self, kind: str, fn: Callable[[Job], None]):
+        self._resumers[kind] = fn
+
+    @contextmanager
+    def job(self, kind: str, **payload):
+        job = Job(next(self._ids), kind, dict(payload))
+        with self._idle:
+            self._jobs[job.id] = job
+        try:
+            yield job
+        finally:
+            with self._idle:
+                self._jobs.pop(job.id, None)
+                if not self._jobs:
+                    self._idle.notify_all()
+
+    # -------------------
+    # SHUTDOWN
+    # -------------------
+    def install_signal_handlers(self):
+        def handle(signum, frame):
+            logging.info(f"Received signal {signum}; draining")
+            threading.Thread(target=self.shutdown_and_exit, name="drain", daemon=True).start()
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                signal.signal(sig, handle)
+            except Exception:
+                pass
+
+    def drain(self) -> int:
+        """Stop accepting work and wait for in-flight jobs; returns how many were checkpointed."""
+        with self._idle:
+            started = self._shutdown_started
+            self._shutdown_started = True
+        if started:
+            self._drained.wait()
+            return 0
+        self.stopping.set()
+        for fn in self._on_stop:
+            try:
+                fn()
+            except Exception:
+                logging.exception("on_stop callback failed")
+
+        deadline = time.monotonic() + self.drain_timeout
+        with self._idle:
+            while self._jobs:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._idle.wait(left)
+            leftovers = [(j.kind, json.dumps(j.payload, ensure_ascii=False)) for j in self._jobs.values()]
+
+        if leftovers:
+            try:
+                self.db.save_pending_jobs(leftovers)
+            except Exception:
+                logging.exception("Failed to checkpoint pending jobs")
+        logging.info(f"Drain finished; {len(leftovers)} job(s) checkpointed")
+        self._drained.set()
+        return len(leftovers)
+
+    def shutdown_and_exit(self, code: int = 0):
+        self.drain()
+        for fn in self._on_exit:
+            try:
+                fn()
+            except Exception:
+                pass
+        logging.shutdown()
+        os._exit(code)
+
+    # -------------------
+    # RESUME
+    # -------------------
+    def resume_pending(self):
+        """Replay checkpointed jobs from a previous process in a background thread."""
+        try:
+            pending = self.db.take_pending_jobs()
+        except Exception:
+            logging.exception("Failed to load pending jobs")
+            return
+        if not pending:
+            return
+
+        def run():
+            for kind, raw in pending:
+                fn = self._resumers.get(kind)
+                if not fn:
+                    logging.warning(f"No resumer for pending job kind {kind!r}")
+                    continue
+                try:
+                    payload = json.loads(raw)
+                    with self.job(kind, **payload) as job:
+                        fn(job)
+                except Exception:
+                    logging.exception(f"Resuming {kind} job failed")
+
+        logging.info(f"Resuming {len(pending)} checkpointed job(s)")
+        threading.Thread(target=run, name="resume", daemon=True).start()
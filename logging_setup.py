@@ -0,0 +1,196 @@
+"""
+Structured, sampled logging.
+
+- JSON records (one per line) with a correlation id per Telegram update,
+  carried via contextvars through DB, TTS and upload log calls.
+- Success/INFO records are kept for a sampled fraction of updates; warnings
+  and errors are always kept.
+- Handlers only enqueue records; a QueueListener thread does the I/O.
+"""
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from typing import Optional
+from config import LOG_LEVEL, LOG_JSON, LOG_SAMPLE_RATE
+
+_correlation_id: contextvars.ContextVar = contextvars.ContextVar("correlation_id", default=None)
+_sampled: contextvars.ContextVar = contextvars.ContextVar("log_sampled", default=True)
+
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "cid"}
+
+
+def correlation_id() -> Optional[str]:
+    return _correlation_id.get()
+
+
+def begin_correlation(cid: str, sample_rate: float = LOG_SAMPLE_RATE):
+    """Start a correlation scope; returns tokens for end_correlation()."""
+    return (
+        _correlation_id.set(cid),
+        _sampled.set(sample_rate >= 1.0 or random.random() < sample_rate),
+    )
+
+
+def end_correlation(tokens):
+    cid_token, sampled_token = tokens
+    _correlation_id.reset(cid_token)
+    _sampled.reset(sampled_token)
+
+
+class ContextFilter(logging.Filter):
+    """Stamps the correlation id and drops sub-WARNING records of unsampled updates."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.cid = _correlation_id.get()
+        if record.levelno < logging.WARNING and not _sampled.get():
+            return False
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        cid = getattr(record, "cid", None)
+        if cid:
+            out["cid"] = cid
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                out[key] = value
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Resolves message and traceback text up front, leaving the formatting to the listener."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: str = LOG_LEVEL, json_output: bool = LOG_JSON) -> logging.handlers.QueueListener:
+    stream = logging.StreamHandler(sys.stdout)
+    if json_output:
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(cid)s] %(message)s"))
+
+    q: queue.Queue = queue.Queue(-1)
+    queue_handler = _QueueHandler(q)
+    # filter on the producer side so the contextvars of the logging thread are used
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+
+    # telebot at DEBUG formats every API request/response; keep it quiet
+    logging.getLogger("TeleBot").setLevel(logging.WARNING)
+    logging.getLogger("urllib3").setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    listener = logging.handlers.QueueListener(q, stream, respect_handler_level=False)
+    listener.start()
+    return listener
+
+
+# -------------------------
+# PER-UPDATE CORRELATION
+# -------------------------
+def _update_ref(update_type: str, obj) -> str:
+    if update_type == "message":
+        return f"m{obj.chat.id}-{obj.message_id}"
+    return f"{update_type[0]}{getattr(obj, 'id', '')}"
+
+
+def _user_id(obj) -> Optional[int]:
+    user = getattr(obj, "from_user", None)
+    return user.id if user else None
+
+
+UPDATE_TYPES = ["message", "callback_query", "inline_query"]
+log = logging.getLogger("bot.update")
+
+
+def build_update_middleware():
+    """Class middleware for a TeleBot created with use_class_middlewares=True."""
+    from telebot.handler_backends import BaseMiddleware
+
+    class UpdateLoggingMiddleware(BaseMiddleware):
+        def __init__(self):
+            super().__init__()
+            self.update_sensitive = False
+            self.update_types = UPDATE_TYPES
+
+        def pre_process(self, obj, data):
+            data["_log_tokens"] = begin_correlation(_update_ref(_update_type(obj), obj))
+            data["_log_started"] = time.monotonic()
+
+        def post_process(self, obj, data, exception):
+            _finish(obj, data, exception)
+
+    return UpdateLoggingMiddleware()
+
+
+def build_async_update_middleware():
+    from telebot.asyncio_handler_backends import BaseMiddleware
+
+    class AsyncUpdateLoggingMiddleware(BaseMiddleware):
+        def __init__(self):
+            super().__init__()
+            self.update_sensitive = False
+            self.update_types = UPDATE_TYPES
+
+        async def pre_process(self, obj, data):
+            data["_log_tokens"] = begin_correlation(_update_ref(_update_type(obj), obj))
+            data["_log_started"] = time.monotonic()
+
+        async def post_process(self, obj, data, exception):
+            _finish(obj, data, exception)
+
+    return AsyncUpdateLoggingMiddleware()
+
+
+def _update_type(obj) -> str:
+    if hasattr(obj, "message_id"):
+        return "message"
+    if hasattr(obj, "query") and hasattr(obj, "offset"):
+        return "inline_query"
+    return "callback_query"
+
+
+def _finish(obj, data, exception):
+    tokens = data.get("_log_tokens")
+    if tokens is None:
+        return
+    ms = round((time.monotonic() - data.get("_log_started", time.monotonic())) * 1000, 1)
+    try:
+        if exception is not None:
+            log.error(
+                "update failed",
+                exc_info=(type(exception), exception, exception.__traceback__),
+                extra={"user_id": _user_id(obj), "ms": ms},
+            )
+        else:
+            log.info("update handled", extra={"user_id": _user_id(obj), "ms": ms})
+    finally:
+        end_correlation(tokens)
@@ -1,78 +1,219 @@
+import asyncio
 import logging
 import os
-import time
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 import telebot
-from telebot.types import BotCommand
 from config import (
     TELEGRAM_BOT_TOKEN,
     DB_PATH,
     VOICES_DIR,
     ADMIN_IDS,
     USE_WEBHOOK,
+    USE_ASYNC_RUNTIME,
     WEBHOOK_BASE_URL,
     PORT,
+    METRICS_FLUSH_INTERVAL_SECONDS,
+    PREVIEW_TEXT,
 )
 from db import Database
-from admin_panel import register_admin_handlers
+from admin_panel import register_admin_handlers, get_models_from_db
 from user_panel import register_user_handlers
-from scheduler import start_expiry_cleanup_thread
+from scheduler import LeaderLease, Scheduler, add_maintenance_jobs, add_preview_job, build_scheduler
+from state_store import create_state_store
+from lifecycle import Lifecycle
+from logging_setup import setup_logging, build_update_middleware, build_async_update_middleware
+from startup import ALLOWED_UPDATES, reset_webhook, run_startup, async_run_startup
+from webhook import MAX_BODY_BYTES, SECRET_HEADER, WebhookGuard, client_addr, webhook_secret
+from tenants import load_tenants
+from fish_audio import FishAudioClient
+from audio_cache import AudioCache
+from outbound import TelegramLimiter
+from voice_store import VoiceStore
+from previews import VoicePreviews, catalog_ids
 
 
-def set_commands(bot: telebot.TeleBot):
-    commands = [
-        BotCommand("start", "Start"),
-        BotCommand("admin", "Admin panel"),
-    ]
-    try:
-        bot.set_my_commands(commands)
-    except Exception:
-        pass
+async def async_main():
+    """
+    asyncio entry point: AsyncTeleBot handlers, aiohttp for Fish Audio and the
+    webhook listener, voice archival via asyncio.to_thread, SQLite on an executor.
+    """
+    from telebot.async_telebot import AsyncTeleBot
+    from db import AsyncDatabase
+    from fish_audio import AsyncFishAudioClient
+    from async_admin_panel import register_async_admin_handlers
+    from async_user_panel import register_async_user_handlers
 
+    setup_logging()
 
-def notify_admin_online(bot: telebot.TeleBot):
-    try:
-        me = bot.get_me()
-        msg = f"Bot @{me.username} is online."
-    except Exception:
-        msg = "Bot is online."
+    if not TELEGRAM_BOT_TOKEN:
+        raise RuntimeError("TELEGRAM_BOT_TOKEN is not set")
 
-    for aid in (ADMIN_IDS[:1] if ADMIN_IDS else []):
-        try:
-            bot.send_message(aid, msg)
-        except Exception:
-            pass
+    os.makedirs(VOICES_DIR, exist_ok=True)
+
+    db = Database(DB_PATH)
+    adb = AsyncDatabase(db)
+    await adb.add_admins(ADMIN_IDS)
+
+    bot = AsyncTeleBot(TELEGRAM_BOT_TOKEN, parse_mode="HTML")
+    bot.setup_middleware(build_async_update_middleware())
+    states = create_state_store()
+
+    # the scheduler runs plain threads; give it a sync bot for its notifications,
+    # paced by the same outbound limiter the threaded runtime uses
+    limiter = TelegramLimiter()
+    limiter.install()
+    store = VoiceStore(db, os.path.join(VOICES_DIR, "objects"))
+    scheduler = build_scheduler(db, telebot.TeleBot(TELEGRAM_BOT_TOKEN, parse_mode="HTML"), states, store=store)
+
+    client = AsyncFishAudioClient()
+    previews = None
+    if PREVIEW_TEXT:
+        # rendered with the sync client: the scheduler job runs on a plain thread
+        previews = VoicePreviews(db, client.sync, os.path.join(VOICES_DIR, "previews"))
+        add_preview_job(scheduler, previews, lambda: catalog_ids(client.list_models(), get_models_from_db(db)))
+
+    # ✅ IMPORTANT: admin first, then user
+    register_async_admin_handlers(bot, adb, states, scheduler, previews, load_tenants()[0], limiter)
+    register_async_user_handlers(bot, adb, client, store, previews, AudioCache())
+
+    scheduler.start()
+
+    if USE_WEBHOOK and WEBHOOK_BASE_URL:
+        from aiohttp import web
+
+        async def health(request):
+            return web.Response(text="OK")
+
+        webhook_url = WEBHOOK_BASE_URL.rstrip("/") + f"/{TELEGRAM_BOT_TOKEN}"
+        secret = webhook_secret(TELEGRAM_BOT_TOKEN)
+        # the guard re-registers from a plain thread, so it gets a sync client
+        guard = WebhookGuard(
+            secret,
+            on_missing_secret=lambda: reset_webhook(telebot.TeleBot(TELEGRAM_BOT_TOKEN), webhook_url, secret),
+        )
+
+        async def telegram_webhook(request):
+            # header and size are checked before the body is read
+            header = request.headers.get(SECRET_HEADER)
+            if not guard.authorized(header):
+                if header is None:
+                    addr = client_addr(request.headers.get("X-Forwarded-For"), request.remote)
+                    small = (request.content_length or 0) <= MAX_BODY_BYTES
+                    guard.missing_secret(addr, await request.read() if small else b"")
+                return web.Response(status=403, text="Forbidden")
+            if not guard.size_ok(request.content_length):
+                return web.Response(status=413, text="Too Large")
+            data = guard.accept(await request.read())
+            if data is None:
+                return web.Response(text="OK")
+            try:
+                update = telebot.types.Update.de_json(data)
+                await bot.process_new_updates([update])
+            except Exception as e:
+                guard.forget(data["update_id"])
+                logging.exception(f"Webhook processing error: {e}")
+                return web.Response(status=500, text="ERROR")
+            return web.Response(text="OK")
+
+        app = web.Application()
+        app.router.add_get("/health", health)
+        app.router.add_post(f"/{TELEGRAM_BOT_TOKEN}", telegram_webhook)
+
+        # listener first, Telegram-side setup afterwards
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", int(PORT)).start()
+
+        await async_run_startup(bot, webhook_url, secret)
+        await asyncio.Event().wait()
+    else:
+        await async_run_startup(bot)
+        await bot.infinity_polling(skip_pending=True, allowed_updates=ALLOWED_UPDATES)
 
 
 def main():
-    logging.basicConfig(level=logging.INFO)
-    try:
-        telebot.logger.setLevel(logging.DEBUG)
-    except Exception:
-        pass
+    if USE_ASYNC_RUNTIME or "--async" in sys.argv[1:]:
+        return asyncio.run(async_main())
+
+    log_listener = setup_logging()
 
     if not TELEGRAM_BOT_TOKEN:
         raise RuntimeError("TELEGRAM_BOT_TOKEN is not set")
 
-    os.makedirs(VOICES_DIR, exist_ok=True)
+    tenants = load_tenants()
 
-    db = Database(DB_PATH)
-    # ensure fixed admins exist in DB
-    for aid in ADMIN_IDS:
+    # shared by every hosted bot: Telegram rate limits + keep-alive pool,
+    # synthesis pool, audio cache, state store
+    limiter = TelegramLimiter()
+    limiter.install()
+    client = FishAudioClient()
+    cache = AudioCache()
+    states = create_state_store()
+
+    primary_db = None
+    lifecycle = None
+    scheduler = None
+    bots: Dict[str, telebot.TeleBot] = {}
+    admins: Dict[str, List[int]] = {}
+
+    for tenant in tenants:
+        os.makedirs(tenant.voices_dir, exist_ok=True)
+
+        db = Database(tenant.db_path)
+        # ensure fixed admins exist in DB
         try:
-            db.add_admin(int(aid))
+            db.add_admins(tenant.admin_ids)
         except Exception:
             pass
 
-    bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN, parse_mode="HTML")
+        if lifecycle is None:
+            primary_db = db
+            lifecycle = Lifecycle(primary_db)
+            lifecycle.on_exit(log_listener.stop)
+            lifecycle.install_signal_handlers()
+            scheduler = Scheduler(lifecycle.stopping, leader=LeaderLease(states).held)
 
-    # ✅ IMPORTANT: admin first, then user
-    register_admin_handlers(bot, db)
-    register_user_handlers(bot, db)
+        # class middlewares run in the handler worker thread, so the update's
+        # correlation id is visible to everything the handler calls
+        bot = telebot.TeleBot(tenant.token, parse_mode="HTML", use_class_middlewares=True)
+        bot.setup_middleware(build_update_middleware())
+
+        # one store per database: its eviction must see the voices being written
+        store = VoiceStore(db, os.path.join(tenant.voices_dir, "objects"))
+        suffix = "" if tenant.primary else f":{tenant.name}"
+        add_maintenance_jobs(scheduler, db, bot, suffix, tenant.voices_dir, store)
+
+        previews = None
+        if PREVIEW_TEXT:
+            # file_ids are per bot token, so each tenant keeps its own previews
+            previews = VoicePreviews(db, client, os.path.join(tenant.voices_dir, "previews"))
+            add_preview_job(
+                scheduler,
+                previews,
+                lambda db=db, tenant=tenant: catalog_ids(tenant.models, get_models_from_db(db, tenant.models)),
+                suffix,
+            )
 
-    set_commands(bot)
-    start_expiry_cleanup_thread(db, bot)
+        # ✅ IMPORTANT: admin first, then user
+        register_admin_handlers(bot, db, states, scheduler, tenant, previews)
+        register_user_handlers(bot, db, lifecycle, client, tenant, cache, store, previews)
 
-    allowed_updates = ['message', 'callback_query']
+        bots[tenant.token] = bot
+        admins[tenant.token] = tenant.admin_ids
+
+    scheduler.every("state_purge", 300, states.purge_expired, jitter=30)
+    scheduler.every(
+        "metrics_flush",
+        METRICS_FLUSH_INTERVAL_SECONDS,
+        lambda: logging.info("metrics", extra={"jobs": scheduler.snapshot(), "audio_cache": cache.stats(),
+                                               "keys": client.pool.snapshot(), "telegram": limiter.snapshot(),
+                                               "hedge": client.hedger.snapshot() if client.hedger else None}),
+        jitter=5,
+    )
+    scheduler.start()
 
     # -------------------------
     # WEBHOOK MODE
@@ -82,13 +223,7 @@ def main():
             from flask import Flask, request
         except Exception as e:
             logging.error(f"Flask not installed; falling back to polling: {e}")
-            try:
-                bot.remove_webhook()
-            except Exception:
-                pass
-            notify_admin_online(bot)
-            bot.infinity_polling(skip_pending=True, allowed_updates=allowed_updates)
-            return
+            return _run_polling(bots, admins, lifecycle)
 
         app = Flask(__name__)
 
@@ -96,43 +231,53 @@ def main():
         def health():
             return "OK", 200
 
-        @app.post(f"/{TELEGRAM_BOT_TOKEN}")
-        def telegram_webhook():
+        base_url = WEBHOOK_BASE_URL.rstrip("/")
+        guards: Dict[str, WebhookGuard] = {}
+        for tok, tb in bots.items():
+            guards[tok] = WebhookGuard(
+                webhook_secret(tok),
+                on_missing_secret=lambda tb=tb, tok=tok: reset_webhook(tb, f"{base_url}/{tok}", webhook_secret(tok)),
+            )
+
+        @app.post("/<token>")
+        def telegram_webhook(token):
+            bot = bots.get(token)
+            if bot is None:
+                return "Not Found", 404
+            # header and size are checked before the body is read
+            guard = guards[token]
+            header = request.headers.get(SECRET_HEADER)
+            if not guard.authorized(header):
+                if header is None:
+                    addr = client_addr(request.headers.get("X-Forwarded-For"), request.remote_addr)
+                    small = (request.content_length or 0) <= MAX_BODY_BYTES
+                    guard.missing_secret(addr, request.get_data(cache=False) if small else b"")
+                return "Forbidden", 403
+            if not guard.size_ok(request.content_length):
+                return "Too Large", 413
+            # while draining, let Telegram redeliver to the next process
+            if not lifecycle.accepting():
+                return "DRAINING", 503
+            data = guard.accept(request.get_data(cache=False))
+            if data is None:
+                return "OK", 200
             try:
-                json_str = request.get_data().decode("utf-8")
-                update = telebot.types.Update.de_json(json_str)
+                update = telebot.types.Update.de_json(data)
                 bot.process_new_updates([update])
             except Exception as e:
+                guard.forget(data["update_id"])
                 logging.exception(f"Webhook processing error: {e}")
                 return "ERROR", 500
             return "OK", 200
 
-        webhook_url = WEBHOOK_BASE_URL.rstrip("/") + f"/{TELEGRAM_BOT_TOKEN}"
-
-        # always clear old webhook first
-        try:
-            bot.remove_webhook()
-        except Exception:
-            pass
-
-        # retries to avoid 429
-        for attempt in range(3):
-            try:
-                bot.set_webhook(url=webhook_url)
-                break
-            except Exception as e:
-                logging.warning(f"set_webhook failed (attempt {attempt+1}): {e}")
-                time.sleep(1 + attempt)
-        else:
-            bot.set_webhook(url=webhook_url)
-
-        try:
-            me = bot.get_me()
-            logging.info(f"Bot started webhook as @{me.username} -> {webhook_url}")
-        except Exception:
-            logging.info(f"Bot started webhook -> {webhook_url}")
+        # Telegram-side setup runs in the background while the listener comes up,
+        # so updates already queued by Telegram are served immediately.
+        def startup():
+            with ThreadPoolExecutor(max_workers=len(bots), thread_name_prefix="startup") as ex:
+                list(ex.map(lambda tb: run_startup(tb[1], f"{base_url}/{tb[0]}", webhook_secret(tb[0]), admins[tb[0]]), bots.items()))
+            lifecycle.resume_pending()
 
-        notify_admin_online(bot)
+        threading.Thread(target=startup, name="startup", daemon=True).start()
 
         app.run(host="0.0.0.0", port=int(PORT))
 
@@ -140,19 +285,25 @@ def main():
     # POLLING MODE
     # -------------------------
     else:
-        try:
-            bot.remove_webhook()
-        except Exception:
-            pass
+        _run_polling(bots, admins, lifecycle)
 
-        try:
-            me = bot.get_me()
-            logging.info(f"Bot started polling as @{me.username}")
-        except Exception:
-            logging.info("Bot started polling")
 
-        notify_admin_online(bot)
-        bot.infinity_polling(skip_pending=True, allowed_updates=allowed_updates)
+def _run_polling(bots: Dict[str, telebot.TeleBot], admins: Dict[str, List[int]], lifecycle: Lifecycle):
+    all_bots = list(bots.values())
+    for bot in all_bots:
+        lifecycle.on_stop(bot.stop_polling)
+    with ThreadPoolExecutor(max_workers=len(all_bots), thread_name_prefix="startup") as ex:
+        list(ex.map(lambda tb: run_startup(tb[1], admin_ids=admins[tb[0]]), bots.items()))
+    lifecycle.resume_pending()
+
+    def poll(bot):
+        bot.infinity_polling(skip_pending=True, allowed_updates=ALLOWED_UPDATES)
+
+    for bot in all_bots[1:]:
+        threading.Thread(target=poll, args=(bot,), name="polling", daemon=True).start()
+    poll(all_bots[0])
+    # polling only returns once a drain has begun; finish it before exiting
+    lifecycle.shutdown_and_exit()
 
 
 if __name__ == "__main__":
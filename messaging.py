@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+# Telegram shows a chat action for ~5 seconds; refresh a little before it lapses
+CHAT_ACTION_REFRESH_SECONDS = 4.5
+
+
+def _not_modified(e: Exception) -> bool:
+    return "message is not modified" in str(e)
+
+
+def edit_or_send(bot, message, text: str, reply_markup=None):
+    """
+    Replace `message` (the one carrying the pressed inline keyboard) in place;
+    post a new message only if it can't be edited (too old, a document, ...).
+    """
+    try:
+        return bot.edit_message_text(text, message.chat.id, message.message_id, reply_markup=reply_markup)
+    except Exception as e:
+        if _not_modified(e):
+            return None
+        return bot.send_message(message.chat.id, text, reply_markup=reply_markup)
+
+
+async def async_edit_or_send(bot, message, text: str, reply_markup=None):
+    try:
+        return await bot.edit_message_text(text, message.chat.id, message.message_id, reply_markup=reply_markup)
+    except Exception as e:
+        if _not_modified(e):
+            return None
+        return await bot.send_message(message.chat.id, text, reply_markup=reply_markup)
+
+
+@contextmanager
+def chat_action(bot, chat_id: int, action: str = "record_voice"):
+    """
+    Show `action` ("recording voice...") while the block runs. The calls go out
+    from a side thread so they overlap the work instead of delaying it.
+    """
+    done = threading.Event()
+
+    def loop():
+        while not done.is_set():
+            try:
+                bot.send_chat_action(chat_id, action)
+            except Exception:
+                return
+            done.wait(CHAT_ACTION_REFRESH_SECONDS)
+
+    threading.Thread(target=loop, name="chat-action", daemon=True).start()
+    try:
+        yield
+    finally:
+        done.set()
+
+
+@asynccontextmanager
+async def async_chat_action(bot, chat_id: int, action: str = "record_voice"):
+    async def loop():
+        while True:
+            try:
+                await bot.send_chat_action(chat_id, action)
+            except Exception:
+                return
+            await asyncio.sleep(CHAT_ACTION_REFRESH_SECONDS)
+
+    task = asyncio.create_task(loop())
+    try:
+        yield
+    finally:
+        task.cancel()
@@ -0,0 +1,228 @@
+import functools
+import json
+import re
+from typing import Dict, Iterable, List, Optional
+from config import TEXT_PAUSES, TEXT_PAUSES_JSON, TEXT_URL_MODE, TEXT_DROP_EMOJI
+
+URL_MODES = ("host", "keep", "drop")
+
+# Abbreviations whose period is not a sentence end (matched case-insensitively)
+ABBREVIATIONS = (
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "mt", "vs", "approx", "dept", "fig", "inc", "ltd",
+)
+# Also ordinary words ("I said no."): an abbreviation only when the next word
+# starts lowercase or with a digit ("No. 5", "etc. and"), else a sentence end
+AMBIGUOUS_ABBREVIATIONS = ("no", "etc", "co", "st")
+
+_EMOJI = (
+    "\U0001F000-\U0001FAFF"  # pictographs, emoticons, transport, flags, supplemental symbols
+    "\u2600-\u27BF"          # misc symbols, dingbats
+    "\u2B00-\u2BFF"          # arrows, stars
+    "\uFE0E\uFE0F\u200D\u20E3"  # variation selectors, joiner, keycap
+)
+
+# One alternation, tried left to right at each position: the first group that
+# matches decides the token, so the order below is the precedence.
+_TOKEN = re.compile(
+    rf"""
+      (?P<url>(?:https?://|www\.)\S*[^\s.,!?;:)\]"'])
+    | (?P<abbr>\b(?:[A-Za-z]\.){{2,}}
+        |\b(?i:{"|".join(ABBREVIATIONS)})\.(?=\s|$|[A-Z])
+        |\b(?i:{"|".join(AMBIGUOUS_ABBREVIATIONS)})\.(?=\s+[a-z0-9]))
+    | (?P<num>\d+(?:[.,:/]\d+)+)
+    | (?P<emoji>[{_EMOJI}]+)
+    | (?P<ellipsis>(?:\.{{3,}}|…)+)
+    | (?P<sentence>[.!?]+["')\]]*)(?=\s|$|[A-Z])
+    | (?P<comma>,)(?=\s)
+    | (?P<clause>[;:])(?=\s)
+    | (?P<paragraph>[ \t]*\n\s*)
+    | (?P<space>\s{{2,}}|[^\S ])
+    """,
+    re.VERBOSE,
+)
+_SENTENCE_END = frozenset(("sentence", "ellipsis", "paragraph"))
+
+
+def load_pauses() -> Dict[str, str]:
+    pauses = dict(TEXT_PAUSES)
+    if TEXT_PAUSES_JSON:
+        pauses.update(json.loads(TEXT_PAUSES_JSON))
+    unknown = set(pauses) - set(TEXT_PAUSES)
+    if unknown:
+        raise ValueError(f"Unknown pause rules: {sorted(unknown)}")
+    return pauses
+
+
+def _host(url: str) -> str:
+    host = re.split(r"[/?#]", url.split("://", 1)[-1], 1)[0]
+    return host[4:] if host.startswith("www.") else host
+
+
+class Normalizer:
+    """
+    Cleans a message for synthesis in one left-to-right scan.
+
+    Decimals, times and thousands separators ("3.5", "10:30", "1,000"),
+    abbreviations ("Dr.", "e.g.") and URLs are kept whole. Only
+    punctuation followed by whitespace is a pause, or a sentence end
+    followed directly by a capital ("world.How"), and each kind of pause
+    becomes its configured text. Whitespace is collapsed and emoji are
+    dropped, so equal messages normalize equally and share cache entries.
+    """
+
+    def __init__(
+        self,
+        pauses: Optional[Dict[str, str]] = None,
+        url_mode: str = TEXT_URL_MODE,
+        drop_emoji: bool = TEXT_DROP_EMOJI,
+        cache_size: int = 1024,
+    ):
+        if url_mode not in URL_MODES:
+            raise ValueError(f"url_mode must be one of {URL_MODES}")
+        self.pauses = pauses if pauses is not None else load_pauses()
+        self.url_mode = url_mode
+        self.drop_emoji = drop_emoji
+        # the same short messages ("hi", "test") come in over and over
+        self.normalize = functools.lru_cache(maxsize=cache_size)(self._normalize)
+
+    def sentences(self, text: str) -> List[str]:
+        """The normalized text split after each sentence-ending pause (pause text included)."""
+        text = text or ""
+        done: List[str] = []
+        out: List[str] = []
+        pos = 0
+        for m in _TOKEN.finditer(text):
+            if m.start() > pos:
+                self._plain(out, text[pos:m.start()])
+            pos = m.end()
+            kind = m.lastgroup
+            token = m.group(kind)
+
+            if kind == "space" or (kind == "emoji" and self.drop_emoji):
+                if out and not out[-1].endswith((" ", "\n")):
+                    out.append(" ")
+            elif kind == "url":
+                if self.url_mode == "keep":
+                    out.append(token)
+                elif self.url_mode == "host":
+                    out.append(_host(token))
+            elif kind in ("abbr", "num", "emoji"):
+                out.append(token)
+            else:
+                # a pause: no space before it, its rule after it
+                while out and out[-1].endswith(" "):
+                    out[-1] = out[-1].rstrip(" ")
+                    if not out[-1]:
+                        out.pop()
+                if kind == "paragraph":
+                    if not out or out[-1].endswith("\n"):
+                        continue
+                    out.append(self.pauses["paragraph"])
+                else:
+                    out.append(("…" if kind == "ellipsis" else token) + self.pauses[kind])
+                if kind in _SENTENCE_END:
+                    done.append("".join(out))
+                    out = []
+        if pos < len(text):
+            self._plain(out, text[pos:])
+        if out:
+            done.append("".join(out))
+        return [s for s in done if s.strip()]
+
+    @staticmethod
+    def _plain(out: List[str], run: str):
+        # words and single spaces between tokens are copied as one slice
+        if not out or out[-1].endswith((" ", "\n")):
+            run = run.lstrip(" ")
+        if run:
+            out.append(run)
+
+    def _normalize(self, text: str) -> str:
+        return "".join(self.sentences(text)).strip()
+
+    def normalize_batch(self, texts: Iterable[str]) -> List[str]:
+        """Normalize many texts (segments of a long text, a backlog of jobs); repeats are computed once."""
+        return [self.normalize(t) for t in texts]
+
+    def segments(self, text: str, max_chars: int) -> List[str]:
+        """
+        Normalized `text` packed into chunks of at most `max_chars`, cut at
+        sentence ends where possible, for synthesizing a long text piecewise.
+        """
+        chunks: List[str] = []
+        current = ""
+        for sentence in self.sentences(text):
+            while len(sentence) > max_chars:
+                # a single over-long sentence: cut at its last space that fits
+                cut = sentence.rfind(" ", 0, max_chars + 1)
+                cut = cut if cut > 0 else max_chars
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip(" ")
+            if len(current) + len(sentence) > max_chars and current:
+                chunks.append(current)
+                current = ""
+            current += sentence
+        if current:
+            chunks.append(current)
+        return [c.strip() for c in chunks if c.strip()]
+
+
+_default: Optional[Normalizer] = None
+
+
+def normalize(text: str) -> str:
+    """Normalize with the configured rules (TEXT_PAUSES, TEXT_URL_MODE, TEXT_DROP_EMOJI)."""
+    global _default
+    if _default is None:
+        _default = Normalizer()
+    return _default.normalize(text or "")
+
+
+# -----------------------
+# BENCHMARK: python normalizer.py [iterations]
+# -----------------------
+def _legacy_humanize(s: str) -> str:
+    """The multi-pass humanize_text this module replaced, kept for comparison."""
+    s = (s or "").strip()
+    s = re.sub(r"\s+", " ", s)
+    s = s.replace(", ", ", … ")
+    s = s.replace("!", "!\n").replace("?", "?\n").replace(".", ".\n")
+    s = re.sub(r"\n{3,}", "\n\n", s)
+    return s.strip()
+
+
+BENCH_SAMPLES = (
+    "Hello there! How are you today?",
+    "The price is 3.5 dollars, or 1,250.75 taka. Meet me at 10:30 near St. Mary's, e.g. by the gate.",
+    "Visit https://modelboxbd.com/plans?ref=bot for details... Dr. Rahman said: it's fine 😀👍",
+    "Line one\nLine two\n\nLine three; with a clause: and more, and more, and more.",
+    "ok",
+)
+
+
+def bench(iterations: int = 20000):
+    import time
+
+    fresh = Normalizer(cache_size=0)  # measure the scan itself, not cache hits
+    for name, fn in (("legacy humanize_text", _legacy_humanize), ("normalizer", fresh.normalize)):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for s in BENCH_SAMPLES:
+                fn(s)
+        per_call = (time.perf_counter() - started) / (iterations * len(BENCH_SAMPLES)) * 1e6
+        chars = sum(len(fn(s)) for s in BENCH_SAMPLES)
+        print(f"{name:22s} {per_call:7.2f} µs/message, {chars} chars out")
+    print()
+    for s in BENCH_SAMPLES:
+        print(repr(s))
+        print("  legacy:", repr(_legacy_humanize(s)))
+        print("  new:   ", repr(fresh.normalize(s)))
+
+
+if __name__ == "__main__":
+    import sys
+
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,260 @@
+import asyncio
+import contextvars
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_CHAT_RATE,
+    TELEGRAM_GROUP_RATE_PER_MINUTE,
+    TELEGRAM_BULK_RESERVE,
+    TELEGRAM_POOL_SIZE,
+    TELEGRAM_MAX_RETRY_AFTER_SECONDS,
+)
+
+log = logging.getLogger("outbound")
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("outbound_priority", default=INTERACTIVE)
+
+# calls that post into a chat and count against Telegram's flood limits
+_METERED = re.compile(r"^(send(?!ChatAction)|edit|copy|forward)", re.IGNORECASE)
+_URL = re.compile(r"/bot([^/]+)/(\w+)$")
+
+
+@contextmanager
+def bulk():
+    """Run Telegram calls in this block (broadcasts, expiry notices) behind interactive replies."""
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Not locked itself: the limiter holds one lock over all of its buckets."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they are now)."""
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < amount:
+            wait = max(wait, (amount - self.tokens) / self.rate)
+        return wait
+
+    def block(self, seconds: float, now: float):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+
+
+class TelegramLimiter:
+    """
+    Outbound layer for every telebot call: one pooled keep-alive session, a
+    global and a per-chat token bucket per bot token, and automatic waits
+    on 429 `retry_after`. Bulk traffic only takes global tokens above a
+    reserve and yields while interactive calls are waiting.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        chat_rate: float = TELEGRAM_CHAT_RATE,
+        group_rate_per_minute: float = TELEGRAM_GROUP_RATE_PER_MINUTE,
+        bulk_reserve: float = TELEGRAM_BULK_RESERVE,
+        pool_size: int = TELEGRAM_POOL_SIZE,
+        max_retry_after: float = TELEGRAM_MAX_RETRY_AFTER_SECONDS,
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate_per_minute / 60.0
+        self.reserve = bulk_reserve * global_rate
+        self.max_retry_after = max_retry_after
+        self._lock = threading.Lock()
+        self._globals: Dict[str, TokenBucket] = {}
+        self._chats: Dict[Tuple[str, str], TokenBucket] = {}
+        self._interactive_waiting = 0
+        self.stats = {"calls": 0, "waited_ms": 0.0, "rate_limited": 0}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def install(self):
+        """Route every telebot (sync) API call through this limiter."""
+        from telebot import apihelper
+
+        apihelper.CUSTOM_REQUEST_SENDER = self.send
+
+    # -----------------------
+    # buckets
+    # -----------------------
+    def _buckets(self, token: str, chat_id) -> Tuple[TokenBucket, Optional[TokenBucket]]:
+        g = self._globals.get(token)
+        if g is None:
+            g = self._globals[token] = TokenBucket(self.global_rate, self.global_rate)
+        if chat_id is None:
+            return g, None
+        key = (token, str(chat_id))
+        c = self._chats.get(key)
+        if c is None:
+            if len(self._chats) > 10000:
+                self._prune()
+            # negative ids are groups/channels: 20 messages per minute
+            if str(chat_id).startswith("-"):
+                c = TokenBucket(self.group_rate, max(1.0, self.group_rate * 60 / 4))
+            else:
+                c = TokenBucket(self.chat_rate, 3.0)
+            self._chats[key] = c
+        return g, c
+
+    def _prune(self):
+        now = time.monotonic()
+        for key, b in list(self._chats.items()):
+            b.refill(now)
+            if b.tokens >= b.capacity and b.blocked_until <= now:
+                del self._chats[key]
+
+    def _try_take(self, token: str, chat_id, is_bulk: bool, started: float, waiting: bool) -> Tuple[float, bool]:
+        """One attempt: (0, waiting) once the tokens are taken, else (seconds to wait, waiting)."""
+        need = 1.0 + (self.reserve if is_bulk else 0.0)
+        with self._lock:
+            now = time.monotonic()
+            g, c = self._buckets(token, chat_id)
+            g.refill(now)
+            wait = g.wait_for(need, now)
+            if c is not None:
+                c.refill(now)
+                wait = max(wait, c.wait_for(1.0, now))
+            if is_bulk and self._interactive_waiting:
+                wait = max(wait, 0.05)
+            if wait <= 0:
+                g.tokens -= 1
+                if c is not None:
+                    c.tokens -= 1
+                self.stats["calls"] += 1
+                self.stats["waited_ms"] += (now - started) * 1000
+                return 0.0, waiting
+            # only contention for the global bucket holds bulk back;
+            # one throttled chat must not stall everyone's broadcast
+            if not is_bulk and not waiting and g.wait_for(1.0, now) > 0:
+                waiting = True
+                self._interactive_waiting += 1
+            return wait, waiting
+
+    def acquire(self, token: str, chat_id=None, priority: Optional[str] = None):
+        is_bulk = (priority or _priority.get()) == BULK
+        started = time.monotonic()
+        waiting = False
+        try:
+            while True:
+                wait, waiting = self._try_take(token, chat_id, is_bulk, started, waiting)
+                if wait <= 0:
+                    return
+                time.sleep(min(wait, 1.0))
+        finally:
+            if waiting:
+                with self._lock:
+                    self._interactive_waiting -= 1
+
+    async def acquire_async(self, token: str, chat_id=None, priority: Optional[str] = None):
+        """`acquire` for the event loop (AsyncTeleBot calls are not routed through `send`)."""
+        is_bulk = (priority or _priority.get()) == BULK
+        started = time.monotonic()
+        waiting = False
+        try:
+            while True:
+                wait, waiting = self._try_take(token, chat_id, is_bulk, started, waiting)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(min(wait, 1.0))
+        finally:
+            if waiting:
+                with self._lock:
+                    self._interactive_waiting -= 1
+
+    def penalize(self, token: str, chat_id, seconds: float):
+        with self._lock:
+            now = time.monotonic()
+            g, c = self._buckets(token, chat_id)
+            (c or g).block(seconds, now)
+
+    # -----------------------
+    # apihelper.CUSTOM_REQUEST_SENDER
+    # -----------------------
+    def send(self, method, url, params=None, files=None, **kwargs) -> requests.Response:
+        m = _URL.search(url)
+        token, api_method = (m.group(1), m.group(2)) if m else ("", "")
+        metered = bool(_METERED.match(api_method))
+        chat_id = (params or {}).get("chat_id") if metered else None
+
+        while True:
+            if metered:
+                self.acquire(token, chat_id)
+            resp = self.session.request(method, url, params=params, files=files, **kwargs)
+            if resp.status_code != 429:
+                return resp
+
+            with self._lock:
+                self.stats["rate_limited"] += 1
+            retry_after = _retry_after(resp)
+            log.warning(
+                "telegram rate limited",
+                extra={"method": api_method, "chat_id": chat_id, "retry_after": retry_after},
+            )
+            if retry_after is None or retry_after > self.max_retry_after:
+                return resp  # let telebot raise ApiTelegramException as before
+            self.penalize(token, chat_id, retry_after)
+            if not metered:
+                time.sleep(retry_after)
+            _rewind(files)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, chats=len(self._chats), interactive_waiting=self._interactive_waiting)
+
+
+def _retry_after(resp) -> Optional[float]:
+    try:
+        return float(resp.json()["parameters"]["retry_after"])
+    except Exception:
+        return None
+
+
+def exception_retry_after(exc: Exception) -> Optional[float]:
+    """retry_after of a telebot ApiTelegramException for a 429, else None."""
+    try:
+        return float(exc.result_json["parameters"]["retry_after"])
+    except Exception:
+        return None
+
+
+def _rewind(files):
+    """Uploads are re-sent from the start on retry."""
+    for value in (files or {}).values():
+        f = value[1] if isinstance(value, tuple) and len(value) > 1 else value
+        if hasattr(f, "seek"):
+            try:
+                f.seek(0)
+            except Exception:
+                pass
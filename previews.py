@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+from config import PREVIEW_TEXT, PREVIEW_ENCODING_PROFILE
+from encoding import EncodingProfile, get_profile
+
+log = logging.getLogger("previews")
+
+
+def catalog_ids(*model_lists: Iterable[Dict]) -> List[str]:
+    """Voice ids across the given model lists (picker, admin-managed), without duplicates."""
+    seen = {}
+    for models in model_lists:
+        for m in models or []:
+            if m.get("id"):
+                seen.setdefault(str(m["id"]), None)
+    return list(seen)
+
+
+class VoicePreviews:
+    """
+    One short sample clip per catalog voice for the model picker.
+
+    A clip is synthesized once per voice id and kept on disk under `root`;
+    the first send uploads it and every later one reuses its Telegram
+    file_id, so previewing costs no Fish Audio call and no upload. A voice
+    whose id changes is a new voice here and gets a new clip.
+    """
+
+    def __init__(self, db, client, root: str, text: str = PREVIEW_TEXT, profile: Optional[EncodingProfile] = None):
+        self.db = db
+        self.client = client  # a sync FishAudioClient
+        self.root = root
+        self.text = text
+        self.profile = profile or get_profile(PREVIEW_ENCODING_PROFILE)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def path_for(self, voice_id: str) -> str:
+        name = hashlib.sha256(voice_id.encode()).hexdigest()[:32]
+        return os.path.join(self.root, name + self.profile.extension)
+
+    def _lock_for(self, voice_id: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(voice_id, threading.Lock())
+
+    # -----------------------
+    # rendering
+    # -----------------------
+    def synthesize(self, voice_id: str) -> str:
+        """Write the clip for `voice_id` to disk and return its path. No DB access."""
+        audio = self.client.synthesize_text(self.text, voice_id, profile=self.profile)
+        path = self.path_for(voice_id)
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(audio)
+        os.replace(tmp, path)
+        return path
+
+    def render(self, voice_id: str) -> str:
+        """Path of the clip on disk, synthesizing it only if there is none yet."""
+        with self._lock_for(voice_id):
+            row = self.db.get_voice_preview(voice_id)
+            if row and row.get("path") and os.path.exists(row["path"]):
+                return row["path"]
+            path = self.synthesize(voice_id)
+            self.db.set_voice_preview(voice_id, path)
+            log.info("voice preview rendered", extra={"voice_id": voice_id})
+            return path
+
+    def refresh(self, voice_ids: List[str], stop_event: Optional[threading.Event] = None) -> Dict:
+        """Scheduled: render clips for new voice ids, drop those of voices no longer offered."""
+        known = self.db.voice_preview_ids()
+        rendered = failed = 0
+        for voice_id in voice_ids:
+            if stop_event is not None and stop_event.is_set():
+                break
+            if voice_id in known:
+                continue
+            try:
+                self.render(voice_id)
+                rendered += 1
+            except Exception as e:
+                # the next run (or the first user who asks) tries again
+                failed += 1
+                log.warning("voice preview failed", extra={"voice_id": voice_id, "error": str(e)})
+
+        stale = known - set(voice_ids)
+        for path in self.db.delete_voice_previews(list(stale)) if stale else []:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        result = {"rendered": rendered, "failed": failed, "removed": len(stale)}
+        log.info("voice previews", extra=result)
+        return result
+
+    # -----------------------
+    # sending
+    # -----------------------
+    def send(self, bot, chat_id: int, voice_id: str, caption: Optional[str] = None):
+        row = self.db.get_voice_preview(voice_id)
+        if row and row.get("file_id"):
+            try:
+                return bot.send_voice(chat_id, row["file_id"], caption=caption)
+            except Exception as e:
+                log.warning("voice preview file_id failed", extra={"voice_id": voice_id, "error": str(e)})
+
+        path = self.render(voice_id)
+        with open(path, "rb") as f:
+            sent = bot.send_voice(chat_id, f, caption=caption)
+        if sent and sent.voice:
+            self.db.set_voice_preview_file_id(voice_id, sent.voice.file_id)
+        return sent
+
+    async def async_send(self, bot, adb, chat_id: int, voice_id: str, caption: Optional[str] = None):
+        """`send` for AsyncTeleBot; the file_id lookups go through `adb`, rendering runs on a worker thread."""
+        row = await adb.get_voice_preview(voice_id)
+        if row and row.get("file_id"):
+            try:
+                return await bot.send_voice(chat_id, row["file_id"], caption=caption)
+            except Exception as e:
+                log.warning("voice preview file_id failed", extra={"voice_id": voice_id, "error": str(e)})
+
+        # render() holds the per-voice lock, so this and a scheduled refresh never both synthesize
+        path = await asyncio.to_thread(self.render, voice_id)
+        with open(path, "rb") as f:
+            sent = await bot.send_voice(chat_id, f, caption=caption)
+        if sent and sent.voice:
+            await adb.set_voice_preview_file_id(voice_id, sent.voice.file_id)
+        return sent
@@ -0,0 +1,90 @@
+"""
+On-demand sampling profiler for all Python threads.
+
+Loaded only when an admin starts a profiling run. A sampler thread reads
+sys._current_frames() every `interval` seconds, so the cost is a few stack
+walks per tick and nothing at all when no run is active.
+"""
+import io
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Tuple
+
+_running = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _thread_group(name: str) -> str:
+    # WorkerThread1 / WorkerThread2 … aggregate into one root
+    return name.rstrip("0123456789") or name
+
+
+def sample(seconds: float, interval: float = 0.005) -> Tuple[Counter, int]:
+    """Collect collapsed stacks (root;…;leaf → count) for `seconds`."""
+    stacks: Counter = Counter()
+    me = threading.get_ident()
+    names: Dict[int, str] = {}
+    ticks = 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        if ticks % 50 == 0:
+            names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            parts = []
+            while frame is not None:
+                parts.append(_frame_label(frame))
+                frame = frame.f_back
+            parts.append(_thread_group(names.get(ident, str(ident))))
+            stacks[";".join(reversed(parts))] += 1
+        ticks += 1
+        time.sleep(interval)
+    return stacks, ticks
+
+
+def summarize(stacks: Counter, ticks: int, top: int = 20) -> str:
+    total = sum(stacks.values()) or 1
+    self_time: Counter = Counter()
+    inclusive: Counter = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")[1:]
+        if not frames:
+            continue
+        self_time[frames[-1]] += count
+        for f in set(frames):
+            inclusive[f] += count
+
+    lines = [f"🔥 Profile: {ticks} ticks, {total} samples", "", "Top self time:"]
+    for frame, count in self_time.most_common(top):
+        lines.append(f"{100.0 * count / total:5.1f}%  {frame}")
+    lines += ["", "Top inclusive:"]
+    for frame, count in inclusive.most_common(top):
+        lines.append(f"{100.0 * count / total:5.1f}%  {frame}")
+    return "\n".join(lines)
+
+
+def collapsed(stacks: Counter) -> bytes:
+    """Brendan Gregg collapsed-stack format, ready for flamegraph.pl / speedscope."""
+    out = io.StringIO()
+    for stack, count in stacks.most_common():
+        out.write(f"{stack} {count}\n")
+    return out.getvalue().encode("utf-8")
+
+
+def run(seconds: float, interval: float = 0.005, top: int = 20) -> Tuple[str, bytes]:
+    """One profiling run at a time; raises RuntimeError if another is active."""
+    if not _running.acquire(blocking=False):
+        raise RuntimeError("A profiling run is already in progress")
+    try:
+        stacks, ticks = sample(seconds, interval)
+    finally:
+        _running.release()
+    return summarize(stacks, ticks, top), collapsed(stacks)
@@ -0,0 +1,252 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+from config import (
+    FISH_AUDIO_ROUTE_BY_LATENCY,
+    TTS_MAX_RETRIES,
+    TTS_BACKOFF_BASE_SECONDS,
+    TTS_BACKOFF_MAX_SECONDS,
+    TTS_BREAKER_FAILURES,
+    TTS_BREAKER_RESET_SECONDS,
+    TTS_HEDGE_PERCENTILE,
+    TTS_HEDGE_MAX_EXTRA,
+    TTS_HEDGE_MIN_DELAY_SECONDS,
+    TTS_HEDGE_INITIAL_DELAY_SECONDS,
+)
+
+
+class DeadlineExceeded(RuntimeError):
+    pass
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class Deadline:
+    """Absolute end-to-end budget shared by every attempt of one request."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + float(seconds)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """Socket timeout for the next attempt; raises once the budget is spent."""
+        left = self.remaining()
+        if left <= 0:
+            raise DeadlineExceeded("deadline exceeded")
+        return min(left, cap) if cap else left
+
+
+class CircuitBreaker:
+    """
+    Classic closed → open → half-open breaker.
+
+    After `failure_threshold` consecutive failures calls fail fast for
+    `reset_seconds`; then a single probe is let through and its outcome
+    decides whether the circuit closes again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = TTS_BREAKER_FAILURES, reset_seconds: float = TTS_BREAKER_RESET_SECONDS):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = float(reset_seconds)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Whether a call would be let through now; only reads the state."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_seconds
+            return not self._probe_in_flight
+
+    def before_call(self):
+        """
+        Let a call through or raise CircuitOpen. Once the reset period is
+        over, exactly one caller becomes the half-open probe: the flag is
+        claimed under the lock, so concurrent callers fail fast until the
+        probe's outcome is recorded.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    raise CircuitOpen("circuit open")
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                raise CircuitOpen("circuit half-open, probe in flight")
+            self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+class RetryPolicy:
+    """Bounded retries with full-jitter exponential backoff."""
+
+    def __init__(
+        self,
+        max_retries: int = TTS_MAX_RETRIES,
+        base_seconds: float = TTS_BACKOFF_BASE_SECONDS,
+        max_seconds: float = TTS_BACKOFF_MAX_SECONDS,
+    ):
+        self.max_retries = max(0, int(max_retries))
+        self.base_seconds = float(base_seconds)
+        self.max_seconds = float(max_seconds)
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_seconds, self.base_seconds * (2 ** attempt)))
+
+
+class Hedger:
+    """
+    Decides when a slow request gets a backup copy.
+
+    The delay is the `percentile` of recent time-to-first-byte samples, so
+    only the slowest tail is hedged. Extra load is budgeted: every primary
+    request earns `max_extra` of a token (up to `burst`) and every hedge
+    spends a whole one, so hedges never exceed that share of traffic, even
+    when upstream is slow across the board.
+    """
+
+    def __init__(
+        self,
+        percentile: float = TTS_HEDGE_PERCENTILE,
+        max_extra: float = TTS_HEDGE_MAX_EXTRA,
+        min_delay: float = TTS_HEDGE_MIN_DELAY_SECONDS,
+        initial_delay: float = TTS_HEDGE_INITIAL_DELAY_SECONDS,
+        window: int = 200,
+        min_samples: int = 20,
+        burst: float = 5.0,
+    ):
+        self.percentile = min(max(float(percentile), 0.0), 1.0)
+        self.max_extra = max(0.0, float(max_extra))
+        self.min_delay = float(min_delay)
+        self.initial_delay = float(initial_delay)
+        self.min_samples = min_samples
+        self.burst = burst
+        self._samples = deque(maxlen=window)
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "hedged": 0, "hedge_won": 0, "denied": 0, "no_key": 0}
+
+    def observe_ttfb(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def delay(self) -> float:
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return self.initial_delay
+            ordered = sorted(self._samples)
+        return max(self.min_delay, ordered[int(self.percentile * (len(ordered) - 1))])
+
+    def on_primary(self):
+        with self._lock:
+            self.stats["requests"] += 1
+            self._tokens = min(self.burst, self._tokens + self.max_extra)
+
+    def try_hedge(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                self.stats["denied"] += 1
+                return False
+            self._tokens -= 1.0
+            self.stats["hedged"] += 1
+            return True
+
+    def record_no_key(self):
+        """A hedge was due but no key, the primary's included, was healthy with a free slot; the budget is untouched."""
+        with self._lock:
+            self.stats["no_key"] += 1
+
+    def record_win(self, hedge: bool):
+        if hedge:
+            with self._lock:
+                self.stats["hedge_won"] += 1
+
+    def snapshot(self) -> Dict:
+        delay = self.delay()
+        with self._lock:
+            return dict(self.stats, delay=round(delay, 3), samples=len(self._samples))
+
+
+class Route:
+    """One way of reaching upstream: a transport ("rest" / "sdk") and a model backend."""
+
+    def __init__(self, transport: str, backend: str):
+        self.transport = transport
+        self.backend = backend
+        self.breaker = CircuitBreaker()
+        self.ewma_latency: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return f"{self.transport}:{self.backend}"
+
+    def observe_latency(self, seconds: float, alpha: float = 0.2):
+        with self._lock:
+            if self.ewma_latency is None:
+                self.ewma_latency = seconds
+            else:
+                self.ewma_latency = alpha * seconds + (1 - alpha) * self.ewma_latency
+
+
+def parse_routes(spec: str, default_backend: str) -> List[Route]:
+    """'rest:s1,sdk:s1,rest:speech-1.6' → routes; a bare 'sdk' uses the default backend."""
+    routes = []
+    seen = set()
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        transport, _, backend = item.partition(":")
+        transport = transport.strip().lower()
+        if transport not in ("rest", "sdk"):
+            continue
+        route = Route(transport, backend.strip() or default_backend)
+        if route.name not in seen:
+            seen.add(route.name)
+            routes.append(route)
+    return routes or [Route("rest", default_backend), Route("sdk", default_backend)]
+
+
+def order_routes(routes: List[Route], by_latency: bool = FISH_AUDIO_ROUTE_BY_LATENCY) -> List[Route]:
+    """
+    Routes whose breaker lets calls through, in the configured failover
+    order. With `by_latency` the fastest observed route goes first instead;
+    routes never measured then keep their configured order behind measured ones.
+    """
+    usable = [r for r in routes if r.breaker.available()]
+    if not by_latency:
+        return usable
+    ranked = sorted(enumerate(usable), key=lambda ir: (ir[1].ewma_latency is None, ir[1].ewma_latency or 0.0, ir[0]))
+    return [r for _, r in ranked]
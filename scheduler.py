@@ -1,42 +1,397 @@
+import logging
 import os
-import time
+import random
+import socket
 import threading
-from datetime import datetime
-from config import VOICES_DIR
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set
+from config import (
+    VOICES_DIR,
+    EXPIRY_CLEANUP_INTERVAL_SECONDS,
+    EXPIRY_REMINDER_HOURS,
+    SCHEDULE_VOICE_GC,
+    SCHEDULE_DB_MAINTENANCE,
+    SCHEDULE_VOICE_RETENTION,
+    PREVIEW_REFRESH_INTERVAL_SECONDS,
+    METRICS_FLUSH_INTERVAL_SECONDS,
+    SCHEDULER_LEASE_SECONDS,
+)
+from outbound import bulk as outbound_bulk
+
+
+# -------------------------
+# CRON
+# -------------------------
+def _parse_cron_field(field: str, lo: int, hi: int) -> Set[int]:
+    out: Set[int] = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_s = part.split("/", 1)
+            step = int(step_s)
+        if part in ("*", ""):
+            start, end = lo, hi
+        elif "-" in part:
+            a, b = part.split("-", 1)
+            start, end = int(a), int(b)
+        else:
+            start = end = int(part)
+        if start < lo or end > hi or start > end or step < 1:
+            raise ValueError(f"cron field out of range: {field!r}")
+        out.update(range(start, end + 1, step))
+    return out
+
+
+class CronSpec:
+    """
+    Five-field cron expression (minute hour day-of-month month day-of-week), UTC.
+    As in cron, when both day fields are restricted (neither starts with `*`)
+    a day matches if either of them does.
+    """
+
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron needs 5 fields: {expr!r}")
+        self.expr = expr
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = _parse_cron_field(fields[2], 1, 31)
+        self.months = _parse_cron_field(fields[3], 1, 12)
+        # cron: 0 and 7 are Sunday; Python: Monday=0 … Sunday=6
+        self.weekdays = {(d - 1) % 7 for d in _parse_cron_field(fields[4], 0, 7)}
+        self.either_day = not fields[2].startswith("*") and not fields[4].startswith("*")
+
+    def day_matches(self, t: datetime) -> bool:
+        if self.either_day:
+            return t.day in self.days or t.weekday() in self.weekdays
+        return t.day in self.days and t.weekday() in self.weekdays
+
+    def next_after(self, dt: datetime) -> datetime:
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366)
+        while t < limit:
+            if t.month not in self.months or not self.day_matches(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if t.hour not in self.hours:
+                t = (t + timedelta(hours=1)).replace(minute=0)
+                continue
+            if t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+                continue
+            return t
+        raise ValueError(f"cron never fires: {self.expr!r}")
+
+
+# -------------------------
+# SCHEDULER
+# -------------------------
+class Job:
+    def __init__(self, name: str, fn: Callable[[], None], interval: Optional[float], cron: Optional[CronSpec], jitter: float):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.cron = cron
+        self.jitter = float(jitter)
+        self.next_run = 0.0
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_run_at: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def schedule_next(self, now: float):
+        if self.cron is not None:
+            nxt = self.cron.next_after(datetime.utcfromtimestamp(now)) - datetime(1970, 1, 1)
+            base = nxt.total_seconds()
+        else:
+            base = now + self.interval
+        self.next_run = base + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+
+class LeaderLease:
+    """
+    Scheduler leadership among processes sharing a state store: the holder
+    renews the lease every third of its ttl, and a standby takes over once
+    the holder has stopped renewing for a whole ttl.
+    """
+
+    def __init__(self, states, name: str = "scheduler", ttl: float = SCHEDULER_LEASE_SECONDS):
+        self.states = states
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self._held = False
+        self._check_at = 0.0
+
+    def held(self) -> bool:
+        now = time.time()
+        if now >= self._check_at:
+            try:
+                held = self.states.acquire_lease(self.name, self.owner, self.ttl)
+            except Exception:
+                logging.exception("scheduler lease check failed")
+                held = False
+            if held != self._held:
+                logging.info(f"scheduler {'leader' if held else 'standby'} ({self.owner})")
+            self._held = held
+            self._check_at = now + self.ttl / 3
+        return self._held
+
+
+class Scheduler:
+    """
+    Interval and cron jobs on one timer thread.
+
+    Each due job runs in its own short-lived thread; a job that is still
+    running when it comes due again is skipped, so runs of the same job never
+    overlap. Duration and failure of the last run are kept per job. With a
+    `leader` check (LeaderLease.held) jobs only run while it returns True,
+    so several processes can share one database.
+    """
+
+    def __init__(self, stop_event: Optional[threading.Event] = None, leader: Optional[Callable[[], bool]] = None):
+        self.stop_event = stop_event or threading.Event()
+        self.jobs: Dict[str, Job] = {}
+        self.leader = leader
+        self._lock = threading.Lock()
+
+    def every(self, name: str, seconds: float, fn: Callable[[], None], jitter: float = 0.0, run_at_start: bool = False):
+        job = Job(name, fn, float(seconds), None, jitter)
+        job.next_run = time.time() + (random.uniform(0, jitter) if run_at_start and jitter else 0.0)
+        if not run_at_start:
+            job.schedule_next(time.time())
+        return self._add(job)
+
+    def cron(self, name: str, expr: str, fn: Callable[[], None], jitter: float = 0.0):
+        job = Job(name, fn, None, CronSpec(expr), jitter)
+        job.schedule_next(time.time())
+        return self._add(job)
+
+    def _add(self, job: Job) -> Job:
+        with self._lock:
+            self.jobs[job.name] = job
+        return job
 
+    def start(self) -> threading.Thread:
+        t = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        t.start()
+        return t
 
-def _expiry_cleanup_worker(db, bot, interval_seconds: int):
-    while True:
+    def _loop(self):
+        while not self.stop_event.is_set():
+            leading = self.leader is None or self.leader()
+            now = time.time()
+            due: List[Job] = []
+            with self._lock:
+                for job in self.jobs.values():
+                    if job.next_run <= now:
+                        job.schedule_next(now)
+                        if not leading:
+                            continue  # another process runs it
+                        if job.running:
+                            job.skipped += 1
+                            continue
+                        job.running = True
+                        due.append(job)
+                next_wake = min((j.next_run for j in self.jobs.values()), default=now + 60)
+            if self.stop_event.is_set():
+                return
+            for job in due:
+                threading.Thread(target=self._run, args=(job,), name=f"job-{job.name}", daemon=True).start()
+
+            # short naps so newly added jobs and stop requests are noticed quickly
+            self.stop_event.wait(max(0.05, min(next_wake - time.time(), 1.0)))
+
+    def _run(self, job: Job):
+        started = time.monotonic()
+        job.last_run_at = datetime.utcnow().isoformat(timespec="seconds")
         try:
-            users = db.list_users(limit=10000)
-            now = datetime.utcnow()
-            for u in users:
-                exp = u.get("validity_expire_at")
-                if not exp:
-                    continue
+            # everything a job sends (expiry notices, reminders) queues behind interactive replies
+            with outbound_bulk():
+                job.fn()
+            job.last_error = None
+        except Exception as e:
+            job.failures += 1
+            job.last_error = f"{type(e).__name__}: {e}"
+            logging.exception(f"Scheduled job {job.name} failed")
+        finally:
+            job.last_duration = round(time.monotonic() - started, 3)
+            job.runs += 1
+            job.running = False
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            jobs = list(self.jobs.values())
+        return [
+            {
+                "name": j.name,
+                "schedule": j.cron.expr if j.cron else f"every {int(j.interval)}s",
+                "runs": j.runs,
+                "failures": j.failures,
+                "skipped": j.skipped,
+                "running": j.running,
+                "last_run_at": j.last_run_at,
+                "last_duration": j.last_duration,
+                "last_error": j.last_error,
+                "next_run_at": datetime.utcfromtimestamp(j.next_run).isoformat(timespec="seconds"),
+            }
+            for j in jobs
+        ]
+
+
+def format_jobs(snapshot: List[Dict]) -> str:
+    lines = ["🗓 Scheduled jobs"]
+    for j in snapshot:
+        status = "⏳ running" if j["running"] else ("❌ " + j["last_error"] if j["last_error"] else "✅")
+        lines.append(
+            f"\n<b>{j['name']}</b> ({j['schedule']})\n"
+            f"runs={j['runs']} failures={j['failures']} skipped={j['skipped']}\n"
+            f"last: {j['last_run_at'] or 'never'} in {j['last_duration'] if j['last_duration'] is not None else '-'}s\n"
+            f"next: {j['next_run_at']}\n"
+            f"{status}"
+        )
+    return "\n".join(lines)
+
+
+# -------------------------
+# JOBS
+# -------------------------
+def expire_users(db, bot, stop_event: Optional[threading.Event] = None, store=None):
+    now = datetime.utcnow()
+    users = db.iter_users(
+        ("id", "validity_expire_at"),
+        where="validity_expire_at IS NOT NULL AND validity_expire_at <= ?",
+        params=(now.isoformat(),),
+    )
+    for u in users:
+        if stop_event is not None and stop_event.is_set():
+            return
+        exp = u.validity_expire_at
+        if not exp:
+            continue
+        try:
+            if datetime.fromisoformat(exp) <= now:
+                user_id = int(u.id)
+                voices = db.list_user_voices(user_id)
+                for v in voices:
+                    # content-addressed files may be shared; the store releases those
+                    if v.get("blob_hash") or not v.get("file_path"):
+                        continue
+                    try:
+                        if os.path.exists(v["file_path"]):
+                            os.remove(v["file_path"])
+                    except Exception:
+                        pass
+                if store is not None:
+                    store.purge_user(user_id)
+                else:
+                    db.delete_user_voices(user_id)
+                db.update_user_fields(user_id, {"is_premium": 0, "credits": 0, "validity_expire_at": None})
                 try:
-                    if datetime.fromisoformat(exp) <= now:
-                        user_id = int(u["id"])
-                        voices = db.list_user_voices(user_id)
-                        for v in voices:
-                            try:
-                                if os.path.exists(v["file_path"]):
-                                    os.remove(v["file_path"])
-                            except Exception:
-                                pass
-                        db.delete_user_voices(user_id)
-                        db.update_user_fields(user_id, {"is_premium": 0, "credits": 0, "validity_expire_at": None})
-                        try:
-                            bot.send_message(user_id, "Your validity expired. All voices have been removed.")
-                        except Exception:
-                            pass
+                    bot.send_message(user_id, "Your validity expired. All voices have been removed.")
                 except Exception:
-                    continue
+                    pass
+        except Exception:
+            continue
+
+
+def send_expiry_reminders(db, bot, within_hours: int = EXPIRY_REMINDER_HOURS):
+    for u in db.list_users_expiring(within_hours):
+        try:
+            exp = datetime.fromisoformat(u["validity_expire_at"]).strftime("%d %b %Y %H:%M UTC")
+            bot.send_message(
+                u["id"],
+                f"⏳ Your validity ends on {exp}. Your voices will be removed after that — contact admin to renew.",
+            )
         except Exception:
             pass
-        time.sleep(interval_seconds)
+        # mark even when sending failed (blocked bot etc.) so we don't retry every run
+        db.mark_expiry_reminded(u["id"], u["validity_expire_at"])
+
+
+def collect_orphan_voices(db, voices_dir: str = VOICES_DIR):
+    """
+    Delete files under the per-user directories of `voices_dir` that no
+    voices row points at, then the emptied directories. Only numeric
+    (user id) directories are walked, so other tenants' trees are left alone.
+    """
+    if not os.path.isdir(voices_dir):
+        return
+    for entry in os.scandir(voices_dir):
+        if not (entry.is_dir() and entry.name.isdigit()):
+            continue
+        for root, dirs, files in os.walk(entry.path, topdown=False):
+            # one batched lookup per directory, never the whole voices table in memory
+            paths = {os.path.join(root, name): os.path.normpath(os.path.join(root, name)) for name in files}
+            known = {os.path.normpath(p) for p in db.known_voice_paths(set(paths) | set(paths.values()))}
+            for path, norm in paths.items():
+                if norm not in known:
+                    try:
+                        os.remove(path)
+                    except Exception:
+                        pass
+            try:
+                os.rmdir(root)  # only succeeds when empty
+            except OSError:
+                pass
+
+
+def voice_retention(store, stop_event: Optional[threading.Event] = None):
+    store.enforce_retention()
+    store.sweep_orphans(stop_event)
+
+
+def add_maintenance_jobs(sched: Scheduler, db, bot, suffix: str = "", voices_dir: str = VOICES_DIR, store=None):
+    """Per-database jobs; `suffix` keeps job names unique when several bots share one scheduler."""
+    sched.every(
+        f"expiry_cleanup{suffix}",
+        EXPIRY_CLEANUP_INTERVAL_SECONDS,
+        lambda: expire_users(db, bot, sched.stop_event, store),
+        jitter=60,
+        run_at_start=True,
+    )
+    sched.every(f"expiry_reminders{suffix}", 3600, lambda: send_expiry_reminders(db, bot), jitter=120)
+    sched.cron(f"voice_gc{suffix}", SCHEDULE_VOICE_GC, lambda: collect_orphan_voices(db, voices_dir), jitter=300)
+    sched.cron(f"sqlite_maintenance{suffix}", SCHEDULE_DB_MAINTENANCE, db.maintenance, jitter=300)
+    if store is not None:
+        sched.cron(
+            f"voice_retention{suffix}",
+            SCHEDULE_VOICE_RETENTION,
+            lambda: voice_retention(store, sched.stop_event),
+            jitter=300,
+        )
+
+
+def add_preview_job(sched: Scheduler, previews, catalog: Callable[[], List[str]], suffix: str = ""):
+    """Render model previews for new voice ids at startup and then periodically, retrying failed renders."""
+    sched.every(
+        f"voice_previews{suffix}",
+        PREVIEW_REFRESH_INTERVAL_SECONDS,
+        lambda: previews.refresh(catalog(), sched.stop_event),
+        jitter=30,
+        run_at_start=True,
+    )
+
+
+def build_scheduler(
+    db, bot, states=None, stop_event: Optional[threading.Event] = None, extra_metrics=None, store=None
+) -> Scheduler:
+    """All periodic maintenance in one place."""
+    sched = Scheduler(stop_event, leader=LeaderLease(states).held if states is not None else None)
+    add_maintenance_jobs(sched, db, bot, store=store)
+    if states is not None:
+        sched.every("state_purge", 300, states.purge_expired, jitter=30)
 
+    def flush_metrics():
+        record = {"jobs": sched.snapshot()}
+        if extra_metrics:
+            record.update(extra_metrics())
+        logging.info(f"metrics {record}")
 
-def start_expiry_cleanup_thread(db, bot, interval_seconds: int = 3600):
-    t = threading.Thread(target=_expiry_cleanup_worker, args=(db, bot, interval_seconds), daemon=True)
-    t.start()
\ No newline at end of file
+    sched.every("metrics_flush", METRICS_FLUSH_INTERVAL_SECONDS, flush_metrics, jitter=5)
+    return sched
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from telebot.types import BotCommand
+from config import ADMIN_IDS
+
+BOT_COMMANDS = [
+    ("start", "Start"),
+    ("admin", "Admin panel"),
+]
+
+ALLOWED_UPDATES = ["message", "callback_query", "inline_query"]
+
+
+def _commands_match(current) -> bool:
+    return [(c.command, c.description) for c in (current or [])] == BOT_COMMANDS
+
+
+def _webhook_matches(info, url: str, allowed_updates: List[str]) -> bool:
+    if not info or info.url != url:
+        return False
+    # Telegram omits allowed_updates when it is the default set
+    return sorted(info.allowed_updates or []) == sorted(allowed_updates)
+
+
+# -------------------------
+# SYNC (TeleBot)
+# -------------------------
+def ensure_commands(bot):
+    try:
+        if _commands_match(bot.get_my_commands()):
+            return False
+        bot.set_my_commands([BotCommand(c, d) for c, d in BOT_COMMANDS])
+        return True
+    except Exception:
+        return False
+
+
+def ensure_webhook(
+    bot, url: str, allowed_updates: List[str] = ALLOWED_UPDATES, secret_token: Optional[str] = None
+) -> bool:
+    """
+    set_webhook only when Telegram doesn't already point at `url`; returns True
+    if changed. getWebhookInfo doesn't report the secret, so with a
+    `secret_token` the webhook is always set: a missing or rotated secret
+    would otherwise get every update rejected.
+    """
+    if secret_token is None:
+        try:
+            if _webhook_matches(bot.get_webhook_info(), url, allowed_updates):
+                return False
+        except Exception:
+            pass
+
+    # retries to avoid 429; setWebhook replaces the old one, no removeWebhook needed
+    for attempt in range(2):
+        try:
+            bot.set_webhook(url=url, allowed_updates=allowed_updates, secret_token=secret_token)
+            return True
+        except Exception as e:
+            logging.warning(f"set_webhook failed (attempt {attempt+1}): {e}")
+            time.sleep(1 + attempt)
+    bot.set_webhook(url=url, allowed_updates=allowed_updates, secret_token=secret_token)
+    return True
+
+
+def reset_webhook(bot, url: str, secret_token: Optional[str], allowed_updates: List[str] = ALLOWED_UPDATES):
+    """Unconditional set_webhook, for when Telegram is known to be sending without our secret."""
+    try:
+        bot.set_webhook(url=url, allowed_updates=allowed_updates, secret_token=secret_token)
+        logging.warning(f"Webhook re-registered with secret token: {url}")
+    except Exception as e:
+        logging.error(f"Webhook re-registration failed: {e}")
+
+
+def ensure_no_webhook(bot):
+    try:
+        if bot.get_webhook_info().url:
+            bot.remove_webhook()
+    except Exception:
+        try:
+            bot.remove_webhook()
+        except Exception:
+            pass
+
+
+def notify_admin_online(bot, me=None, admin_ids: Optional[List[int]] = None):
+    msg = f"Bot @{me.username} is online." if me else "Bot is online."
+    admin_ids = ADMIN_IDS if admin_ids is None else admin_ids
+    for aid in admin_ids[:1]:
+        try:
+            bot.send_message(aid, msg)
+        except Exception:
+            pass
+
+
+def run_startup(
+    bot,
+    webhook_url: Optional[str] = None,
+    secret_token: Optional[str] = None,
+    admin_ids: Optional[List[int]] = None,
+):
+    """
+    Independent startup calls run concurrently: commands, webhook state and
+    get_me. The admin "online" ping goes out to the bot's own admins (the
+    tenant's, defaulting to ADMIN_IDS) once get_me has answered.
+    """
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="startup") as ex:
+        f_cmds = ex.submit(ensure_commands, bot)
+        f_hook = (
+            ex.submit(ensure_webhook, bot, webhook_url, ALLOWED_UPDATES, secret_token)
+            if webhook_url
+            else ex.submit(ensure_no_webhook, bot)
+        )
+        f_me = ex.submit(bot.get_me)
+
+        me = None
+        try:
+            me = f_me.result()
+        except Exception:
+            pass
+        try:
+            changed = f_hook.result()
+        except Exception as e:
+            changed = None
+            logging.error(f"Webhook setup failed: {e}")
+        f_cmds.result()
+
+    mode = f"webhook -> {webhook_url}" if webhook_url else "polling"
+    who = f"@{me.username}" if me else "bot"
+    extra = " (webhook updated)" if changed else ""
+    logging.info(f"Started {who} in {mode}{extra}; startup calls took {time.monotonic() - started:.2f}s")
+    notify_admin_online(bot, me, admin_ids)
+    return me
+
+
+# -------------------------
+# ASYNC (AsyncTeleBot)
+# -------------------------
+async def async_ensure_commands(bot):
+    try:
+        if _commands_match(await bot.get_my_commands()):
+            return False
+        await bot.set_my_commands([BotCommand(c, d) for c, d in BOT_COMMANDS])
+        return True
+    except Exception:
+        return False
+
+
+async def async_ensure_webhook(
+    bot, url: Optional[str], allowed_updates: List[str] = ALLOWED_UPDATES, secret_token: Optional[str] = None
+):
+    try:
+        info = await bot.get_webhook_info()
+    except Exception:
+        info = None
+    if not url:
+        if info is None or info.url:
+            try:
+                await bot.remove_webhook()
+            except Exception:
+                pass
+        return False
+    # the secret can't be read back, so with one the webhook is always set (see ensure_webhook)
+    if secret_token is None and _webhook_matches(info, url, allowed_updates):
+        return False
+    for attempt in range(3):
+        try:
+            await bot.set_webhook(url=url, allowed_updates=allowed_updates, secret_token=secret_token)
+            return True
+        except Exception as e:
+            logging.warning(f"set_webhook failed (attempt {attempt+1}): {e}")
+            await asyncio.sleep(1 + attempt)
+    return False
+
+
+async def async_run_startup(bot, webhook_url: Optional[str] = None, secret_token: Optional[str] = None):
+    started = time.monotonic()
+    _, changed, me = await asyncio.gather(
+        async_ensure_commands(bot),
+        async_ensure_webhook(bot, webhook_url, ALLOWED_UPDATES, secret_token),
+        bot.get_me(),
+        return_exceptions=True,
+    )
+    if isinstance(me, Exception):
+        me = None
+    mode = f"webhook -> {webhook_url}" if webhook_url else "polling"
+    who = f"@{me.username}" if me else "bot"
+    extra = " (webhook updated)" if changed is True else ""
+    logging.info(f"Started {who} (async) in {mode}{extra}; startup calls took {time.monotonic() - started:.2f}s")
+
+    msg = f"Bot @{me.username} is online." if me else "Bot is online."
+    for aid in (ADMIN_IDS[:1] if ADMIN_IDS else []):
+        try:
+            await bot.send_message(aid, msg)
+        except Exception:
+            pass
+    return me
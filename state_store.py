@@ -0,0 +1,210 @@
+import abc
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from config import STATE_BACKEND, STATE_DB_PATH, STATE_TTL_SECONDS
+
+
+class StateStore(abc.ABC):
+    """
+    Per-user conversational state (admin steps, pending inputs, ...).
+
+    Values are JSON-serialisable dicts keyed by (namespace, key) and expire
+    after `ttl` seconds so abandoned flows don't linger forever. Leases let
+    one of several processes sharing the store own a singleton task.
+    """
+
+    def __init__(self, default_ttl: int = STATE_TTL_SECONDS):
+        self.default_ttl = int(default_ttl)
+
+    def _expires_at(self, ttl: Optional[int]) -> float:
+        return time.time() + (self.default_ttl if ttl is None else int(ttl))
+
+    @abc.abstractmethod
+    def get(self, namespace: str, key: Any) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abc.abstractmethod
+    def set(self, namespace: str, key: Any, value: Dict[str, Any], ttl: Optional[int] = None):
+        ...
+
+    @abc.abstractmethod
+    def pop(self, namespace: str, key: Any) -> Optional[Dict[str, Any]]:
+        ...
+
+    def delete(self, namespace: str, key: Any):
+        self.pop(namespace, key)
+
+    def has(self, namespace: str, key: Any) -> bool:
+        return self.get(namespace, key) is not None
+
+    @abc.abstractmethod
+    def purge_expired(self) -> int:
+        ...
+
+    @abc.abstractmethod
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Take or renew lease `name` for `owner` for `ttl` seconds; False while someone else holds it."""
+
+
+class MemoryStateStore(StateStore):
+    """Single-process store. Fine for one worker / local polling."""
+
+    def __init__(self, default_ttl: int = STATE_TTL_SECONDS):
+        super().__init__(default_ttl)
+        self._data: Dict[Tuple[str, str], Tuple[float, Dict[str, Any]]] = {}
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        k = (namespace, str(key))
+        with self._lock:
+            item = self._data.get(k)
+            if not item:
+                return None
+            expires_at, value = item
+            if expires_at <= time.time():
+                self._data.pop(k, None)
+                return None
+            return dict(value)
+
+    def set(self, namespace, key, value, ttl=None):
+        with self._lock:
+            self._data[(namespace, str(key))] = (self._expires_at(ttl), dict(value))
+
+    def pop(self, namespace, key):
+        with self._lock:
+            item = self._data.pop((namespace, str(key)), None)
+        if not item or item[0] <= time.time():
+            return None
+        return item[1]
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            dead = [k for k, (exp, _) in self._data.items() if exp <= now]
+            for k in dead:
+                self._data.pop(k, None)
+        return len(dead)
+
+    def acquire_lease(self, name, owner, ttl):
+        now = time.time()
+        with self._lock:
+            holder, expires_at = self._leases.get(name, (owner, 0.0))
+            if holder != owner and expires_at > now:
+                return False
+            self._leases[name] = (owner, now + ttl)
+            return True
+
+
+class SQLiteStateStore(StateStore):
+    """
+    Shared store: every bot process pointing at the same file sees the same
+    state, so multi-step flows survive being load-balanced across workers.
+    """
+
+    def __init__(self, path: str = STATE_DB_PATH, default_ttl: int = STATE_TTL_SECONDS):
+        super().__init__(default_ttl)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    def _init_schema(self):
+        with self._lock:
+            cur = self.conn.cursor()
+            try:
+                cur.execute("PRAGMA journal_mode=WAL")
+            except Exception:
+                pass
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS conversation_state (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+                """
+            )
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS idx_conversation_state_expires ON conversation_state (expires_at)"
+            )
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+
+    def get(self, namespace, key):
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute(
+                "SELECT value FROM conversation_state WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, str(key), time.time()),
+            )
+            row = cur.fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace, key, value, ttl=None):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO conversation_state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, str(key), json.dumps(value, ensure_ascii=False), self._expires_at(ttl)),
+            )
+
+    def pop(self, namespace, key):
+        # BEGIN IMMEDIATE so two workers can't both consume the same step
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute(
+                    "SELECT value, expires_at FROM conversation_state WHERE namespace = ? AND key = ?",
+                    (namespace, str(key)),
+                )
+                row = cur.fetchone()
+                if row:
+                    cur.execute(
+                        "DELETE FROM conversation_state WHERE namespace = ? AND key = ?",
+                        (namespace, str(key)),
+                    )
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        if not row or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cur = self.conn.execute("DELETE FROM conversation_state WHERE expires_at <= ?", (time.time(),))
+            return cur.rowcount or 0
+
+    def acquire_lease(self, name, owner, ttl):
+        now = time.time()
+        # one statement: insert, renew our own lease, or take over an expired one
+        with self._lock:
+            cur = self.conn.execute(
+                """
+                INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE leases.owner = excluded.owner OR leases.expires_at <= ?
+                """,
+                (name, owner, now + ttl, now),
+            )
+            return cur.rowcount > 0
+
+
+def create_state_store(backend: Optional[str] = None) -> StateStore:
+    backend = (backend or STATE_BACKEND or "memory").strip().lower()
+    if backend == "sqlite":
+        return SQLiteStateStore()
+    return MemoryStateStore()
@@ -0,0 +1,91 @@
+import json
+import os
+import re
+from typing import Dict, List
+from config import (
+    TELEGRAM_BOT_TOKEN,
+    DB_PATH,
+    VOICES_DIR,
+    ADMIN_IDS,
+    DEFAULT_MODELS,
+    PLANS,
+    TENANTS_JSON,
+)
+
+
+class Tenant:
+    """
+    One hosted bot token with its own database, voices directory, admins,
+    model catalog and plans. Fish Audio client, audio cache and state store
+    are shared between tenants.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        token: str,
+        db_path: str,
+        voices_dir: str,
+        admin_ids: List[int],
+        models: List[Dict],
+        plans: List[Dict],
+        primary: bool = False,
+    ):
+        self.name = name
+        self.token = token
+        self.db_path = db_path
+        self.voices_dir = voices_dir
+        self.admin_ids = admin_ids
+        self.models = models
+        self.plans = plans
+        self.primary = primary
+
+    def scoped(self, key: str) -> str:
+        """Namespace for shared keys (job kinds, state-store namespaces); the primary tenant keeps the bare key."""
+        return key if self.primary else f"{key}:{self.name}"
+
+
+def _derived_db_path(name: str) -> str:
+    stem, ext = os.path.splitext(DB_PATH)
+    return f"{stem}_{name}{ext or '.db'}"
+
+
+def load_tenants() -> List[Tenant]:
+    tenants = [
+        Tenant(
+            name="main",
+            token=TELEGRAM_BOT_TOKEN,
+            db_path=DB_PATH,
+            voices_dir=VOICES_DIR,
+            admin_ids=list(ADMIN_IDS),
+            models=DEFAULT_MODELS,
+            plans=PLANS,
+            primary=True,
+        )
+    ]
+    if not TENANTS_JSON:
+        return tenants
+
+    raw = json.loads(TENANTS_JSON)
+    seen = {"main"}
+    for i, item in enumerate(raw if isinstance(raw, list) else []):
+        token = (item.get("token") or "").strip()
+        if not token:
+            continue
+        name = re.sub(r"[^A-Za-z0-9_-]", "", str(item.get("name") or f"t{i + 1}")) or f"t{i + 1}"
+        if name in seen:
+            raise ValueError(f"Duplicate tenant name: {name}")
+        seen.add(name)
+        tenants.append(
+            Tenant(
+                name=name,
+                token=token,
+                db_path=item.get("db_path") or _derived_db_path(name),
+                # non-numeric directory: the primary tenant's voice GC only walks user-id dirs
+                voices_dir=item.get("voices_dir") or os.path.join(VOICES_DIR, f"tenant_{name}"),
+                admin_ids=[int(x) for x in item.get("admin_ids") or ADMIN_IDS],
+                models=item.get("models") or DEFAULT_MODELS,
+                plans=item.get("plans") or PLANS,
+            )
+        )
+    return tenants
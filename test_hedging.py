@@ -0,0 +1,60 @@
+import threading
+import time
+import unittest
+from fish_audio import FishAudioClient
+from resilience import Deadline, Hedger
+
+
+class SingleKeyHedgingTest(unittest.TestCase):
+    def setUp(self):
+        self.client = FishAudioClient(api_keys=["only-key"])
+        self.client.hedger = Hedger(initial_delay=0.05, max_extra=1.0)
+        self.calls = []
+        self.lock = threading.Lock()
+
+        def rest_tts(key, backend, deadline, *args, on_first_byte=None, cancel=None):
+            with self.lock:
+                self.calls.append(key)
+                first = len(self.calls) == 1
+            if first:
+                # the primary stalls until the winner closes it
+                while not cancel.is_set():
+                    time.sleep(0.01)
+                raise RuntimeError("closed")
+            on_first_byte()
+            return b"backup"
+
+        self.client._rest_tts = rest_tts
+
+    def hedged(self):
+        key = self.client.pool.try_acquire()
+        try:
+            return self.client._hedged_rest(key, "s1", Deadline(5), "hi", "voice", None, None, "balanced")
+        finally:
+            self.client.pool.release(key)
+
+    def wait_idle(self):
+        for _ in range(100):
+            if self.client.pool.snapshot()[0]["in_flight"] == 0:
+                return
+            time.sleep(0.01)
+        self.fail("key still leased")
+
+    def test_single_key_pool_hedges_on_the_same_key(self):
+        self.assertEqual(self.hedged(), b"backup")
+        self.assertEqual(self.calls, ["only-key", "only-key"])
+        self.assertEqual(self.client.hedger.stats["hedged"], 1)
+        self.assertEqual(self.client.hedger.stats["no_key"], 0)
+        self.wait_idle()
+
+    def test_no_hedge_when_the_key_is_at_its_cap(self):
+        self.client.pool.max_concurrency = 1
+        self.client._rest_tts = lambda key, *a, on_first_byte=None, cancel=None: time.sleep(0.2) or b"primary"
+        self.assertEqual(self.hedged(), b"primary")
+        self.assertEqual(self.client.hedger.stats["hedged"], 0)
+        self.assertEqual(self.client.hedger.stats["no_key"], 1)
+        self.wait_idle()
+
+
+if __name__ == "__main__":
+    unittest.main()
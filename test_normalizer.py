@@ -0,0 +1,34 @@
+import unittest
+from normalizer import Normalizer
+
+PAUSES = {"sentence": "\n", "ellipsis": " ", "comma": " … ", "clause": " ", "paragraph": "\n"}
+
+# (input, expected) with the pauses above, host URLs and emoji dropped
+CASES = [
+    ("Pi is 3.14 and it is 10:30.", "Pi is 3.14 and it is 10:30."),
+    ("It costs 1,000, roughly.", "It costs 1,000, … roughly."),
+    ("See https://www.example.com/a?b=1.", "See example.com."),
+    ("Dr. Smith met Mr. Jones.", "Dr. Smith met Mr. Jones."),
+    ("Use e.g. this one.", "Use e.g. this one."),
+    ("Nice 😀 day", "Nice day"),
+    ("I said no. Then I left.", "I said no.\nThen I left."),
+    ("Buy pears etc. Then go home.", "Buy pears etc.\nThen go home."),
+    ("Apples, pears, etc. and more.", "Apples, … pears, … etc. and more."),
+    ("No. 5 is mine.", "No. 5 is mine."),
+    ("Hello world.How are you?", "Hello world.\nHow are you?"),
+    ("Wait!Stop.", "Wait!\nStop."),
+    ("Well... maybe", "Well… maybe"),
+    ("one\n\n\ntwo", "one\ntwo"),
+]
+
+
+class NormalizerTest(unittest.TestCase):
+    def test_cases(self):
+        n = Normalizer(pauses=PAUSES, url_mode="host", drop_emoji=True)
+        for text, expected in CASES:
+            with self.subTest(text=text):
+                self.assertEqual(n.normalize(text), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,8 @@
+import logging
 import os
-import re
-from datetime import datetime
+import sqlite3
+import time
+from typing import Optional
 import telebot
 from telebot import types
 from config import (
@@ -11,8 +13,21 @@ from config import (
     REQUIRE_VALIDITY_FOR_TTS,
     MAX_TTS_CHARS,
     DEFAULT_MODELS,  # ✅ NEW
+    INLINE_RESULTS_LIMIT,
+    PLANS,
 )
+from db import validity_active
+from encoding import allowed_profiles, get_profile, profile_for_user
 from fish_audio import FishAudioClient
+from messaging import chat_action, edit_or_send
+from normalizer import normalize
+from previews import VoicePreviews
+from voice_store import VoiceStore
+
+log = logging.getLogger("bot.tts")
+
+# reply-keyboard labels; never synthesized as text
+MENU_BUTTONS = ("Select Model", "Plans", "Usage", "Contact Admin", "Our Website", "Voice Speed", "Audio Quality")
 
 
 def build_user_keyboard() -> types.ReplyKeyboardMarkup:
@@ -20,14 +35,22 @@ def build_user_keyboard() -> types.ReplyKeyboardMarkup:
     kb.row(types.KeyboardButton("Select Model"), types.KeyboardButton("Plans"))
     kb.row(types.KeyboardButton("Usage"), types.KeyboardButton("Voice Speed"))
     kb.row(types.KeyboardButton("Contact Admin"), types.KeyboardButton("Our Website"))
+    kb.row(types.KeyboardButton("Audio Quality"))
     return kb
 
 
-def build_models_keyboard(models):
+def build_models_keyboard(models, previews: bool = False):
     kb = types.InlineKeyboardMarkup()
     row = []
     for m in models:
         label = m.get("name") or m.get("id")
+        if previews:
+            # one voice per row, with its sample clip next to it
+            kb.row(
+                types.InlineKeyboardButton(text=label, callback_data=f"model:{m.get('id')}"),
+                types.InlineKeyboardButton(text="🔊 Preview", callback_data=f"preview:{m.get('id')}"),
+            )
+            continue
         row.append(types.InlineKeyboardButton(text=label, callback_data=f"model:{m.get('id')}"))
         if len(row) == 2:
             kb.row(*row)
@@ -44,13 +67,14 @@ def get_model_name(models, voice_id: str) -> str:
     return voice_id or "Unknown"
 
 
-def humanize_text(s: str) -> str:
-    s = (s or "").strip()
-    s = re.sub(r"\s+", " ", s)
-    s = s.replace(", ", ", … ")
-    s = s.replace("!", "!\n").replace("?", "?\n").replace(".", ".\n")
-    s = re.sub(r"\n{3,}", "\n\n", s)
-    return s.strip()
+def build_inline_voice_results(voices):
+    results = []
+    for v in voices:
+        title = " ".join((v.get("text") or "Voice").split())
+        if len(title) > 64:
+            title = title[:63] + "…"
+        results.append(types.InlineQueryResultCachedVoice(id=str(v["id"]), voice_file_id=v["file_id"], title=title))
+    return results
 
 
 def build_speed_keyboard():
@@ -66,6 +90,15 @@ def build_speed_keyboard():
     return kb
 
 
+def build_quality_keyboard(profiles, current: str):
+    kb = types.InlineKeyboardMarkup()
+    for p in profiles:
+        mark = "✅ " if p.name == current else ""
+        label = f"{mark}{p.name.title()} ({p.format} {p.bitrate} kbps)" if p.bitrate else f"{mark}{p.name.title()}"
+        kb.add(types.InlineKeyboardButton(label, callback_data=f"quality:{p.name}"))
+    return kb
+
+
 def speed_to_value(mode: str) -> float:
     mode = (mode or "natural").lower()
     return {
@@ -81,8 +114,105 @@ def speed_to_label(mode: str) -> str:
     return {"fast": "Fast", "normal": "Normal", "natural": "Natural", "slow": "Slow"}.get(mode, "Natural")
 
 
-def register_user_handlers(bot: telebot.TeleBot, db):
-    client = FishAudioClient()
+# -----------------------
+# shared by the threaded and the asyncio runtime (async_user_panel.py)
+# -----------------------
+def format_plans(plans) -> str:
+    lines = ["Available plans:"]
+    for p in plans:
+        lines.append(f"• {p['name']}: {p['credits']} credits, {p['price']}, validity {p['validity_days']} days")
+    return "\n".join(lines)
+
+
+def format_usage(user: dict, models, default_models, plans) -> str:
+    selected_id = user.get("selected_model")
+    selected_name = get_model_name(models, selected_id) if selected_id else "Not selected"
+
+    # ✅ NEW: default voice id from admin panel (DB settings)
+    default_voice_id = user.get("default_voice_id") or default_models[0]["id"]
+    default_voice_name = get_model_name(models, default_voice_id)
+
+    mode = (user.get("tts_speed") or "natural").strip().lower()
+
+    return (
+        f"Status: {'Premium' if user.get('is_premium') else 'Normal'}\n"
+        f"Credits: {user.get('credits') or 0}\n"
+        f"Validity: {user.get('validity_expire_at') or 'No validity'}\n"
+        f"Selected model: {selected_name}\n"
+        f"Default voice: {default_voice_name}\n"
+        f"Speed: {speed_to_label(mode)}\n"
+        f"Audio quality: {profile_for_user(user, plans).name.title()}\n"
+        f"Voices saved: {user.get('voices_saved') or 0}\n"
+        f"Voices generated: {user.get('voices_generated') or 0}\n"
+        f"Characters synthesized: {user.get('chars_synthesized') or 0}\n"
+        f"Last activity: {user.get('last_activity_at') or 'Never'}"
+    )
+
+
+def tts_rejection(txt: str, user: dict) -> Optional[str]:
+    """The reply for a text that can't be voiced for this user, or None."""
+    if len(txt) > MAX_TTS_CHARS:
+        return f"Text too long. Limit: {MAX_TTS_CHARS} characters."
+    if (user.get("credits") or 0) <= 0:
+        return "❌ You have no credits."
+    if REQUIRE_VALIDITY_FOR_TTS and not validity_active(user):
+        return "❌ Your validity expired."
+    return None
+
+
+def build_tts_payload(message: types.Message, user: dict, txt: str, model: str, plans) -> dict:
+    """A TTS job as plain JSON-serialisable data, so it can be checkpointed and resumed."""
+    return {
+        "chat_id": message.chat.id,
+        "user_id": message.from_user.id,
+        "text": normalize(txt),
+        "source_text": txt,
+        "model": model,
+        "mode": (user.get("tts_speed") or "natural").strip().lower(),
+        "encoding": profile_for_user(user, plans).name,
+        "credits": user.get("credits") or 0,
+    }
+
+
+def tts_cache_key(p: dict, profile) -> tuple:
+    # everything that changes the audio
+    return (p["model"], p["text"], speed_to_value(p["mode"]), profile.key)
+
+
+def voice_caption(models, p: dict) -> str:
+    # status rides along as the caption: one Telegram call per voice
+    return (
+        f"🎙️ Voice generated! (Model: <b>{get_model_name(models, p['model'])}</b>, "
+        f"Speed: <b>{speed_to_label(p['mode'])}</b>)\n"
+        f"{COST_PER_VOICE} credit deducted. Remaining: {p['credits'] - COST_PER_VOICE}"
+    )
+
+
+def register_user_handlers(
+    bot: telebot.TeleBot,
+    db,
+    lifecycle=None,
+    client=None,
+    tenant=None,
+    cache=None,
+    store: VoiceStore = None,
+    previews: VoicePreviews = None,
+):
+    """
+    `client` and `cache` may be shared between several bots in one process;
+    `tenant` supplies per-bot models, plans and voices directory. Without
+    `previews` the model picker has no preview buttons.
+    """
+    client = client or FishAudioClient()
+    voices_dir = tenant.voices_dir if tenant else VOICES_DIR
+    store = store or VoiceStore(db, os.path.join(voices_dir, "objects"))
+    tts_kind = tenant.scoped("tts") if tenant else "tts"
+
+    default_models = tenant.models if tenant else DEFAULT_MODELS
+    plans = tenant.plans if tenant else PLANS
+
+    def list_models():
+        return tenant.models if tenant else client.list_models()
 
     @bot.message_handler(commands=["start"])
     def cmd_start(message: types.Message):
@@ -98,12 +228,8 @@ def register_user_handlers(bot: telebot.TeleBot, db):
         bot.send_message(message.chat.id, f"Website: {WEBSITE_URL}")
 
     @bot.message_handler(func=lambda m: m.text == "Plans")
-    def plans(message: types.Message):
-        from config import PLANS
-        lines = ["Available plans:"]
-        for p in PLANS:
-            lines.append(f"• {p['name']}: {p['credits']} credits, {p['price']}, validity {p['validity_days']} days")
-        bot.send_message(message.chat.id, "\n".join(lines))
+    def show_plans(message: types.Message):
+        bot.send_message(message.chat.id, format_plans(plans))
 
     @bot.message_handler(func=lambda m: m.text == "Voice Speed")
     def voice_speed_menu(message: types.Message):
@@ -112,112 +238,208 @@ def register_user_handlers(bot: telebot.TeleBot, db):
     @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("speed:"))
     def speed_chosen(callback: types.CallbackQuery):
         mode = callback.data.split(":", 1)[1].strip().lower()
-        db.update_user_fields(callback.from_user.id, {"tts_speed": mode})
-        bot.send_message(callback.message.chat.id, f"✅ Speed set to: <b>{speed_to_label(mode)}</b>")
         bot.answer_callback_query(callback.id)
+        db.update_user_fields(callback.from_user.id, {"tts_speed": mode})
+        edit_or_send(bot, callback.message, f"✅ Speed set to: <b>{speed_to_label(mode)}</b>")
 
-    @bot.message_handler(func=lambda m: m.text == "Usage")
-    def usage(message: types.Message):
-        user = db.get_user(message.from_user.id)
-        voices = db.list_user_voices(message.from_user.id)
-        models = client.list_models()
-
-        selected_id = user.get("selected_model")
-        selected_name = get_model_name(models, selected_id) if selected_id else "Not selected"
-
-        # ✅ NEW: default voice id from admin panel (DB settings)
-        default_voice_id = db.get_setting("default_voice_id", DEFAULT_MODELS[0]["id"])
-        default_voice_name = get_model_name(models, default_voice_id)
-
-        mode = (user.get("tts_speed") or "natural").strip().lower()
-
+    @bot.message_handler(func=lambda m: m.text == "Audio Quality")
+    def quality_menu(message: types.Message):
+        user = db.get_user(message.from_user.id) or {}
+        current = profile_for_user(user, plans).name
         bot.send_message(
             message.chat.id,
-            f"Status: {'Premium' if user.get('is_premium') else 'Normal'}\n"
-            f"Credits: {user.get('credits') or 0}\n"
-            f"Validity: {user.get('validity_expire_at') or 'No validity'}\n"
-            f"Selected model: {selected_name}\n"
-            f"Default voice: {default_voice_name}\n"
-            f"Speed: {speed_to_label(mode)}\n"
-            f"Voices saved: {len(voices)}",
+            "Choose audio quality (lower quality = smaller, faster voices):",
+            reply_markup=build_quality_keyboard(allowed_profiles(user, plans), current),
         )
 
+    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("quality:"))
+    def quality_chosen(callback: types.CallbackQuery):
+        name = callback.data.split(":", 1)[1].strip()
+        user = db.get_user(callback.from_user.id) or {}
+        if name not in {p.name for p in allowed_profiles(user, plans)}:
+            bot.answer_callback_query(callback.id, "Not available on your plan.")
+            return
+        bot.answer_callback_query(callback.id)
+        db.update_user_fields(callback.from_user.id, {"encoding_profile": name})
+        edit_or_send(bot, callback.message, f"✅ Audio quality set to: <b>{name.title()}</b>")
+
+    @bot.message_handler(func=lambda m: m.text == "Usage")
+    def usage(message: types.Message):
+        # one point read: user row + materialized usage counters + default voice
+        user = db.get_usage_summary(message.from_user.id)
+        bot.send_message(message.chat.id, format_usage(user, list_models(), default_models, plans))
+
     @bot.message_handler(func=lambda m: m.text == "Select Model")
     def select_model(message: types.Message):
-        models = client.list_models()
-        bot.send_message(message.chat.id, "Choose a model:", reply_markup=build_models_keyboard(models))
+        models = list_models()
+        bot.send_message(
+            message.chat.id, "Choose a model:", reply_markup=build_models_keyboard(models, previews is not None)
+        )
 
     @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("model:"))
     def model_chosen(callback: types.CallbackQuery):
         voice_id = callback.data.split(":", 1)[1]
+        bot.answer_callback_query(callback.id)
         db.update_user_fields(callback.from_user.id, {"selected_model": voice_id})
-        model_name = get_model_name(client.list_models(), voice_id)
-        bot.send_message(callback.message.chat.id, f"✅ Model selected: <b>{model_name}</b>\nNow send text to generate voice.")
+        model_name = get_model_name(list_models(), voice_id)
+        edit_or_send(bot, callback.message, f"✅ Model selected: <b>{model_name}</b>\nNow send text to generate voice.")
+
+    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("preview:"))
+    def preview_chosen(callback: types.CallbackQuery):
+        voice_id = callback.data.split(":", 1)[1]
+        models = list_models()
+        # only catalog voices: a forged callback must not buy arbitrary syntheses
+        if previews is None or voice_id not in {m.get("id") for m in models}:
+            bot.answer_callback_query(callback.id, "No preview available.")
+            return
         bot.answer_callback_query(callback.id)
+        try:
+            previews.send(bot, callback.message.chat.id, voice_id, caption=f"🔊 {get_model_name(models, voice_id)}")
+        except Exception as e:
+            log.warning("voice preview unavailable", extra={"voice_id": voice_id, "error": str(e)})
+            bot.send_message(callback.message.chat.id, "❌ Preview unavailable right now, please try again later.")
+
+    @bot.inline_handler(func=lambda q: True)
+    def inline_search(query: types.InlineQuery):
+        """`@bot <text>`: resend past voices by Telegram file_id — no synthesis, no upload."""
+        try:
+            voices = db.search_voices(query.from_user.id, query.query, limit=INLINE_RESULTS_LIMIT)
+            bot.answer_inline_query(query.id, build_inline_voice_results(voices), cache_time=5, is_personal=True)
+        except sqlite3.OperationalError:
+            log.exception("inline voice search failed", extra={"user_id": query.from_user.id})
+        except Exception as e:
+            # typically the inline query expired before we answered
+            log.warning("inline answer failed", extra={"user_id": query.from_user.id, "error": str(e)})
 
     @bot.message_handler(content_types=["text"])
     def tts_entry(message: types.Message):
         txt = (message.text or "").strip()
-
-        if txt in ("Select Model", "Plans", "Usage", "Contact Admin", "Our Website", "Voice Speed"):
+        if txt in MENU_BUTTONS:
             return
 
-        if len(txt) > MAX_TTS_CHARS:
-            bot.send_message(message.chat.id, f"Text too long. Limit: {MAX_TTS_CHARS} characters.")
-            return
-
-        user = db.get_user(message.from_user.id)
-        credits = user.get("credits") or 0
-
-        if credits <= 0:
-            bot.send_message(message.chat.id, "❌ You have no credits.")
-            return
-
-        if REQUIRE_VALIDITY_FOR_TTS and not db.is_valid(message.from_user.id):
-            bot.send_message(message.chat.id, "❌ Your validity expired.")
+        user = db.get_user(message.from_user.id) or {}
+        rejection = tts_rejection(txt, user)
+        if rejection:
+            bot.send_message(message.chat.id, rejection)
             return
 
         model = user.get("selected_model")
 
         # ✅ NEW: If user didn't select model, use admin-set default voice id
         if not model:
-            model = db.get_setting("default_voice_id", DEFAULT_MODELS[0]["id"])
+            model = db.get_setting("default_voice_id", default_models[0]["id"])
 
-        mode = (user.get("tts_speed") or "natural").strip().lower()
-        spd = speed_to_value(mode)
+        payload = build_tts_payload(message, user, txt, model, plans)
 
-        txt_natural = humanize_text(txt)
+        if lifecycle is None:
+            return run_tts_job(payload)
 
-        try:
-            audio_bytes = client.synthesize_text(
-                txt_natural,
-                model,
-                language="en",
-                format_="opus",
-                speed=spd,
-                latency="slow",
-            )
-        except Exception as e:
-            bot.send_message(message.chat.id, f"TTS error: {e}")
+        if not lifecycle.accepting():
+            bot.send_message(message.chat.id, "⏳ Bot is restarting, please send your text again in a moment.")
             return
 
-        user_dir = os.path.join(VOICES_DIR, str(message.from_user.id))
-        os.makedirs(user_dir, exist_ok=True)
-        ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        ogg_path = os.path.join(user_dir, f"tts_{ts}.ogg")
-
-        with open(ogg_path, "wb") as f:
-            f.write(audio_bytes)
-
-        with open(ogg_path, "rb") as vf:
-            bot.send_voice(message.chat.id, vf)
+        with lifecycle.job(tts_kind, **payload) as job:
+            run_tts_job(job.payload)
+
+    def run_tts_job(p: dict):
+        """
+        Charge → synthesize → archive → send → record. Each finished step is
+        written back into `p` (charged, ogg_path, sent, recorded), so a job
+        checkpointed during a redeploy resumes after its last finished step:
+        an already synthesized file isn't paid for again, and a voice that was
+        already sent is neither sent nor charged a second time. The credit is
+        reserved before synthesis and refunded when no voice goes out.
+        """
+        chat_id, user_id = p["chat_id"], p["user_id"]
+        profile = get_profile(p.get("encoding"))
+
+        if not p.get("charged"):
+            if not db.remove_credits(user_id, COST_PER_VOICE) and not p.get("sent"):
+                # spent by a concurrent voice since the credit check
+                bot.send_message(chat_id, "❌ You have no credits.")
+                return
+            p["charged"] = True
+
+        pinned = None  # store.put pins the blob until the voice is recorded or has failed
+        try:
+            if not p.get("sent"):
+                with chat_action(bot, chat_id, "record_voice"):
+                    ogg_path = p.get("ogg_path")
+                    if not (ogg_path and os.path.exists(ogg_path)):
+                        ogg_path = synthesize_to_file(p, profile)
+                        if ogg_path is None:
+                            refund(p)
+                            return
+                        pinned = p["blob_hash"]
+                    elif not p.get("blob_hash"):
+                        # checkpointed before voices were content-addressed
+                        with open(ogg_path, "rb") as f:
+                            pinned, ogg_path = store.put(f.read(), os.path.splitext(ogg_path)[1])
+                        p.update(blob_hash=pinned, ogg_path=ogg_path)
+
+                    started = time.monotonic()
+                    with open(ogg_path, "rb") as vf:
+                        sent = bot.send_voice(chat_id, vf, caption=voice_caption(list_models(), p))
+                p.update(sent=True, file_id=sent.voice.file_id if sent and sent.voice else None)
+                log.info("voice uploaded", extra={"user_id": user_id, "ms": round((time.monotonic() - started) * 1000, 1)})
+
+            if not p.get("recorded"):
+                store.record(
+                    user_id,
+                    p["ogg_path"],
+                    p["blob_hash"],
+                    chars=len(p["text"]),
+                    audio_bytes=p.get("audio_bytes") or 0,
+                    text=p.get("source_text") or p["text"],
+                    file_id=p.get("file_id"),
+                )
+                p["recorded"] = True
+        except Exception:
+            if not p.get("sent"):
+                refund(p)
+            raise
+        finally:
+            if pinned:
+                store.unpin(pinned)
+
+    def refund(p: dict):
+        """Give back the credit reserved for a job whose voice never went out."""
+        db.refund_credits(p["user_id"], COST_PER_VOICE)
+        p["charged"] = False
+
+    def synthesize_to_file(p: dict, profile) -> str:
+        """Synthesize (or take from cache) and archive in the voice store; None after reporting an error."""
+        chat_id, user_id, mode = p["chat_id"], p["user_id"], p["mode"]
+        started = time.monotonic()
+        cache_key = tts_cache_key(p, profile)
+        try:
+            audio_bytes = cache.get(cache_key) if cache else None
+            if audio_bytes is None:
+                audio_bytes = client.synthesize_text(
+                    p["text"],
+                    p["model"],
+                    language="en",
+                    speed=speed_to_value(mode),
+                    latency="slow",
+                    profile=profile,
+                )
+                db.record_tts(True, (time.monotonic() - started) * 1000)
+                if cache:
+                    cache.put(cache_key, audio_bytes)
+        except Exception as e:
+            db.record_tts(False)
+            log.warning("tts failed", exc_info=True, extra={"user_id": user_id, "model": p["model"]})
+            bot.send_message(chat_id, f"TTS error: {e}")
+            return None
+        log.info(
+            "tts done",
+            extra={"user_id": user_id, "chars": len(p["text"]), "bytes": len(audio_bytes),
+                   "encoding": profile.name, "ms": round((time.monotonic() - started) * 1000, 1)},
+        )
 
-        db.store_voice(message.from_user.id, ogg_path)
-        db.remove_credits(message.from_user.id, COST_PER_VOICE)
+        digest, ogg_path = store.put(audio_bytes, profile.extension)
+        p.update(ogg_path=ogg_path, blob_hash=digest, audio_bytes=len(audio_bytes))
+        return ogg_path
 
-        model_name = get_model_name(client.list_models(), model)
-        bot.send_message(
-            message.chat.id,
-            f"🎙️ Voice generated! (Model: <b>{model_name}</b>, Speed: <b>{speed_to_label(mode)}</b>)\n"
-            f"1 credit deducted. Remaining: {credits - 1}"
-        )
+    if lifecycle is not None:
+        lifecycle.register_resumer(tts_kind, lambda job: run_tts_job(job.payload))
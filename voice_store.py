@@ -0,0 +1,211 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from config import VOICE_USER_QUOTA_MB, VOICE_GLOBAL_QUOTA_MB, VOICE_MAX_AGE_DAYS
+
+log = logging.getLogger("voice_store")
+
+MB = 1024 * 1024
+# files without a blob row younger than this may belong to a voice still being sent
+ORPHAN_GRACE_SECONDS = 3600
+
+
+class VoiceStore:
+    """
+    Voice files named by the SHA-256 of their audio under
+    `root/<h[0:2]>/<h[2:4]>/<h>.<ext>`, so identical audio is stored once
+    across users and no directory grows past a few dozen entries.
+
+    The `voice_blobs` table lists what is on disk; `voices.blob_hash` points
+    at it. Files are written before their row and deleted after it, so a
+    crash can only leave an unreferenced file, which `sweep_orphans` removes.
+
+    `put` pins the blob so eviction leaves it alone while the voice is being
+    sent; the caller calls `unpin` once the voice is recorded or has failed.
+    """
+
+    def __init__(
+        self,
+        db,
+        root: str,
+        user_quota_bytes: int = int(VOICE_USER_QUOTA_MB * MB),
+        global_quota_bytes: int = int(VOICE_GLOBAL_QUOTA_MB * MB),
+        max_age_days: int = VOICE_MAX_AGE_DAYS,
+    ):
+        self.db = db
+        self.root = root
+        self.user_quota_bytes = user_quota_bytes
+        self.global_quota_bytes = global_quota_bytes
+        self.max_age_days = max_age_days
+        # hashes written but not yet recorded; never deleted from under a voice being sent
+        self._pinned = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, digest: str, extension: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest + extension)
+
+    # -----------------------
+    # write path
+    # -----------------------
+    def put(self, audio: bytes, extension: str) -> Tuple[str, str]:
+        """Store `audio` (no-op if identical bytes are already on disk) and pin it; returns (hash, path)."""
+        digest = hashlib.sha256(audio).hexdigest()
+        path = self.path_for(digest, extension)
+        # pin and look under the lock `_remove` deletes under: the file seen here stays
+        with self._lock:
+            self._pinned[digest] = self._pinned.get(digest, 0) + 1
+            exists = os.path.exists(path)
+        if not exists:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(audio)
+            os.replace(tmp, path)  # atomic: readers never see a partial file
+        return digest, path
+
+    def record(self, user_id: int, path: str, digest: str, **voice_fields):
+        """db.store_voice for a stored blob, then the user's quota."""
+        self.db.store_voice(user_id, path, blob_hash=digest, **voice_fields)
+        self.enforce_user_quota(user_id)
+
+    def pin(self, digest: str):
+        with self._lock:
+            self._pinned[digest] = self._pinned.get(digest, 0) + 1
+
+    def unpin(self, digest: str):
+        with self._lock:
+            n = self._pinned.get(digest, 0) - 1
+            if n > 0:
+                self._pinned[digest] = n
+            else:
+                self._pinned.pop(digest, None)
+
+    # -----------------------
+    # eviction
+    # -----------------------
+    def release(self, hashes: Iterable[str]) -> int:
+        """Delete the files of blobs among `hashes` that no voice references any more."""
+        with self._lock:
+            candidates = [h for h in set(hashes) if h not in self._pinned]
+        freed = 0
+        for path in self.db.drop_unreferenced_blobs(candidates) if candidates else []:
+            freed += self._remove(path) or 0
+        return freed
+
+    def _remove(self, path: str) -> Optional[int]:
+        """Delete a blob file unless a put() has pinned it since it was chosen; the bytes freed, or None."""
+        digest = os.path.basename(path).split(".", 1)[0]
+        with self._lock:
+            if digest in self._pinned:
+                return None
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                return None
+        return size
+
+    def enforce_user_quota(self, user_id: int):
+        if self.user_quota_bytes <= 0:
+            return
+        used = self.db.user_stored_bytes(user_id)
+        while used > self.user_quota_bytes:
+            oldest = self.db.oldest_stored_voices(user_id, limit=50)
+            if not oldest:
+                return
+            victims: List[int] = []
+            hashes: List[str] = []
+            for voice_id, digest, size in oldest:
+                if used <= self.user_quota_bytes:
+                    break
+                victims.append(voice_id)
+                hashes.append(digest)
+                used -= size or 0
+            self.db.detach_voices(victims)
+            self.release(hashes)
+            log.info("user voice quota", extra={"user_id": user_id, "evicted": len(victims)})
+
+    def enforce_retention(self) -> dict:
+        """Scheduled: drop on-disk copies older than max_age_days, then LRU blobs over the global quota."""
+        evicted_old = evicted_lru = 0
+        if self.max_age_days > 0:
+            cutoff = (datetime.utcnow() - timedelta(days=self.max_age_days)).isoformat()
+            while True:
+                old = self.db.stored_voices_before(cutoff, limit=1000)
+                if not old:
+                    break
+                self.db.detach_voices([v[0] for v in old])
+                self.release(v[1] for v in old)
+                evicted_old += len(old)
+
+        if self.global_quota_bytes > 0:
+            total = self.db.total_blob_bytes()
+            # trim to 90% so the next few voices don't trigger another pass
+            target = int(self.global_quota_bytes * 0.9)
+            while total > self.global_quota_bytes or (evicted_lru and total > target):
+                batch = self.db.lru_blobs(limit=200)
+                with self._lock:
+                    batch = [b for b in batch if b[0] not in self._pinned]
+                if not batch:
+                    break
+                chosen = []
+                for digest, size in batch:
+                    if total <= target:
+                        break
+                    chosen.append(digest)
+                    total -= size or 0
+                self.db.detach_blobs(chosen)
+                self.release(chosen)
+                evicted_lru += len(chosen)
+        result = {"evicted_old": evicted_old, "evicted_lru": evicted_lru}
+        log.info("voice retention", extra=result)
+        return result
+
+    def purge_user(self, user_id: int):
+        """Validity expired: forget all of the user's voices; shared audio stays for other users."""
+        self.release(self.db.delete_user_voices(user_id))
+
+    # -----------------------
+    # consistency
+    # -----------------------
+    def sweep_orphans(self, stop_event: Optional[threading.Event] = None) -> int:
+        """
+        Remove files (and leftover .tmp files) that have no voice_blobs row.
+        Works one top-level shard at a time, so memory stays flat at millions of files.
+        """
+        if not os.path.isdir(self.root):
+            return 0
+        removed = 0
+        cutoff = time.time() - ORPHAN_GRACE_SECONDS
+        for top in sorted(os.listdir(self.root)):
+            if stop_event is not None and stop_event.is_set():
+                break
+            top_dir = os.path.join(self.root, top)
+            if len(top) != 2 or not os.path.isdir(top_dir):
+                continue
+            known = self.db.blob_hashes_between(top, top[:-1] + chr(ord(top[-1]) + 1))
+            with self._lock:
+                known |= set(self._pinned)
+            for sub in os.scandir(top_dir):
+                if not sub.is_dir():
+                    continue
+                for entry in os.scandir(sub.path):
+                    digest = entry.name.split(".", 1)[0]
+                    if digest in known:
+                        continue
+                    try:
+                        if entry.stat().st_mtime < cutoff and self._remove(entry.path) is not None:
+                            removed += 1
+                    except OSError:
+                        pass
+                try:
+                    os.rmdir(sub.path)  # only succeeds when empty
+                except OSError:
+                    pass
+        if removed:
+            log.info("voice store orphans removed", extra={"files": removed})
+        return removed
@@ -0,0 +1,148 @@
+import hashlib
+import hmac
+import ipaddress
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+from config import WEBHOOK_HEAL_AFTER_MISSES, WEBHOOK_HEAL_INTERVAL_SECONDS, WEBHOOK_SECRET
+from startup import ALLOWED_UPDATES
+
+try:  # optional: several times faster than json and parses bytes directly
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Telegram updates are a few KB; anything far bigger is not from Telegram
+MAX_BODY_BYTES = 1024 * 1024
+DEDUP_WINDOW = 4096
+# where Telegram delivers webhooks from (core.telegram.org/bots/webhooks)
+TELEGRAM_NETWORKS = tuple(ipaddress.ip_network(n) for n in ("149.154.160.0/20", "91.108.4.0/22"))
+
+
+def from_telegram(addr: Optional[str]) -> bool:
+    try:
+        ip = ipaddress.ip_address(addr or "")
+    except ValueError:
+        return False
+    return any(ip in net for net in TELEGRAM_NETWORKS)
+
+
+def client_addr(forwarded_for: Optional[str], peer: Optional[str]) -> Optional[str]:
+    """
+    The address our proxy saw: the last X-Forwarded-For hop, which the proxy
+    appends itself. Earlier hops are whatever the client sent.
+    """
+    hops = [h.strip() for h in (forwarded_for or "").split(",") if h.strip()]
+    return hops[-1] if hops else peer
+
+
+def webhook_secret(token: str) -> str:
+    """WEBHOOK_SECRET, or a stable per-bot value derived from the token (Telegram allows [A-Za-z0-9_-], 1-256 chars)."""
+    if WEBHOOK_SECRET:
+        return WEBHOOK_SECRET
+    return hashlib.sha256(f"webhook:{token}".encode()).hexdigest()
+
+
+def _has_update_id(body: bytes) -> bool:
+    try:
+        return isinstance(_loads(body).get("update_id"), int)
+    except Exception:
+        return False
+
+
+class WebhookGuard:
+    """
+    Cheap checks run on a webhook POST before telebot sees it: secret header,
+    body size, update type and duplicate update_id. Only updates that pass
+    are turned into telebot objects.
+    """
+
+    def __init__(
+        self,
+        secret: str,
+        allowed_updates=ALLOWED_UPDATES,
+        window: int = DEDUP_WINDOW,
+        on_missing_secret: Optional[Callable[[], None]] = None,
+        heal_interval: float = WEBHOOK_HEAL_INTERVAL_SECONDS,
+        heal_after_misses: int = WEBHOOK_HEAL_AFTER_MISSES,
+    ):
+        self._secret = secret.encode()
+        self._allowed = frozenset(allowed_updates)
+        self._window = window
+        self._seen: "OrderedDict[int, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._on_missing_secret = on_missing_secret
+        self._heal_interval = heal_interval
+        self._heal_after_misses = heal_after_misses
+        self._misses = 0
+        self._healed_at: Optional[float] = None
+        self.stats: Dict[str, int] = {
+            "accepted": 0, "unauthorized": 0, "too_large": 0, "malformed": 0, "ignored_type": 0, "duplicate": 0,
+            "healed": 0,
+        }
+
+    def authorized(self, header: Optional[str]) -> bool:
+        if header is None or not hmac.compare_digest(header.encode(), self._secret):
+            self.stats["unauthorized"] += 1
+            return False
+        self._misses = 0
+        return True
+
+    def missing_secret(self, remote_addr: Optional[str], body: bytes = b""):
+        """
+        A POST came without the secret header, possibly a webhook registered
+        before the secret existed. Re-register it so Telegram's retries carry
+        the header, but only for a plausible update (an update_id from a
+        Telegram address) or after several header-less POSTs in a row, and at
+        most once per heal interval.
+        """
+        if self._on_missing_secret is None:
+            return
+        with self._lock:
+            self._misses += 1
+            if not (self._misses >= self._heal_after_misses or (from_telegram(remote_addr) and _has_update_id(body))):
+                return
+            now = time.monotonic()
+            if self._healed_at is not None and now - self._healed_at < self._heal_interval:
+                return
+            self._healed_at = now
+            self._misses = 0
+        self.stats["healed"] += 1
+        threading.Thread(target=self._on_missing_secret, name="webhook-heal", daemon=True).start()
+
+    def size_ok(self, content_length: Optional[int]) -> bool:
+        if content_length is None or content_length > MAX_BODY_BYTES:
+            self.stats["too_large"] += 1
+            return False
+        return True
+
+    def accept(self, body: bytes) -> Optional[dict]:
+        """The parsed update if it should be processed, else None (ack and drop)."""
+        try:
+            data = _loads(body)
+            update_id = data["update_id"]
+        except Exception:
+            self.stats["malformed"] += 1
+            return None
+        if not any(k in self._allowed for k in data):
+            self.stats["ignored_type"] += 1
+            return None
+        with self._lock:
+            if update_id in self._seen:
+                self.stats["duplicate"] += 1
+                return None
+            self._seen[update_id] = None
+            if len(self._seen) > self._window:
+                self._seen.popitem(last=False)
+        self.stats["accepted"] += 1
+        return data
+
+    def forget(self, update_id: int):
+        """Processing failed: let Telegram's redelivery through."""
+        with self._lock:
+            self._seen.pop(update_id, None)